@@ -0,0 +1,143 @@
+import os
+import gzip
+import time
+import hashlib
+import mimetypes
+from typing import Dict, Optional
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # brotli опционален: без него отдаём gzip
+    brotli = None
+
+# меньше этого сжатие не окупается
+COMPRESS_MIN = 256
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".json": "application/json",
+    ".svg": "image/svg+xml",
+}
+
+
+class Asset:
+    __slots__ = ("body", "gz", "br", "etag", "version", "ctype")
+
+    def __init__(self, body: bytes, ctype: str):
+        self.body = body
+        self.ctype = ctype
+        digest = hashlib.sha256(body).hexdigest()
+        self.version = digest[:12]
+        self.etag = f'"{digest[:24]}"'
+        self.gz: Optional[bytes] = None
+        self.br: Optional[bytes] = None
+        if len(body) >= COMPRESS_MIN:
+            gz = gzip.compress(body, 9, mtime=0)
+            self.gz = gz if len(gz) < len(body) else None
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                self.br = br if len(br) < len(body) else None
+
+    def variant(self, accept_encoding: str):
+        # (тело, Content-Encoding, ETag): у каждого представления свой сильный ETag
+        ae = accept_encoding.lower()
+        if self.br is not None and "br" in ae:
+            return self.br, "br", self.etag[:-1] + '-br"'
+        if self.gz is not None and "gzip" in ae:
+            return self.gz, "gzip", self.etag[:-1] + '-gz"'
+        return self.body, None, self.etag
+
+
+# Все файлы static/ живут в памяти: тело, gzip/brotli, ETag. index.html —
+# шаблон: ключ карт подставляется один раз, ссылки на /static/<имя> получают
+# ?v=<хеш>, и такие URL отдаются с immutable-кешем на год.
+class AssetCache:
+    def __init__(self, static_dir: str, replacements: Dict[str, str], reload: bool = False):
+        self.static_dir = static_dir
+        self.replacements = replacements
+        self.reload = reload
+        self.assets: Dict[str, Asset] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._checked = 0.0
+
+        self.hits = 0
+        self.not_modified = 0
+        self.reloads = 0
+
+    def _scan(self) -> Dict[str, float]:
+        out = {}
+        for name in os.listdir(self.static_dir):
+            path = os.path.join(self.static_dir, name)
+            if os.path.isfile(path):
+                out[name] = os.stat(path).st_mtime
+        return out
+
+    def load(self):
+        mtimes = self._scan()
+        raw = {}
+        for name in mtimes:
+            with open(os.path.join(self.static_dir, name), "rb") as f:
+                raw[name] = f.read()
+        assets = {}
+        for name, body in raw.items():
+            if name == "index.html":
+                continue
+            ctype = CONTENT_TYPES.get(os.path.splitext(name)[1]) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+            assets[name] = Asset(body, ctype)
+        if "index.html" in raw:
+            html = raw["index.html"].decode("utf-8")
+            for k, v in self.replacements.items():
+                html = html.replace(k, v)
+            for name, a in assets.items():
+                html = html.replace(f'"/static/{name}"', f'"/static/{name}?v={a.version}"')
+            assets["index.html"] = Asset(html.encode("utf-8"), CONTENT_TYPES[".html"])
+        self.assets = assets
+        self._mtimes = mtimes
+
+    def maybe_reload(self):
+        # ASSET_RELOAD: при разработке — не чаще раза в секунду проверяем mtime
+        now = time.monotonic()
+        if now - self._checked < 1.0:
+            return
+        self._checked = now
+        if self._scan() != self._mtimes:
+            self.load()
+            self.reloads += 1
+
+    def respond(self, req: web.Request, name: str) -> web.Response:
+        if self.reload:
+            self.maybe_reload()
+        a = self.assets.get(name)
+        if a is None:
+            return web.Response(status=404, text="Not found")
+        body, encoding, etag = a.variant(req.headers.get("Accept-Encoding", ""))
+        versioned = name != "index.html" and req.query.get("v") == a.version
+        headers = {
+            "ETag": etag,
+            "Cache-Control": IMMUTABLE if versioned else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        inm = req.headers.get("If-None-Match")
+        if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        self.hits += 1
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        headers["Content-Type"] = a.ctype
+        return web.Response(body=body, headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.assets),
+            "bytes": sum(len(a.body) for a in self.assets.values()),
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "reloads": self.reloads,
+        }
@@ -0,0 +1,46 @@
+"""Общее для бенчмарков: отдельный DATA_DIR до import server, сокет-заглушка, перцентиль."""
+import os
+import sys
+import asyncio
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def isolate(prefix: str = "bench", **env: str):
+    # звать до import server: signing_secret, rooms.log, пул точек и история
+    # пишутся во временный каталог, а не в ./data репозитория
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix=prefix))
+    for k, v in env.items():
+        os.environ.setdefault(k, v)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * q))] if xs else float("nan")
+
+
+class FakeWS:
+    # считает кадры и байты (на сокет и всего); delay — «медленный» клиент:
+    # как у aiohttp, send ждёт, пока буфер транспорта не освободится
+    closed = False
+    total_frames = 0
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_str(self, data):
+        self.frames += 1
+        self.bytes += len(data)
+        FakeWS.total_frames += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+    send_bytes = send_str
+
+    async def close(self):
+        self.closed = True
@@ -0,0 +1,82 @@
+"""Всплеск guess в конце раунда: кадров и CPU в зависимости от окна склейки (STATE_COALESCE_MS).
+
+    python bench/bench_burst.py --players 30 300 --window 1.0 --coalesce 0 50 100
+
+Все игроки комнаты отвечают за --window секунд. frames — сколько кадров ушло
+в сокеты (все клиенты), cpu — процессорное время сервера на весь всплеск.
+proto=1 получают полный state на каждое изменение, proto=2 — патчи.
+"""
+import time
+import random
+import asyncio
+import argparse
+
+from _common import FakeWS, isolate
+
+isolate("bench_burst")
+
+import server  # noqa: E402
+
+
+async def run(players: int, proto: int, window: float, coalesce_ms: int) -> dict:
+    server.STATE_COALESCE_MS = coalesce_ms
+    server.ROOMS = server.RoomRegistry()
+    rnd = random.Random(1)
+    room = await server.ROOMS.create(lambda code: server.Room(code=code, host_user_id="u0", round_seconds=600))
+    sockets = []
+    for j in range(players):
+        uid = f"u{j}"
+        room.add_player(uid, f"P{j}")
+        ws = FakeWS()
+        sockets.append(ws)
+        room.ws[uid] = server.Conn(ws, 10 * players, proto)
+    async with room.lock:
+        await server.start_round(room)
+    await asyncio.sleep(0.05)
+    base_frames = sum(ws.frames for ws in sockets)
+
+    async def guesser(uid):
+        await asyncio.sleep(rnd.random() * window)
+        async with room.lock:
+            await server.handle_message(room, uid, room.ws[uid], {"t": "guess", "lat": rnd.uniform(-60, 60),
+                                                                  "lng": rnd.uniform(-170, 170)})
+
+    cpu0 = time.process_time()
+    await asyncio.gather(*(guesser(f"u{j}") for j in range(players)))
+    # дождаться последнего окна и опустошения очередей
+    await asyncio.sleep(coalesce_ms / 1000 + 0.05)
+    cpu = time.process_time() - cpu0
+
+    server.SCHEDULER.cancel((room.code, "phase"))
+    server.SCHEDULER.cancel("timer_sync")
+    server.TICKING.clear()
+    for c in room.ws.values():
+        c.close()
+    await asyncio.sleep(0)
+    return {
+        "frames": sum(ws.frames for ws in sockets) - base_frames,
+        "kbytes": sum(ws.bytes for ws in sockets) / 1024,
+        "cpu_ms": cpu * 1000,
+        "versions": room.version,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--players", type=int, nargs="+", default=[30, 300])
+    ap.add_argument("--proto", type=int, nargs="+", default=[1, 2])
+    ap.add_argument("--window", type=float, default=1.0, help="секунды, за которые отвечают все игроки")
+    ap.add_argument("--coalesce", type=int, nargs="+", default=[0, 50, 100], help="окно склейки, мс")
+    args = ap.parse_args()
+
+    print(f"all players guess within {args.window}s")
+    for n in args.players:
+        for proto in args.proto:
+            for ms in args.coalesce:
+                r = asyncio.run(run(n, proto, args.window, ms))
+                print(f"players={n:>4} proto={proto} coalesce={ms:>3}ms  frames={r['frames']:>7}  "
+                      f"KB={r['kbytes']:>9.1f}  cpu={r['cpu_ms']:>8.1f} ms  patches={r['versions']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""p99 задержки обработки guess при 10..1000 одновременных комнат.
+
+lock_wait — время ожидания лока комнаты (то, что убирает шардирование),
+p50/p99 — полное время guess -> разосланный state, включая загрузку цикла.
+
+    python bench/bench_contention.py
+    python bench/bench_contention.py --rooms 10 100 1000 --players 8 --global-lock
+"""
+import time
+import random
+import asyncio
+import argparse
+
+from _common import FakeWS, isolate, pct
+
+isolate("bench_contention")
+
+import server  # noqa: E402
+
+
+async def run(n_rooms: int, players: int, window: float, global_lock: bool,
+              slow_frac: float, slow_ms: float) -> dict:
+    rnd = random.Random(1)
+    server.ROOMS = server.RoomRegistry()
+    shared = asyncio.Lock()
+    rooms = []
+    for i in range(n_rooms):
+        def make_room(code, i=i):
+            room = server.Room(code=code, host_user_id="u0", round_seconds=600)
+            for j in range(players):
+                uid = f"u{j}"
+                room.add_player(uid, f"P{i}.{j}")
+                room.ws[uid] = server.Conn(FakeWS(slow_ms / 1000 if rnd.random() < slow_frac else 0.0))
+            if global_lock:
+                room.lock = shared
+            return room
+        room = await server.ROOMS.create(make_room)
+        async with room.lock:
+            await server.start_round(room)
+        rooms.append(room)
+
+    latencies = []
+    waits = []
+
+    async def guesser(room, uid):
+        await asyncio.sleep(random.random() * window)
+        t0 = time.perf_counter()
+        r = server.ROOMS.get(room.code)
+        async with r.lock:
+            waits.append((time.perf_counter() - t0) * 1000)
+            await server.handle_message(r, uid, r.ws[uid], {"t": "guess", "lat": 10.0, "lng": 20.0})
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    await asyncio.gather(*(guesser(r, f"u{j}") for r in rooms for j in range(players)))
+
+    for r in rooms:
+        server.SCHEDULER.cancel((r.code, "phase"))
+    server.SCHEDULER.cancel("timer_sync")
+    server.TICKING.clear()
+    await asyncio.sleep(0)
+
+    return {
+        "rooms": n_rooms,
+        "guesses": len(latencies),
+        "p50_ms": pct(latencies, 0.50),
+        "p99_ms": pct(latencies, 0.99),
+        "max_ms": max(latencies),
+        "wait_p99_ms": pct(waits, 0.99),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rooms", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--players", type=int, default=8)
+    ap.add_argument("--window", type=float, default=2.0, help="секунды, за которые приходят все guess")
+    ap.add_argument("--slow-frac", type=float, default=0.05, help="доля медленных клиентов")
+    ap.add_argument("--slow-ms", type=float, default=20.0, help="задержка send у медленного клиента")
+    ap.add_argument("--global-lock", action="store_true", help="один лок на все комнаты (старое поведение)")
+    args = ap.parse_args()
+
+    mode = "global LOCK" if args.global_lock else "per-room lock"
+    print(f"mode={mode} players/room={args.players} window={args.window}s "
+          f"slow={args.slow_frac:.0%}x{args.slow_ms:.0f}ms")
+    for n in args.rooms:
+        r = asyncio.run(run(n, args.players, args.window, args.global_lock, args.slow_frac, args.slow_ms))
+        print(f"rooms={r['rooms']:>5}  guesses={r['guesses']:>6}  "
+              f"p50={r['p50_ms']:.3f}ms  p99={r['p99_ms']:.3f}ms  max={r['max_ms']:.3f}ms  "
+              f"lock_wait_p99={r['wait_p99_ms']:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Задержка цикла событий, пока большая комната считает раунд и пока журнал ужимается.
+
+    python bench/bench_cpu_pool.py --players 5000 --rounds 5 --pool off thread process
+    python bench/bench_cpu_pool.py --no-numpy
+
+Комната mode=large на --players игроков (по умолчанию LARGE_ROOM_MAX_PLAYERS),
+все ответили; меряется finish_round (подсчёт, рассылка, me-кадры) и
+компакция журнала (снапшот этой комнаты и --rooms обычных). Рядом крутится
+проба: сон 1 мс против фактического — столько ждали бы сообщения остальных
+комнат. --no-numpy — подсчёт чистым Python, как на сервере без numpy.
+В finish_round пул забирает только подсчёт; основное время там — рассылка
+кадров и me-кадров каждому сокету, она на цикле при любом --pool.
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from _common import FakeWS, isolate, pct
+
+isolate("bench_cpu", ROOM_LOG="0", HISTORY="0")
+
+import server  # noqa: E402
+import scoring  # noqa: E402
+from cpupool import CpuPool  # noqa: E402
+from eventlog import EventLog  # noqa: E402
+
+PROBE_S = 0.001
+
+
+class Probe:
+    def __init__(self):
+        self.lags = []
+        self.on = False
+
+    async def run(self):
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(PROBE_S)
+            if self.on:
+                self.lags.append(time.perf_counter() - t - PROBE_S)
+
+    async def measure(self, coro) -> float:
+        self.on = True
+        t0 = time.perf_counter()
+        await coro
+        # дождаться, пока проба проснётся после последнего куска работы
+        await asyncio.sleep(PROBE_S * 2)
+        self.on = False
+        return time.perf_counter() - t0
+
+
+async def locked_compact():
+    # как в flush_log: под LOG_LOCK, иначе сброс журнала пишет в файл, который компакция подменяет
+    async with server.LOG_LOCK:
+        await server.compact_log()
+
+
+async def run(mode: str, args) -> dict:
+    server.CPU = CpuPool(mode, args.workers, args.min_items)
+    server.CPU.start()
+    server.ROOMS = server.RoomRegistry()
+    server.LOG_LOCK = asyncio.Lock()  # каждый --pool — в своём asyncio.run
+    rnd = random.Random(1)
+    big = await server.ROOMS.create(lambda code: server.Room(code=code, host_user_id="u0", large=True,
+                                                             max_players=args.players))
+    for j in range(args.players):
+        big.add_player(f"u{j}", f"P{j}")
+        big.ws[f"u{j}"] = server.Conn(FakeWS(), 64, server.PROTO_DELTA)
+    for i in range(args.rooms):
+        room = await server.ROOMS.create(lambda code: server.Room(code=code, host_user_id="h"))
+        for j in range(8):
+            room.add_player(f"h{j}", f"H{j}")
+    server.LOG = EventLog(os.path.join(tempfile.mkdtemp(prefix="bench_cpu"), "rooms.log"))
+    server.LOG.open()
+    # процессам пула — прогреться до замеров (запуск forkserver и импорт scoring)
+    await server.CPU.run(1 << 30, scoring.score_round, 0.0, 0.0, [1.0], [1.0], 1)
+
+    probe = Probe()
+    task = asyncio.ensure_future(probe.run())
+    finish, compact = [], []
+    finish_lags, compact_lags = [], []
+    for _ in range(args.rounds):
+        async with big.lock:
+            await server.start_round(big)
+            for p in big.roster:
+                p.guess = (rnd.uniform(-60, 70), rnd.uniform(-170, 170))
+                p.has_guessed = True
+                big.guesses.add(p.idx, *p.guess)
+            await asyncio.sleep(0.02)  # очереди сокетов опустели
+            probe.lags.clear()
+            finish.append(await probe.measure(server.finish_round(big)))
+            finish_lags.extend(probe.lags)
+            big.current_round.status = "ended"
+        await asyncio.sleep(0.02)
+        probe.lags.clear()
+        compact.append(await probe.measure(locked_compact()))
+        compact_lags.extend(probe.lags)
+    task.cancel()
+    for room in server.ROOMS.values():
+        server.SCHEDULER.cancel((room.code, "phase"))
+        server.SCHEDULER.cancel((room.code, "evict"))
+        server.SCHEDULER.cancel((room.code, "flush"))
+        for c in room.ws.values():
+            c.close()
+    server.SCHEDULER.cancel("timer_sync")
+    server.SCHEDULER.cancel("log_flush")
+    server.TICKING.clear()
+    server.LOG.close()
+    server.CPU.shutdown()
+    await asyncio.sleep(0)
+    return {"finish": finish, "compact": compact, "finish_lags": finish_lags, "compact_lags": compact_lags}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--players", type=int, default=server.LARGE_ROOM_MAX_PLAYERS)
+    ap.add_argument("--rooms", type=int, default=2000, help="обычных комнат по 8 игроков в снапшоте журнала")
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--pool", nargs="+", default=["off", "thread", "process"])
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--min-items", type=int, default=1000, help="CPU_OFFLOAD_MIN")
+    ap.add_argument("--no-numpy", action="store_true", help="подсчёт без numpy")
+    args = ap.parse_args()
+    if args.no_numpy:
+        scoring.np = None
+
+    print(f"large room: {args.players} players, {args.rooms} small rooms in the snapshot, "
+          f"numpy={'no' if scoring.np is None else 'yes'}, {args.rounds} rounds")
+    print(f"{'pool':<8}{'phase':<14}{'wall ms':>9}{'lag p50':>9}{'lag p99':>9}{'lag max':>9}")
+    for mode in args.pool:
+        r = asyncio.run(run(mode, args))
+        for name, walls, lags in (("finish_round", r["finish"], r["finish_lags"]),
+                                  ("compact_log", r["compact"], r["compact_lags"])):
+            print(f"{mode:<8}{name:<14}{pct(walls, 0.5) * 1000:>9.1f}{pct(lags, 0.5) * 1000:>9.2f}"
+                  f"{pct(lags, 0.99) * 1000:>9.2f}{max(lags, default=0) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
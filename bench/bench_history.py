@@ -0,0 +1,124 @@
+"""История раундов: размер на диске, запись блоками и экспорт через mmap.
+
+    python bench/bench_history.py --rounds 200000 --players 8 --block 500
+
+Пишет --rounds раундов в сегменты во временном каталоге (пачками по --block,
+как их сбрасывает flush_history), затем экспортирует всё в ndjson и csv, одну
+комнату и последний час. Отдельно — /api/history в работающем приложении:
+задержка цикла событий (сон 10 мс против фактического), пока идёт полный экспорт.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _common import pct  # noqa: E402
+
+from history import History, export_chunks  # noqa: E402
+
+LAG_PROBE_S = 0.01
+
+
+def fill(hist: History, args) -> float:
+    rnd = random.Random(1)
+    t = 1_700_000_000_000
+    cpu = 0.0
+    for i in range(args.rounds):
+        code = f"R{i // 5:05d}"[-6:]
+        n = args.players
+        users = [f"{code}u{j}" for j in range(n)]
+        t += 200
+        t0 = time.perf_counter()
+        hist.add_round(code, i % 5 + 1, 5, "WORLD", "", "pool", n, t - 90_000, t,
+                       (rnd.uniform(-60, 70), rnd.uniform(-180, 180)), (rnd.uniform(-60, 70), rnd.uniform(-180, 180)),
+                       users, users, [rnd.uniform(-60, 70) for _ in range(n)], [rnd.uniform(-180, 180) for _ in range(n)],
+                       [rnd.uniform(0, 20000) for _ in range(n)], [rnd.randrange(5001) for _ in range(n)])
+        cpu += time.perf_counter() - t0
+        if (i + 1) % args.block == 0:
+            hist.write(hist.take())
+    batch = hist.take()
+    if batch is not None:
+        hist.write(batch)
+    hist.close()
+    return cpu
+
+
+def export(paths, **kw):
+    t0 = time.perf_counter()
+    rows = size = 0
+    for chunk, n in export_chunks(paths, **kw):
+        rows += n
+        size += len(chunk)
+    return rows, size, time.perf_counter() - t0
+
+
+async def lag_during_export(root: str) -> dict:
+    os.environ.update(DATA_DIR=root, ROOM_LOG="0", HISTORY_TOKEN="bench")
+    import server
+    from aiohttp.test_utils import TestClient, TestServer
+
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            t = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_S)
+            lags.append(time.perf_counter() - t - LAG_PROBE_S)
+
+    async with TestClient(TestServer(server.create_app())) as c:
+        task = asyncio.ensure_future(probe())
+        t0 = time.perf_counter()
+        size = 0
+        r = await c.get("/api/history", headers={"Authorization": "Bearer bench"})
+        async for chunk in r.content.iter_chunked(1 << 16):
+            size += len(chunk)
+        elapsed = time.perf_counter() - t0
+        done.set()
+        await task
+        server.SCHEDULER.cancel("pool_save")
+    return {"bytes": size, "s": elapsed, "p50": pct(lags, 0.5), "p99": pct(lags, 0.99), "max": max(lags, default=0)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=200_000)
+    ap.add_argument("--players", type=int, default=8, help="ответов в раунде")
+    ap.add_argument("--block", type=int, default=500, help="раундов в блоке (сколько копится за HISTORY_FLUSH_MS)")
+    args = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_history")
+    try:
+        hist = History(os.path.join(root, "history"), "w0")
+        t0 = time.perf_counter()
+        add_cpu = fill(hist, args)
+        total = time.perf_counter() - t0
+        paths = hist.segments()
+        disk = sum(os.path.getsize(p) for p in paths)
+        print(f"rounds={args.rounds:,} guesses={hist.guesses:,} blocks={hist.blocks} segments={len(paths)}")
+        print(f"disk: {disk / 2**20:.1f} MB  {disk / args.rounds:.0f} B/round  {disk / max(1, hist.guesses):.1f} B/guess")
+        print(f"add_round on the loop: {add_cpu / args.rounds * 1e6:.1f} us/round;  "
+              f"encode+write in thread: {(total - add_cpu) / max(1, hist.blocks) * 1000:.2f} ms/block")
+
+        last = 1_700_000_000_000 + args.rounds * 200
+        for name, kw in (("ndjson all", {}), ("csv all", {"fmt": "csv"}),
+                         ("one room", {"code": "R00042"}), ("last hour", {"t_from": last - 3_600_000})):
+            rows, size, s = export(paths, **kw)
+            print(f"export {name:<11} rows={rows:>9,}  {size / 2**20:8.1f} MB  {s:6.2f} s  "
+                  f"{rows / s if s else 0:>10,.0f} rows/s")
+
+        r = asyncio.run(lag_during_export(root))
+        print(f"/api/history full ndjson: {r['bytes'] / 2**20:.1f} MB in {r['s']:.2f} s; event loop lag "
+              f"p50={r['p50'] * 1000:.2f} ms  p99={r['p99'] * 1000:.2f} ms  max={r['max'] * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""CPU процесса на N «простаивающих» комнатах с идущим раундом (никто не играет).
+
+    python bench/bench_idle_cpu.py --rooms 100 1000 5000 --seconds 12
+    python bench/bench_idle_cpu.py --legacy   # старые per-room циклы по 250 мс
+"""
+import time
+import asyncio
+import argparse
+
+from _common import FakeWS, isolate
+
+isolate("bench_idle")
+
+import server  # noqa: E402
+
+
+async def legacy_timer_loop(room):
+    # прежняя схема: опрос каждые 250 мс под локом и timer-кадр всем
+    while True:
+        await asyncio.sleep(0.25)
+        async with room.lock:
+            cr = room.current_round
+            await server.broadcast(room, {"t": "timer", "phase": "guess", "ms_left": max(0, cr.ends_at_ms - server.now_ms())})
+
+
+async def run(n_rooms: int, players: int, seconds: float, legacy: bool) -> dict:
+    server.ROOMS = server.RoomRegistry()
+    tasks = []
+    for _ in range(n_rooms):
+        def make_room(code):
+            room = server.Room(code=code, host_user_id="u0", round_seconds=600)
+            for j in range(players):
+                uid = f"u{j}"
+                room.add_player(uid, "")
+                room.ws[uid] = server.Conn(FakeWS())
+            return room
+        room = await server.ROOMS.create(make_room)
+        async with room.lock:
+            await server.start_round(room)
+        if legacy:
+            server.SCHEDULER.cancel((room.code, "phase"))
+            tasks.append(asyncio.create_task(legacy_timer_loop(room)))
+    if legacy:
+        server.SCHEDULER.cancel("timer_sync")
+
+    await asyncio.sleep(0.5)
+    fired0 = server.SCHEDULER.fired
+    sent0 = server.fanout.STATS.frames_sent
+    c0 = time.process_time()
+    w0 = time.perf_counter()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - c0
+    wall = time.perf_counter() - w0
+
+    for t in tasks:
+        t.cancel()
+    for room in server.ROOMS.values():
+        server.SCHEDULER.cancel((room.code, "phase"))
+        for conn in room.ws.values():
+            conn.close()
+    server.SCHEDULER.cancel("timer_sync")
+    server.TICKING.clear()
+    await asyncio.sleep(0)
+
+    return {
+        "rooms": n_rooms,
+        "cpu_pct": 100 * cpu / wall,
+        "wakeups": server.SCHEDULER.fired - fired0 if not legacy else int(n_rooms * wall / 0.25),
+        "frames": server.fanout.STATS.frames_sent - sent0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rooms", type=int, nargs="+", default=[100, 1000, 5000])
+    ap.add_argument("--players", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=12.0)
+    ap.add_argument("--legacy", action="store_true", help="прежние циклы timer_loop по 250 мс")
+    args = ap.parse_args()
+
+    mode = "legacy 250ms polling" if args.legacy else f"scheduler, sync tick {server.TIMER_SYNC_SECONDS}s"
+    print(f"mode={mode} players/room={args.players} window={args.seconds}s")
+    for n in args.rooms:
+        r = asyncio.run(run(n, args.players, args.seconds, args.legacy))
+        print(f"rooms={r['rooms']:>6}  cpu={r['cpu_pct']:6.2f}%  wakeups={r['wakeups']:>7}  frames_sent={r['frames']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Нагрузочный прогон: комнаты × игроки × длина раунда, клиенты по настоящему протоколу.
+
+    python bench/bench_load.py --rooms 50 --players 8 --round-seconds 15 --rounds 2
+    python bench/bench_load.py --rooms 200 --players 30 --procs 4 --burst
+    python bench/bench_load.py --url http://127.0.0.1:10000 --rooms 20
+
+Без --url сервер (create_app()) поднимается в отдельном процессе на свободном
+порту, там же меряются задержка цикла событий (сон 10 мс против фактического)
+и RSS до/после. С --url — только то, что видно снаружи (/healthz).
+
+Комнаты создаются через /api/create_room, хост шлёт start_game, на каждый раунд —
+pano_ready (с вероятностью --reroll сначала reroll), игроки шлют guess в
+случайный момент раунда (--burst: все в последние 2 секунды). Задержка
+message→broadcast — от отправки guess до патча/state, где свой игрок уже
+has_guessed. Клиентов гоняют --procs процессов.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import multiprocessing
+
+import aiohttp
+
+from _common import ROOT, pct
+LAG_PROBE_S = 0.01
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# ---- сервер в отдельном процессе ----
+
+def serve(port: int, data_dir: str, ready):
+    os.environ.update(DATA_DIR=data_dir, ROOM_LOG=os.environ.get("ROOM_LOG", "0"), MAX_ROOMS="100000")
+    sys.path.insert(0, ROOT)
+    from aiohttp import web
+    import server
+
+    lags = []
+    base = {"rss": 0}
+
+    async def probe():
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_S)
+            lags.append(time.perf_counter() - t - LAG_PROBE_S)
+
+    async def bench_stats(req):
+        if req.query.get("reset"):
+            lags.clear()
+            base["rss"] = rss_bytes()
+        return web.json_response({
+            "lag_p50_ms": pct(lags, 0.5) * 1000, "lag_p99_ms": pct(lags, 0.99) * 1000,
+            "lag_max_ms": max(lags, default=0.0) * 1000,
+            "rss": rss_bytes(), "rss_base": base["rss"], "rooms": len(server.ROOMS),
+        })
+
+    async def start_probe(_app):
+        asyncio.ensure_future(probe())
+
+    app = server.create_app()
+    app.router.add_get("/_bench", bench_stats)
+    app.on_startup.append(start_probe)
+
+    async def main():
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+# ---- клиенты ----
+
+class Totals:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.latencies = []
+        self.errors = 0
+
+
+async def client(s, base, code, user, sig, is_host, args, totals: Totals):
+    rnd = random.Random(f"{code}:{user}")
+    url = f"{base.replace('http', 'ws', 1)}/ws?room={code}&user={user}&sig={sig}&name={user}&proto=2"
+    async with s.ws_connect(url, max_msg_size=0, heartbeat=None) as ws:
+        rounds_seen = set()
+        sent_at = None  # отправленный guess, который ещё не вернулся в рассылке
+        tasks = []
+
+        async def send(obj):
+            totals.sent += 1
+            await ws.send_str(json.dumps(obj))
+
+        async def guess_later(ends_at_ms: int):
+            nonlocal sent_at
+            # сервер на той же машине (или с синхронными часами): дедлайн сравниваем с локальным временем
+            left = max(0.0, (ends_at_ms - time.time() * 1000) / 1000 - 0.5)
+            delay = max(0.0, left - rnd.random() * 2.0) if args.burst else rnd.random() * left
+            await asyncio.sleep(delay)
+            sent_at = time.perf_counter()
+            await send({"t": "guess", "lat": rnd.uniform(-60, 70), "lng": rnd.uniform(-170, 170)})
+
+        async def on_round(r):
+            if r is None or r["status"] != "running" or r["index"] in rounds_seen:
+                return
+            rounds_seen.add(r["index"])
+            if is_host:
+                if rnd.random() < args.reroll:
+                    await send({"t": "reroll"})
+                await send({"t": "pano_ready", "trueLat": r["seed_lat"], "trueLng": r["seed_lng"]})
+            tasks.append(asyncio.ensure_future(guess_later(r["ends_at_ms"])))
+
+        def ack(players):
+            nonlocal sent_at
+            if sent_at is not None and any(p["user_id"] == user and p.get("has_guessed") for p in players):
+                totals.latencies.append((time.perf_counter() - sent_at) * 1000)
+                sent_at = None
+
+        if is_host:
+            await send({"t": "start_game"})
+        finished = False
+        async for m in ws:
+            if m.type != aiohttp.WSMsgType.TEXT:
+                break
+            totals.received += 1
+            d = json.loads(m.data)
+            t = d["t"]
+            if t == "state":
+                st = d["state"]
+                await on_round(st.get("current_round"))
+                ack(st["players"])
+                finished = st.get("game_status") == "finished"
+            elif t == "patch":
+                for op in d["ops"]:
+                    if op["op"] == "round":
+                        await on_round(op["v"])
+                    elif op["op"] == "room":
+                        finished = op["v"].get("game_status") == "finished"
+                    elif op["op"] == "player":
+                        ack([op["v"]])
+                    elif op["op"] in ("players", "top"):
+                        ack(op["v"])
+            elif t == "me" and sent_at is not None:
+                # большая комната: ответ за пределами top-N подтверждается только своим местом
+                totals.latencies.append((time.perf_counter() - sent_at) * 1000)
+                sent_at = None
+            if finished:
+                break
+        for task in tasks:
+            task.cancel()
+
+
+def load_proc(base, rooms, args, out):
+    async def run():
+        totals = Totals()
+        conn = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=conn) as s:
+            tasks = []
+            for code, sig, host in rooms:
+                tasks.append(client(s, base, code, host, sig, True, args, totals))
+                for j in range(1, args.players):
+                    tasks.append(client(s, base, code, f"{code}p{j}", "", False, args, totals))
+            for r in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(r, Exception):
+                    totals.errors += 1
+        return totals.__dict__
+    out.put(asyncio.run(run()))
+
+
+async def create_rooms(base: str, args) -> list:
+    async with aiohttp.ClientSession() as s:
+        async def one(i):
+            body = {"host_user_id": f"h{i}", "rounds_total": args.rounds, "round_seconds": args.round_seconds,
+                    "reveal_seconds": args.reveal_seconds, "mode": "large" if args.players > 30 else ""}
+            async with s.post(base + "/api/create_room", json=body) as r:
+                j = await r.json()
+                return j["code"], j["sig"], f"h{i}"
+        return await asyncio.gather(*(one(i) for i in range(args.rooms)))
+
+
+async def get_json(url: str):
+    async with aiohttp.ClientSession() as s:
+        async with s.get(url) as r:
+            return await r.json()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="", help="уже запущенный сервер; иначе create_app() в отдельном процессе")
+    ap.add_argument("--rooms", type=int, default=50)
+    ap.add_argument("--players", type=int, default=8, help="игроков в комнате (>30 — комнаты mode=large)")
+    ap.add_argument("--round-seconds", type=int, default=15, help="не меньше 15 (ограничение сервера)")
+    ap.add_argument("--reveal-seconds", type=int, default=5)
+    ap.add_argument("--rounds", type=int, default=2)
+    ap.add_argument("--reroll", type=float, default=0.1, help="вероятность reroll у хоста в раунде")
+    ap.add_argument("--burst", action="store_true", help="все отвечают в последние 2 секунды раунда")
+    ap.add_argument("--procs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = ap.parse_args()
+
+    proc = None
+    base = args.url.rstrip("/")
+    if not base:
+        import tempfile
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        ready = multiprocessing.Event()
+        proc = multiprocessing.Process(target=serve, args=(port, tempfile.mkdtemp(prefix="bench_load"), ready),
+                                       daemon=True)
+        proc.start()
+        if not ready.wait(30):
+            raise RuntimeError("server did not start")
+
+    try:
+        if proc:
+            asyncio.run(get_json(base + "/_bench?reset=1"))
+        t0 = time.perf_counter()
+        rooms = asyncio.run(create_rooms(base, args))
+        out = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=load_proc, args=(base, rooms[i::args.procs], args, out))
+                 for i in range(args.procs)]
+        for p in procs:
+            p.start()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+        srv = asyncio.run(get_json(base + "/_bench")) if proc else None
+        health = asyncio.run(get_json(base + "/healthz"))
+    finally:
+        if proc:
+            proc.terminate()
+
+    lat = [x for r in results for x in r["latencies"]]
+    sent = sum(r["sent"] for r in results)
+    received = sum(r["received"] for r in results)
+    errors = sum(r["errors"] for r in results)
+    print(f"rooms={args.rooms} players/room={args.players} round={args.round_seconds}s x{args.rounds} "
+          f"burst={'yes' if args.burst else 'no'} client procs={args.procs} elapsed={elapsed:.1f}s")
+    print(f"throughput: {sent / elapsed:8.0f} msg/s in  {received / elapsed:9.0f} frames/s out  "
+          f"client errors={errors}")
+    print(f"guess→broadcast: n={len(lat)} p50={pct(lat, 0.5):.1f} ms  p95={pct(lat, 0.95):.1f} ms  "
+          f"p99={pct(lat, 0.99):.1f} ms  max={max(lat, default=float('nan')):.1f} ms")
+    if srv:
+        per_room = (srv["rss"] - srv["rss_base"]) / max(1, args.rooms)
+        print(f"event loop lag: p50={srv['lag_p50_ms']:.2f} ms  p99={srv['lag_p99_ms']:.2f} ms  "
+              f"max={srv['lag_max_ms']:.1f} ms")
+        print(f"memory: rss={srv['rss'] / 2**20:.1f} MB  +{per_room / 1024:.1f} KB/room "
+              f"(over {srv['rss_base'] / 2**20:.1f} MB at start)")
+    fo = health.get("fanout", {})
+    inbound = health.get("inbound", {})
+    print(f"server: sockets={health.get('sockets')} frames_dropped={fo.get('frames_dropped')} "
+          f"slow_disconnects={fo.get('slow_disconnects')} "
+          f"throttled={inbound.get('throttled', 0) + inbound.get('throttled_room', 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Быстрая игра: время до матча и сколько игроков в секунду матчмейкер рассаживает по комнатам.
+
+    python bench/bench_matchmaker.py --rate 50 200 1000 --seconds 300 --size 8 --wait 15
+    python bench/bench_matchmaker.py --place 20000 --http 2000
+
+Первая часть — только очередь (matchmaker.Matchmaker) на виртуальном времени:
+игроки приходят пуассоновским потоком --rate в секунду, корзины (регион,
+страна) выбираются с перекосом (весь мир популярнее стран), тик раз в секунду.
+time-to-match — от входа в очередь до матча; partial — доля неполных комнат.
+--place: то же через server.place_group — с созданием комнаты и отсчётом.
+--http: столько клиентов POST /api/quickplay (long-poll) в поднятое приложение,
+приходят за --ramp секунд.
+"""
+import time
+import random
+import asyncio
+import argparse
+
+from _common import isolate, pct
+
+isolate("bench_mm", ROOM_LOG="0", MAX_ROOMS="1000000")
+
+import server  # noqa: E402
+from matchmaker import Matchmaker  # noqa: E402
+
+
+def buckets():
+    # весь мир и регионы — чаще, страны — реже
+    out = [("WORLD", "")] * 8 + [(r, "") for r in server.REGIONS if r != "WORLD"] * 2
+    out += [("WORLD", c) for c in server.COUNTRIES]
+    return out
+
+
+def run_queue(rate: float, seconds: int, args) -> dict:
+    rnd = random.Random(1)
+    mm = Matchmaker(args.size, args.min, args.wait * 1000, ttl_ms=60_000)
+    choices = buckets()
+    waits, sizes = [], []
+    clock = 0.0
+    now = 0
+    next_tick = 1000
+    cpu = 0.0
+    n = 0
+    end = seconds * 1000
+    while now < end:
+        clock += rnd.expovariate(rate) * 1000
+        now = int(clock)
+        t0 = time.perf_counter()
+        while next_tick <= now:
+            for g in mm.due(next_tick):
+                waits.extend(next_tick - t.enqueued_ms for t in g)
+                sizes.append(len(g))
+                for t in g:
+                    mm.forget(t)
+            next_tick += 1000
+        t = mm.enqueue(f"u{n}", "", rnd.choice(choices), now)
+        t.waiter = True  # все «ждут в long-poll» — никто не выпадает по ttl
+        for g in mm.ready(t.bucket, now):
+            waits.extend(now - x.enqueued_ms for x in g)
+            sizes.append(len(g))
+            for x in g:
+                mm.forget(x)
+        cpu += time.perf_counter() - t0
+        n += 1
+    return {"players": n, "placed": mm.placed, "left": len(mm), "waits": waits,
+            "partial": sum(1 for s in sizes if s < args.size) / max(1, len(sizes)),
+            "avg_size": sum(sizes) / max(1, len(sizes)), "cpu": cpu}
+
+
+async def run_place(n: int, args) -> dict:
+    server.ROOMS = server.RoomRegistry()
+    server.MATCHMAKER = mm = Matchmaker(args.size, args.min, args.wait * 1000)
+    choices = buckets()
+    rnd = random.Random(2)
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    for i in range(n):
+        now = server.now_ms()
+        t = mm.enqueue(f"u{i}", f"P{i}", rnd.choice(choices), now)
+        for g in mm.ready(t.bucket, now):
+            await server.place_group(g)
+    for g in mm.due(server.now_ms() + args.wait * 1000):
+        await server.place_group(g)
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    rooms = len(server.ROOMS)
+    for room in list(server.ROOMS.values()):
+        server.SCHEDULER.cancel((room.code, "phase"))
+        server.SCHEDULER.cancel((room.code, "evict"))
+    return {"placed": mm.placed, "rooms": rooms, "wall": wall, "cpu": cpu}
+
+
+async def run_http(n: int, args) -> dict:
+    from aiohttp import ClientSession, TCPConnector
+    from aiohttp.test_utils import TestServer
+
+    server.ROOMS = server.RoomRegistry()
+    server.MATCHMAKER = Matchmaker(args.size, args.min, args.wait * 1000,
+                                   ttl_ms=server.QUICKPLAY_POLL_SECONDS * 1000 + 10000)
+    choices = buckets()
+    rnd = random.Random(3)
+    lat = []
+    async with TestServer(server.create_app()) as srv:
+        base = str(srv.make_url("/api/quickplay"))
+        async with ClientSession(connector=TCPConnector(limit=0)) as s:
+            async def player(i):
+                # приход за --ramp секунд, а не одним залпом (очередь accept у тестового сервера короткая)
+                await asyncio.sleep(args.ramp * i / n)
+                region, country = rnd.choice(choices)
+                body = {"user_id": f"h{i}", "name": f"P{i}", "region": region, "country": country}
+                t0 = time.perf_counter()
+                while True:
+                    async with s.post(base, json=body) as r:
+                        j = await r.json()
+                    if j.get("code"):
+                        lat.append(time.perf_counter() - t0)
+                        return
+                    if not j.get("ticket"):
+                        return
+                    body = {"ticket": j["ticket"]}
+                    if time.perf_counter() - t0 > args.wait + 5:
+                        # один в своей корзине — пары так и не нашлось
+                        body["cancel"] = True
+
+            await asyncio.gather(*(player(i) for i in range(n)))
+        for key in list(server.SCHEDULER._by_key):
+            server.SCHEDULER.cancel(key)
+    return {"matched": len(lat), "lat": lat}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rate", type=float, nargs="+", default=[20, 200, 2000], help="игроков в секунду")
+    ap.add_argument("--seconds", type=int, default=600, help="виртуальных секунд на прогон очереди")
+    ap.add_argument("--size", type=int, default=8, help="QUICKPLAY_SIZE")
+    ap.add_argument("--min", type=int, default=2, help="QUICKPLAY_MIN")
+    ap.add_argument("--wait", type=int, default=15, help="QUICKPLAY_WAIT_SECONDS")
+    ap.add_argument("--place", type=int, default=20000, help="игроков через place_group (0 — пропустить)")
+    ap.add_argument("--http", type=int, default=2000, help="одновременных клиентов /api/quickplay (0 — пропустить)")
+    ap.add_argument("--ramp", type=float, default=2.0, help="за сколько секунд приходят --http клиентов")
+    args = ap.parse_args()
+
+    print(f"size={args.size} min={args.min} wait={args.wait}s buckets={len(set(buckets()))}")
+    for rate in args.rate:
+        r = run_queue(rate, args.seconds, args)
+        w = r["waits"]
+        print(f"rate={rate:>6.0f}/s players={r['players']:>8,} placed={r['placed']:>8,}  "
+              f"time-to-match p50={pct(w, 0.5) / 1000:5.1f}s p99={pct(w, 0.99) / 1000:5.1f}s  "
+              f"partial={r['partial'] * 100:4.1f}% avg room={r['avg_size']:.1f}  "
+              f"queue ops {r['players'] / r['cpu'] if r['cpu'] else 0:,.0f} players/s cpu")
+    if args.place:
+        r = asyncio.run(run_place(args.place, args))
+        print(f"place_group: {r['placed']:,} players into {r['rooms']:,} rooms in {r['wall']:.2f}s "
+              f"({r['placed'] / r['wall']:,.0f} players/s, cpu {r['cpu']:.2f}s) — с созданием комнаты и отсчётом")
+    if args.http:
+        r = asyncio.run(run_http(args.http, args))
+        lat = r["lat"]
+        # wall включает одиночек, которые ждут до конца long-poll и уходят — скорость смотреть в place_group
+        print(f"http: {r['matched']:,}/{args.http:,} matched over {args.ramp:.0f}s of arrivals  "
+              f"time-to-match p50={pct(lat, 0.5) * 1000:.0f} ms p90={pct(lat, 0.9) * 1000:.0f} ms "
+              f"p99={pct(lat, 0.99) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""pick_point: точек в секунду и доля «полезных» seed'ов (суша нужной страны)
+до (равномерно в bbox) и после (выборка из клеток маски).
+
+    python tools/build_landmask.py ne_50m_admin_0_countries.geojson
+    python bench/bench_pick_point.py --check ne_10m_admin_0_countries.geojson [--mask data/landmask.bin] [--n 20000]
+
+Полезность проверяется по полигонам --check (точка внутри полигона страны /
+любой суши), а не по самой маске — иначе растр проверял бы сам себя. Лучше
+давать более подробный файл, чем тот, из которого собрана маска. Без --check
+печатается только скорость. cold ms — первая сборка списка клеток области
+(на сервере она идёт в потоке при старте).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from _common import ROOT, isolate
+
+isolate("bench_pick")
+
+import server  # noqa: E402
+from landmask import LandMask  # noqa: E402
+from tools.build_landmask import feature_code, polygons  # noqa: E402
+
+
+class Shapes:
+    # полигоны GeoJSON с bbox для отсева: (код страны, bbox, кольца)
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            fc = json.load(f)
+        self.polys = []
+        for feat in fc["features"]:
+            geom = feat.get("geometry")
+            if not geom:
+                continue
+            code = feature_code(feat.get("properties") or {}, "")
+            for rings in polygons(geom):
+                xs = [pt[0] for pt in rings[0]]
+                ys = [pt[1] for pt in rings[0]]
+                self.polys.append((code, (min(ys), min(xs), max(ys), max(xs)), rings))
+
+    def contains(self, lat: float, lng: float, country: str = "") -> bool:
+        for code, (y0, x0, y1, x1), rings in self.polys:
+            if country and code != country:
+                continue
+            if y0 <= lat <= y1 and x0 <= lng <= x1 and inside(rings, lat, lng):
+                return True
+        return False
+
+
+def inside(rings, lat: float, lng: float) -> bool:
+    # even-odd по всем кольцам — дыры полигона учитываются
+    hit = False
+    for ring in rings:
+        for i in range(len(ring) - 1):
+            (ax, ay), (bx, by) = ring[i][:2], ring[i + 1][:2]
+            if (ay <= lat < by) or (by <= lat < ay):
+                if lng < ax + (lat - ay) * (bx - ax) / (by - ay):
+                    hit = not hit
+    return hit
+
+
+def measure(fn, n: int):
+    t0 = time.perf_counter()
+    pts = [fn() for _ in range(n)]
+    return pts, n / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    # DATA_DIR у бенча временный — маску по умолчанию ищем там же, где сервер без DATA_DIR
+    ap.add_argument("--mask", default=os.getenv("LANDMASK_FILE") or os.path.join(ROOT, "data", "landmask.bin"))
+    ap.add_argument("--check", default="", help="GeoJSON стран для проверки полезности (независимо от маски)")
+    ap.add_argument("--n", type=int, default=20000)
+    args = ap.parse_args()
+
+    mask = LandMask.open(args.mask)
+    if mask is None:
+        sys.exit(f"нет файла маски {args.mask}; соберите его tools/build_landmask.py")
+    shapes = Shapes(args.check) if args.check else None
+
+    areas = [(f"R:{k}", v["bbox"], "") for k, v in server.REGIONS.items()]
+    areas += [(f"C:{k}", v["bbox"], k) for k, v in server.COUNTRIES.items()]
+
+    print(f"mask res={mask.res}/deg countries={len(mask.countries)} n={args.n} "
+          f"check={os.path.basename(args.check) if shapes else '-'}")
+    print(f"{'area':<12} {'cold ms':>8} {'bbox pts/s':>11} {'useful':>7}   {'mask pts/s':>11} {'useful':>7}")
+    for key, bbox, country in areas:
+        server.LANDMASK = None
+        before, before_rate = measure(lambda: server.pick_point(bbox, country), args.n)
+        server.LANDMASK = mask
+        t0 = time.perf_counter()
+        mask.cells(bbox, country)  # на сервере — LandMask.warm в потоке при старте
+        cold = (time.perf_counter() - t0) * 1000
+        after, after_rate = measure(lambda: server.pick_point(bbox, country), args.n)
+        if shapes:
+            ub = f"{sum(shapes.contains(*p, country) for p in before) / args.n:>7.1%}"
+            ua = f"{sum(shapes.contains(*p, country) for p in after) / args.n:>7.1%}"
+        else:
+            ub = ua = f"{'-':>7}"
+        print(f"{key:<12} {cold:>8.1f} {before_rate:>11.0f} {ub}   {after_rate:>11.0f} {ua}")
+
+
+if __name__ == "__main__":
+    main()
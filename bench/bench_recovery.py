@@ -0,0 +1,88 @@
+"""Восстановление комнат из журнала после рестарта: время replay на N комнатах.
+
+    python bench/bench_recovery.py --rooms 1000 10000 --players 8
+
+Каждая комната проходит через обычные обработчики (create, join, старт раунда,
+ответы, половина — конец раунда), журнал сбрасывается на диск, затем реестр
+очищается и восстанавливается: сначала из сырого журнала, потом из компактного.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from _common import isolate
+
+isolate("bench_recovery")
+
+import server  # noqa: E402
+from eventlog import EventLog  # noqa: E402
+
+
+def reset():
+    server.ROOMS = server.RoomRegistry()
+    server.SCHEDULER = server.Scheduler(server.now_ms)
+    server.TICKING.clear()
+    server.LOG_LOCK = asyncio.Lock()
+
+
+async def fill(n_rooms: int, players: int):
+    for i in range(n_rooms):
+        room = await server.ROOMS.create(lambda code: server.Room(code=code, host_user_id="u0", round_seconds=600))
+        server.log_event("room", room.code, server.room_record(room))
+        async with room.lock:
+            for j in range(players):
+                room.add_player(f"u{j}", f"P{i}.{j}")
+                server.log_event("join", room.code, f"u{j}", f"P{i}.{j}")
+            await server.start_round(room)
+            for j in range(players):
+                await server.handle_message(room, f"u{j}", None, {"t": "guess", "lat": 10.0 + j, "lng": 20.0 + i % 50})
+            if i % 2:
+                await server.finish_round(room)
+    await server.flush_log()
+    # сбросы по таймеру не должны сработать, пока asyncio.run гасит пул потоков
+    server.SCHEDULER.cancel("log_flush")
+    server.SCHEDULER.cancel("history_flush")
+
+
+def restore() -> dict:
+    reset()
+    t = time.perf_counter()
+    server.restore_rooms()
+    return {"ms": (time.perf_counter() - t) * 1000, "rooms": len(server.ROOMS), "records": server.LOG.replayed}
+
+
+def run(n_rooms: int, players: int, tmp: str) -> dict:
+    path = os.path.join(tmp, f"rooms-{n_rooms}.log")
+    server.ROOM_LOG_FILE = path
+    server.LOG = EventLog(path)
+    server.LOG.open()
+    reset()
+    asyncio.run(fill(n_rooms, players))
+    out = {"raw_bytes": os.path.getsize(path), "raw": restore()}
+    server.LOG.compact(server.encode_records(server.snapshot_records()))
+    out["compact_bytes"] = os.path.getsize(path)
+    out["compact"] = restore()
+    server.LOG.close()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rooms", type=int, nargs="+", default=[1000, 10000])
+    ap.add_argument("--players", type=int, default=8)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rooms:
+            r = run(n, args.players, tmp)
+            print(f"rooms={n:>6} players/room={args.players}")
+            print(f"  raw log     {r['raw_bytes'] / 1e6:7.1f} MB  {r['raw']['records']:>8} records  "
+                  f"replay {r['raw']['ms']:8.1f} ms  restored={r['raw']['rooms']}")
+            print(f"  compacted   {r['compact_bytes'] / 1e6:7.1f} MB  {r['compact']['records']:>8} records  "
+                  f"replay {r['compact']['ms']:8.1f} ms  restored={r['compact']['rooms']}")
+
+
+if __name__ == "__main__":
+    main()
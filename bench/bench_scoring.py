@@ -0,0 +1,65 @@
+"""Подсчёт очков раунда: прежний цикл по игрокам против пакетного score_batch
+(numpy, если установлен) на 30 / 1k / 10k ответов.
+
+    python bench/bench_scoring.py [--sizes 30 1000 10000] [--repeat 50]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scoring  # noqa: E402
+from scoring import GuessColumns, haversine_km, k_smallest, score_batch, score_from_distance_km  # noqa: E402
+
+
+def scalar(true, guesses):
+    # как было в finish_round: по игроку, min + список победителей, топ — полной сортировкой
+    best_d = None
+    rows = []
+    for uid, g in guesses:
+        d = haversine_km(true, g)
+        s = score_from_distance_km(d)
+        rows.append((d, uid, s))
+        if best_d is None or d < best_d:
+            best_d = d
+    rows.sort()
+    return rows[:10]
+
+
+def batched(true, cols):
+    d, s = score_batch(true[0], true[1], cols.lat, cols.lng)
+    return k_smallest(d, 10)
+
+
+def bench(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[30, 1000, 10000])
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    rnd = random.Random(7)
+    true = (55.75, 37.62)
+    print(f"numpy={'yes' if scoring.np is not None else 'no'}")
+    print(f"{'players':>8} {'scalar ms':>10} {'batched ms':>11} {'speedup':>8}")
+    for n in args.sizes:
+        guesses = [(f"u{i}", (rnd.uniform(-60, 70), rnd.uniform(-180, 180))) for i in range(n)]
+        cols = GuessColumns()
+        for i, (_, (lat, lng)) in enumerate(guesses):
+            cols.add(i, lat, lng)
+        a = bench(lambda: scalar(true, guesses), args.repeat)
+        b = bench(lambda: batched(true, cols), args.repeat)
+        print(f"{n:>8} {a:>10.3f} {b:>11.3f} {a / b:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Целые игры на виртуальных часах: тысячи партий за секунды, детерминированно.
+
+    python bench/bench_sim.py --games 1000 --players 8 --rounds 5 --round-seconds 90 --seed 1
+    python bench/bench_sim.py --games 200 --players 300 --large --no-sockets
+
+Сервер переключается на VirtualClock (server.use_clock(..., manual=True)):
+SCHEDULER не ставит таймеры цикла, драйвер сам снимает созревшие дедлайны
+(pop_due) и сдвигает время к следующему. Точки раундов берутся из
+random.Random(seed), ответы игроков — тоже из seed, поэтому один и тот же
+--seed даёт одинаковый digest итоговых очков.
+
+Время каждого колбэка пишется по фазам: start_round (конец отсчёта),
+finish_round (конец раунда — подсчёт и рассылка), reveal_end, next_round,
+guess / pano_ready / start_game (сообщения игроков), flush (склейка
+state), timer_sync. Сокеты — заглушки, кадры считаются, но никуда не уходят.
+"""
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import defaultdict
+
+from _common import FakeWS, isolate, pct
+
+isolate("bench_sim")
+
+import server  # noqa: E402
+from scheduler import VirtualClock  # noqa: E402
+
+
+class Sim:
+    def __init__(self, args):
+        self.args = args
+        self.rnd = random.Random(args.seed + 1)
+        self.clock = VirtualClock(1_700_000_000_000)
+        self.rooms = []
+        self.planned = set()
+        self.timings = defaultdict(list)
+        self.messages = 0
+
+    def setup(self):
+        a = self.args
+        server.use_clock(self.clock, manual=True)
+        server.RNG = random.Random(a.seed)
+        server.ROOMS = server.RoomRegistry()
+        server.HISTORY = False  # история раундов пишется на диск — в симуляции не нужна
+        # личные кадры (toast, me) игрокам без сокета — в общий сток вне рассылки
+        self.sink = server.Conn(FakeWS(), 1 << 20, server.PROTO_DELTA)
+        for i in range(a.games):
+            room = server.Room(code=f"S{i:05d}", host_user_id="u0", rounds_total=a.rounds,
+                               round_seconds=a.round_seconds, reveal_seconds=a.reveal_seconds, large=a.large,
+                               max_players=server.LARGE_ROOM_MAX_PLAYERS if a.large else server.MAX_PLAYERS)
+            for j in range(a.players):
+                room.add_player(f"u{j}", f"P{j}")
+                if not a.no_sockets:
+                    room.ws[f"u{j}"] = server.Conn(FakeWS(), 1 << 20, server.PROTO_DELTA)
+            server.ROOMS.put(room)
+            self.rooms.append(room)
+            # хосты жмут «старт» вразброс в первые 10 секунд
+            self.message_at(room, "u0", self.clock.now + self.rnd.randrange(10_000), {"t": "start_game"})
+
+    def message_at(self, room, uid, when, data):
+        async def deliver():
+            async with room.lock:
+                await server.handle_message(room, uid, room.ws.get(uid) or self.sink, data)
+        self.messages += 1
+        server.SCHEDULER.call_at(when, (room.code, "sim", data["t"], uid), deliver)
+
+    def plan_round(self, room):
+        # на новый раунд: хост подтверждает панораму, игроки отвечают в случайный момент (часть — не успевает)
+        cr = room.current_round
+        if cr is None or cr.status != "running" or (room.code, cr.index) in self.planned:
+            return
+        self.planned.add((room.code, cr.index))
+        rnd = self.rnd
+        now = self.clock.now
+        self.message_at(room, "u0", now + rnd.randrange(500, 3000),
+                        {"t": "pano_ready", "trueLat": cr.seed_lat, "trueLng": cr.seed_lng})
+        span = cr.ends_at_ms - now
+        for p in room.roster:
+            if rnd.random() < self.args.skip:
+                continue
+            self.message_at(room, p.user_id, now + int(span * rnd.betavariate(2, 1.2)) - 1,
+                            {"t": "guess", "lat": cr.seed_lat + rnd.gauss(0, 3), "lng": cr.seed_lng + rnd.gauss(0, 3)})
+
+    def label(self, key) -> str:
+        if isinstance(key, tuple):
+            if key[1] == "sim":
+                return key[2]
+            if key[1] == "phase":
+                room = server.ROOMS.get(key[0])
+                cr = room.current_round if room else None
+                if room is None:
+                    return "phase"
+                if room.game_status == "countdown":
+                    return "start_round"
+                if cr is not None and cr.status == "running":
+                    return "finish_round"
+                if cr is not None and cr.status == "reveal":
+                    return "reveal_end"
+                return "next_round"
+            return key[1]
+        return str(key)
+
+    async def run(self):
+        sched = server.SCHEDULER
+        finished = set()
+        while len(finished) < len(self.rooms):
+            when = sched.next_deadline()
+            if when is None:
+                break
+            self.clock.now = max(self.clock.now, when)
+            for e in sched.pop_due(self.clock.now):
+                name = self.label(e.key)
+                t0 = time.perf_counter()
+                await e.fn()
+                self.timings[name].append(time.perf_counter() - t0)
+                if isinstance(e.key, tuple):
+                    room = server.ROOMS.get(e.key[0])
+                    if room is not None:
+                        self.plan_round(room)
+                        if room.game_status == "finished":
+                            finished.add(room.code)
+            # очереди сокетов-заглушек опустошаются своими writer-тасками
+            await asyncio.sleep(0)
+        for key in list(sched._by_key):
+            sched.cancel(key)
+        server.TICKING.clear()
+
+    def digest(self) -> str:
+        h = hashlib.sha256()
+        for room in self.rooms:
+            for p in room.roster:
+                h.update(f"{room.code}:{p.user_id}:{p.total_score};".encode())
+        return h.hexdigest()[:16]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--games", type=int, default=1000)
+    ap.add_argument("--players", type=int, default=8)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--round-seconds", type=int, default=90)
+    ap.add_argument("--reveal-seconds", type=int, default=12)
+    ap.add_argument("--skip", type=float, default=0.1, help="доля игроков, не ответивших в раунде")
+    ap.add_argument("--large", action="store_true", help="комнаты mode=large")
+    ap.add_argument("--no-sockets", action="store_true", help="без сокетов-заглушек (только логика и подсчёт)")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    sim = Sim(args)
+
+    async def go():
+        sim.setup()  # Conn заводит writer-таск — нужен работающий цикл
+        await sim.run()
+
+    t0 = time.perf_counter()
+    cpu0 = time.process_time()
+    asyncio.run(go())
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    virtual_s = (sim.clock.now - 1_700_000_000_000) / 1000
+
+    rounds = args.games * args.rounds
+    print(f"games={args.games} players={args.players} rounds={args.rounds}x{args.round_seconds}s "
+          f"sockets={'no' if args.no_sockets else 'yes'} seed={args.seed}")
+    print(f"virtual {virtual_s:,.0f}s in {wall:.2f}s wall ({virtual_s / wall:,.0f}x), cpu {cpu:.2f}s")
+    print(f"throughput: {args.games / wall:,.0f} games/s  {rounds / wall:,.0f} rounds/s  "
+          f"{sim.messages / wall:,.0f} msg/s  frames={FakeWS.total_frames:,}")
+    print(f"{'phase':<14}{'count':>9}{'total ms':>11}{'p50 us':>10}{'p99 us':>10}{'max us':>10}")
+    for name, xs in sorted(sim.timings.items(), key=lambda kv: -sum(kv[1])):
+        print(f"{name:<14}{len(xs):>9}{sum(xs) * 1000:>11.1f}{pct(xs, 0.5) * 1e6:>10.1f}"
+              f"{pct(xs, 0.99) * 1e6:>10.1f}{max(xs) * 1e6:>10.1f}")
+    print(f"digest {sim.digest()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Байты на проводе и CPU на кадр: json (stdlib) / json через orjson / mp (MessagePack с номерами ключей).
+
+    python bench/bench_wire.py --players 30 1000
+"""
+import json
+import time
+import random
+import argparse
+
+from _common import isolate
+
+isolate("bench_wire")
+
+import server  # noqa: E402
+import wire  # noqa: E402
+
+
+def make_room(players: int) -> server.Room:
+    room = server.Room(code="BENCH1", host_user_id="u0", round_seconds=90)
+    rnd = random.Random(1)
+    for i in range(players):
+        p = room.add_player(f"u{i}", f"Игрок {i}")
+        p.total_score = rnd.randrange(0, 20000)
+    room.board.rebuild([p.total_score for p in room.roster])
+    room.round_number = 2
+    room.game_status = "running"
+    room.current_round = server.Round(2, 48.1, 11.5, server.now_ms(), server.now_ms() + 90000, server.now_ms() + 102000)
+    for p in room.roster[: players // 2]:
+        p.guess = (rnd.uniform(-60, 70), rnd.uniform(-170, 170))
+        p.has_guessed = True
+        p.last_distance_km = rnd.uniform(0, 9000)
+        p.last_score = rnd.randrange(0, 5000)
+        room.guesses.add(p.idx, *p.guess)
+    room.touch()
+    return room
+
+
+def frames(room: server.Room) -> dict:
+    p = room.roster[0]
+    return {
+        "timer": server.timer_frame(room),
+        "patch": {"t": "patch", "v": 17, "ops": [server.op_player(p)]},
+        "round_end": {"t": "round_end", "winners": ["u3"], "no_guess": [q.user_id for q in room.roster[-5:]],
+                      "best_distance_km": 12.5},
+        "state": {"t": "state", "state": room.state_obj()},
+    }
+
+
+def per_frame_us(fn, arg, budget: float = 0.3) -> float:
+    n = 0
+    t0 = time.perf_counter()
+    while True:
+        fn(arg)
+        n += 1
+        dt = time.perf_counter() - t0
+        if dt > budget:
+            return dt / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--players", type=int, nargs="+", default=[30, 1000])
+    args = ap.parse_args()
+
+    stdlib = lambda o: json.dumps(o, ensure_ascii=False)  # noqa: E731  прежний encode()
+    codecs = [("json", stdlib, json.loads)]
+    if wire.orjson is not None:
+        codecs.append(("orjson", wire.dumps, wire.loads))
+    codecs.append(("mp", wire.pack, wire.unpack))
+
+    print(f"orjson={'yes' if wire.orjson is not None else 'no'}")
+    print(f"{'frame':<16}{'codec':<8}{'bytes':>9}{'enc us':>10}{'dec us':>10}")
+    for n in args.players:
+        room = make_room(n)
+        for name, obj in frames(room).items():
+            label = f"{name}/{n}" if name == "state" else name
+            if name != "state" and n != args.players[0]:
+                continue
+            for cname, enc, dec in codecs:
+                data = enc(obj)
+                size = len(data.encode() if isinstance(data, str) else data)
+                print(f"{label:<16}{cname:<8}{size:>9}{per_frame_us(enc, obj):>10.1f}{per_frame_us(dec, data):>10.1f}")
+        # снапшот из закешированных секций (то, что реально уходит json-клиентам)
+        room.state_json()
+        print(f"{'state/' + str(n):<16}{'cached':<8}{len(server.state_frame(room).encode()):>9}"
+              f"{per_frame_us(lambda r: server.state_frame(r), room):>10.1f}{'':>10}")
+
+
+if __name__ == "__main__":
+    main()
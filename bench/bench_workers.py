@@ -0,0 +1,147 @@
+"""Комнат на хост в зависимости от числа воркеров (WORKERS) за роутером.
+
+    python bench/bench_workers.py --workers 1 2 4 --rooms 100 400 --players 4
+
+Для каждого числа воркеров поднимается `python server.py` на свободном порту,
+создаются комнаты, в каждой игроки шлют `resync` раз в --interval секунд и
+меряют время до ответа `state`; хост раз в секунду меняет настройки (patch
+всем). Нагрузку дают --procs отдельных процессов. Результат — ответов в
+секунду и p50/p99; «держит» — p99 ниже --slo мс.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+import aiohttp
+
+from _common import ROOT, pct
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, data_dir: str) -> subprocess.Popen:
+    env = dict(os.environ, WORKERS=str(workers), PORT=str(port), DATA_DIR=data_dir,
+               ROOM_LOG="0", MAX_ROOMS="100000")
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py")], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_up(base: str):
+    async with aiohttp.ClientSession() as s:
+        for _ in range(300):
+            try:
+                async with s.get(base + "/healthz") as r:
+                    if r.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def create_rooms(base: str, n: int) -> list:
+    async with aiohttp.ClientSession() as s:
+        async def one(i):
+            async with s.post(base + "/api/create_room", json={"host_user_id": f"h{i}"}) as r:
+                j = await r.json()
+                return j["code"], j["sig"], f"h{i}"
+        return await asyncio.gather(*(one(i) for i in range(n)))
+
+
+async def player(s, base, code, user, sig, interval, until, lat, is_host):
+    url = f"{base}/ws?room={code}&user={user}&sig={sig}&proto=2"
+    async with s.ws_connect(url, max_msg_size=0) as ws:
+        await ws.receive()  # state
+        await asyncio.sleep(random.random() * interval)
+        next_settings = time.monotonic() + 1.0
+        while time.monotonic() < until:
+            t = time.perf_counter()
+            await ws.send_str('{"t": "resync"}')
+            while True:
+                m = await ws.receive()
+                if m.type != aiohttp.WSMsgType.TEXT:
+                    return
+                if m.data.startswith('{"t":"state"'):
+                    break
+            lat.append((time.perf_counter() - t) * 1000)
+            if is_host and time.monotonic() > next_settings:
+                await ws.send_str(json.dumps({"t": "set_settings", "region": random.choice(["WORLD", "EUROPE"])}))
+                next_settings += 1.0
+            await asyncio.sleep(interval)
+
+
+def load_proc(base, rooms, players, interval, seconds, out):
+    async def run():
+        lat = []
+        until = time.monotonic() + seconds
+        conn = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=conn) as s:
+            tasks = []
+            for code, sig, host in rooms:
+                tasks.append(player(s, base, code, host, sig, interval, until, lat, True))
+                for j in range(1, players):
+                    tasks.append(player(s, base, code, f"p{j}", "", interval, until, lat, False))
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return lat
+    out.put(asyncio.run(run()))
+
+
+def run(workers: int, n_rooms: int, args) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = start_server(workers, port, tmp)
+        try:
+            asyncio.run(wait_up(base))
+            rooms = asyncio.run(create_rooms(base, n_rooms))
+            out = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=load_proc, args=(base, rooms[i::args.procs], args.players,
+                                                                     args.interval, args.seconds, out))
+                     for i in range(args.procs)]
+            for p in procs:
+                p.start()
+            lat = []
+            for _ in procs:
+                lat.extend(out.get())
+            for p in procs:
+                p.join()
+        finally:
+            proc.terminate()
+            proc.wait(10)
+    return {"replies_s": len(lat) / args.seconds, "p50": pct(lat, 0.5), "p99": pct(lat, 0.99)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--rooms", type=int, nargs="+", default=[100, 400])
+    ap.add_argument("--players", type=int, default=4)
+    ap.add_argument("--interval", type=float, default=0.5)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--procs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    ap.add_argument("--slo", type=float, default=100.0, help="p99, мс")
+    args = ap.parse_args()
+
+    print(f"cores={os.cpu_count()} players/room={args.players} resync every {args.interval}s load procs={args.procs}")
+    for w in args.workers:
+        for n in args.rooms:
+            r = run(w, n, args)
+            ok = "ok" if r["p99"] < args.slo else "over SLO"
+            print(f"workers={w:>2} rooms={n:>6}  replies/s={r['replies_s']:8.0f}  "
+                  f"p50={r['p50']:7.1f} ms  p99={r['p99']:7.1f} ms  {ok}")
+
+
+if __name__ == "__main__":
+    main()
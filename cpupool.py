@@ -0,0 +1,69 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+KINDS = ("thread", "process", "off")
+
+
+# Пул для CPU-работы, которую не стоит делать на цикле событий: сериализация
+# снапшота журнала, подсчёт очков большой комнаты (с numpy это доли мс — заметно
+# только без него; рассылка итогов сокетам остаётся на цикле). Мелкие задачи (меньше
+# min_items ответов/игроков) выполняются сразу — передача в пул дороже их самих.
+# Вызывающий ждёт результат под локом комнаты, поэтому результаты применяются
+# в том же порядке, что и без пула; освобождается только цикл для других комнат.
+#
+# thread — без копирования аргументов; помогает там, где работа дробится на
+# много мелких вызовов (GIL отдаётся циклу раз в sys.getswitchinterval()).
+# process — настоящий параллелизм ценой pickle аргументов и результата;
+# функции должны быть на уровне модуля. off — всё на цикле, как раньше.
+class CpuPool:
+    def __init__(self, kind: str = "thread", workers: int = 0, min_items: int = 1000):
+        self.kind = kind if kind in KINDS else "thread"
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.min_items = min_items
+        self.executor: Optional[Executor] = None
+
+        self.inline = 0
+        self.offloaded = 0
+        self.offload_ms = 0.0
+
+    def start(self):
+        if self.executor is not None or self.kind == "off":
+            return
+        if self.kind == "process":
+            # forkserver: дочерние процессы не наследуют цикл событий и сокеты сервера
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=ctx)
+        else:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="cpu")
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def run(self, items: int, fn: Callable, *args):
+        # items — объём работы (ответов, игроков); решает, стоит ли уходить с цикла
+        if self.executor is None or items < self.min_items:
+            self.inline += 1
+            return fn(*args)
+        t0 = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.offloaded += 1
+            self.offload_ms += (time.perf_counter() - t0) * 1000
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers if self.executor is not None else 0,
+            "min_items": self.min_items,
+            "inline": self.inline,
+            "offloaded": self.offloaded,
+            "offload_ms": round(self.offload_ms, 1),
+        }
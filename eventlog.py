@@ -0,0 +1,112 @@
+import os
+import json
+from typing import List
+
+
+# Журнал изменений комнат: одна JSON-строка на событие, файл только дописывается.
+# append() копит записи в памяти, write() кодирует и сбрасывает пачку одним
+# fsync (вызывается из пула потоков, не из цикла — json.dumps ответов большой
+# комнаты тоже там). Записи после append() не меняются. compact() подменяет
+# файл снапшотом живых комнат, чтобы он не рос бесконечно.
+class EventLog:
+    def __init__(self, path: str):
+        self.path = path
+        self.buf: List[list] = []
+        self.size = 0  # байт в файле
+        self.need_compact = False  # запись сорвалась — хвост файла под вопросом
+        self._f = None
+
+        self.records = 0
+        self.flushes = 0
+        self.compactions = 0
+        self.bytes_written = 0
+        self.replayed = 0
+        self.replay_ms = 0
+
+    @property
+    def active(self) -> bool:
+        return self._f is not None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._f = open(self.path, "ab")
+        self.size = self._f.tell()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def append(self, rec: list):
+        self.buf.append(rec)
+        self.records += 1
+
+    def take(self) -> List[list]:
+        recs, self.buf = self.buf, []
+        return recs
+
+    def write(self, recs: List[list]):
+        # в потоке: кодирование, одна запись + один fsync на всю пачку
+        if not recs:
+            return
+        data = encode_records(recs)
+        f = self._f
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        self.size += len(data)
+        self.bytes_written += len(data)
+        self.flushes += 1
+
+    def compact(self, data: bytes):
+        # в потоке: снапшот во временный файл, fsync, атомарная подмена
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.close()
+        self.open()
+        self.need_compact = False
+        self.bytes_written += len(data)
+        self.compactions += 1
+
+    def stats(self) -> dict:
+        return {
+            "records": self.records,
+            "pending": len(self.buf),
+            "file_bytes": self.size,
+            "flushes": self.flushes,
+            "compactions": self.compactions,
+            "bytes_written": self.bytes_written,
+            "replayed": self.replayed,
+            "replay_ms": self.replay_ms,
+        }
+
+
+def encode_records(recs) -> bytes:
+    return "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in recs).encode()
+
+
+def read_records(path: str) -> List[list]:
+    # весь файл разбирается одним json.loads (на порядок быстрее построчного);
+    # оборванная последняя строка (упали посреди записи) отбрасывается
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    text = data[:data.rfind(b"\n") + 1].decode("utf-8", "replace")
+    try:
+        recs = json.loads("[" + text.rstrip("\n").replace("\n", ",") + "]")
+    except ValueError:
+        # битая строка в середине — берём всё, что до неё
+        recs = []
+        for line in text.splitlines():
+            try:
+                recs.append(json.loads(line))
+            except ValueError:
+                break
+    return [r for r in recs if isinstance(r, list) and len(r) >= 2]
@@ -0,0 +1,132 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Tuple, Union
+
+
+# кадры, которые можно выкинуть у медленного клиента: следующий всё равно свежее
+DROPPABLE = frozenset({"timer"})
+
+
+class FanoutStats:
+    def __init__(self):
+        self.frames_queued = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.slow_disconnects = 0
+        self.send_errors = 0
+        self.max_queue_depth = 0
+
+    def snapshot(self, conns: Iterable["Conn"] = ()) -> Dict[str, int]:
+        depth = 0
+        n = 0
+        for c in conns:
+            depth += len(c.queue)
+            n += 1
+        return {
+            "connections": n,
+            "queue_depth": depth,
+            "max_queue_depth": self.max_queue_depth,
+            "frames_queued": self.frames_queued,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "send_errors": self.send_errors,
+        }
+
+
+STATS = FanoutStats()
+
+
+# Исходящая очередь одного сокета со своим writer-таском.
+# broadcast только кладёт готовую строку в очередь и не ждёт клиента.
+# При переполнении сначала выкидываются устаревшие timer-кадры, если места
+# всё равно нет — клиент отключается.
+class Conn:
+    __slots__ = ("ws", "maxsize", "proto", "enc", "droppable", "queue", "dropped", "_wakeup", "_task", "_closed")
+
+    def __init__(self, ws, maxsize: int = 64, proto: int = 1, enc: int = 0, droppable: frozenset = DROPPABLE):
+        self.ws = ws
+        self.proto = proto
+        self.enc = enc  # wire.ENC_JSON / ENC_MP: текстовые или бинарные кадры
+        # зрителям и полный state не жалко выкинуть: следующий его заменит
+        self.droppable = droppable
+        self.maxsize = max(2, maxsize)
+        self.queue: Deque[Tuple[str, Union[str, bytes]]] = deque()
+        self.dropped = 0
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.create_task(self._writer())
+
+    @property
+    def closed(self) -> bool:
+        return self._closed or self.ws.closed
+
+    def push(self, kind: str, data: Union[str, bytes]) -> bool:
+        if self.closed:
+            return False
+        q = self.queue
+        droppable = self.droppable
+        if kind in droppable and q and q[-1][0] == kind:
+            # таймер ещё не ушёл — просто подменяем его свежим
+            q[-1] = (kind, data)
+            self._drop(1)
+            return True
+        if len(q) >= self.maxsize:
+            before = len(q)
+            self.queue = q = deque(item for item in q if item[0] not in droppable)
+            # выкинули устаревшие — свежий кадр встаёт на их место
+            self._drop(before - len(q))
+            if len(q) >= self.maxsize:
+                STATS.slow_disconnects += 1
+                self.close(kick=True)
+                return False
+        q.append((kind, data))
+        STATS.frames_queued += 1
+        if len(q) > STATS.max_queue_depth:
+            STATS.max_queue_depth = len(q)
+        self._wakeup.set()
+        return True
+
+    def replay(self, items: List[Tuple[str, Union[str, bytes]]]):
+        # докачка после переподключения: ring ограничен REPLAY_FRAMES, лимит очереди не применяем
+        if self.closed or not items:
+            return
+        self.queue.extend(items)
+        STATS.frames_queued += len(items)
+        if len(self.queue) > STATS.max_queue_depth:
+            STATS.max_queue_depth = len(self.queue)
+        self._wakeup.set()
+
+    def _drop(self, n: int):
+        if n > 0:
+            self.dropped += n
+            STATS.frames_dropped += n
+
+    async def _writer(self):
+        try:
+            while True:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                _kind, data = self.queue.popleft()
+                if type(data) is bytes:
+                    await self.ws.send_bytes(data)
+                else:
+                    await self.ws.send_str(data)
+                STATS.frames_sent += 1
+        except asyncio.CancelledError:
+            return
+        except Exception:
+            STATS.send_errors += 1
+            self.close(kick=True)
+
+    def close(self, kick: bool = False):
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        if kick and not self.ws.closed:
+            asyncio.ensure_future(self.ws.close())
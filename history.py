@@ -0,0 +1,324 @@
+import os
+import csv
+import io
+import json
+import mmap
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+MAGIC = b"FGHB"
+# magic | длина тела | раундов | ответов | строк | резерв | min/max ended_ms
+HEADER = struct.Struct("<4sIIIIIqq")
+SUFFIX = ".fgh"
+
+# колонки блока в порядке записи: сначала 8-байтовые, потом 4-байтовые, чтобы не было дыр
+ROUND_COLS = (
+    ("ended_ms", "q"), ("started_ms", "q"),
+    ("room", "I"), ("index", "I"), ("rounds_total", "I"), ("region", "I"), ("country", "I"),
+    ("source", "I"), ("players", "I"), ("guesses", "I"),
+    ("seed_lat", "f"), ("seed_lng", "f"), ("true_lat", "f"), ("true_lng", "f"),
+)
+GUESS_COLS = (
+    ("round", "I"), ("user", "I"), ("name", "I"), ("score", "I"),
+    ("lat", "f"), ("lng", "f"), ("distance_km", "f"),
+)
+
+CSV_FIELDS = ["ended_ms", "started_ms", "room", "index", "rounds_total", "region", "country", "source",
+              "players", "seed_lat", "seed_lng", "true_lat", "true_lng",
+              "user_id", "name", "lat", "lng", "distance_km", "score"]
+
+
+class Batch:
+    # раунды, накопленные между сбросами: колонки array + таблица строк блока
+    __slots__ = ("rounds", "guesses", "strings", "_ids", "ts_min", "ts_max")
+
+    def __init__(self):
+        self.rounds = {name: array(t) for name, t in ROUND_COLS}
+        self.guesses = {name: array(t) for name, t in GUESS_COLS}
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self.ts_min = 0
+        self.ts_max = 0
+
+    def __len__(self) -> int:
+        return len(self.rounds["ended_ms"])
+
+    def sid(self, s: str) -> int:
+        i = self._ids.get(s)
+        if i is None:
+            i = self._ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def encode(self) -> bytes:
+        n_rounds = len(self)
+        n_guesses = len(self.guesses["round"])
+        raw = [s.encode() for s in self.strings]
+        offsets = array("I", [0])
+        for b in raw:
+            offsets.append(offsets[-1] + len(b))
+        blob = b"".join(raw)
+        blob += b"\0" * (-len(blob) % 8)
+        parts = [self.rounds[name].tobytes() for name, _ in ROUND_COLS]
+        parts += [self.guesses[name].tobytes() for name, _ in GUESS_COLS]
+        parts.append(offsets.tobytes())
+        body = b"".join(parts)
+        body += b"\0" * (-len(body) % 8)
+        body += blob
+        return HEADER.pack(MAGIC, len(body), n_rounds, n_guesses, len(raw), 0, self.ts_min, self.ts_max) + body
+
+
+# История сыгранных раундов: сегменты только дописываются, блок на каждый сброс.
+# Блок колоночный: заголовок (для пропуска по времени без чтения тела), колонки
+# раундов и ответов, таблица строк (коды комнат, user_id, имена — по разу на блок).
+# add_round() копит колонки на цикле событий, take() отдаёт пачку целиком,
+# write() кодирует и пишет её в пуле потоков. Экспорт читает сегменты через mmap
+# по блоку за раз, поэтому не держит в памяти больше одного блока.
+class History:
+    def __init__(self, root: str, name: str, segment_bytes: int = 32 << 20):
+        self.root = root
+        self.name = name  # префикс сегментов этого процесса (воркера)
+        self.segment_bytes = segment_bytes
+        self.batch = Batch()
+        self._f = None
+        self._size = 0
+
+        self.rounds = 0
+        self.guesses = 0
+        self.blocks = 0
+        self.bytes_written = 0
+        self.exports = 0
+        self.exported_rows = 0
+
+    def add_round(self, code: str, index: int, rounds_total: int, region: str, country: str, source: str,
+                  players: int, started_ms: int, ended_ms: int, seed: Tuple[float, float], true: Tuple[float, float],
+                  users: Sequence[str], names: Sequence[str], lats: Sequence[float], lngs: Sequence[float],
+                  dists: Sequence[float], scores: Sequence[int]):
+        # ответы — колонками в том же порядке, что room.guesses. Очки — в беззнаковую колонку:
+        # приводим к её диапазону до любых изменений batch, чтобы битое значение не оставило полраунда
+        scores = array("I", [min(max(int(s), 0), 0xFFFFFFFF) for s in scores])
+        b = self.batch
+        r = b.rounds
+        row = len(b)
+        b.ts_min = min(b.ts_min, ended_ms) if row else ended_ms
+        b.ts_max = max(b.ts_max, ended_ms)
+        r["ended_ms"].append(ended_ms)
+        r["started_ms"].append(started_ms)
+        r["room"].append(b.sid(code))
+        r["index"].append(index)
+        r["rounds_total"].append(rounds_total)
+        r["region"].append(b.sid(region))
+        r["country"].append(b.sid(country))
+        r["source"].append(b.sid(source))
+        r["players"].append(players)
+        r["guesses"].append(len(users))
+        r["seed_lat"].append(seed[0])
+        r["seed_lng"].append(seed[1])
+        r["true_lat"].append(true[0])
+        r["true_lng"].append(true[1])
+        g = b.guesses
+        sid = b.sid
+        g["round"].extend([row] * len(users))
+        g["user"].extend([sid(u) for u in users])
+        g["name"].extend([sid(n) for n in names])
+        g["score"].extend(scores)
+        g["lat"].extend(lats)
+        g["lng"].extend(lngs)
+        g["distance_km"].extend(dists)
+        self.rounds += 1
+        self.guesses += len(users)
+
+    def take(self) -> Optional[Batch]:
+        if not len(self.batch):
+            return None
+        b, self.batch = self.batch, Batch()
+        return b
+
+    def write(self, batch: Batch):
+        # в потоке: один блок — одна запись; новый сегмент при старте и по размеру
+        data = batch.encode()
+        if self._f is None or self._size >= self.segment_bytes:
+            self._rotate(batch.ts_min)
+        f = self._f
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        self._size += len(data)
+        self.blocks += 1
+        self.bytes_written += len(data)
+
+    def _rotate(self, ts: int):
+        self.close()
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f"{self.name}-{ts:013d}{SUFFIX}")
+        self._f = open(path, "ab")
+        self._size = self._f.tell()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def segments(self) -> List[str]:
+        # сегменты всех воркеров: каталог общий, блоки дописываются целиком
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []  # ещё не создан или DATA_DIR недоступен
+        return [os.path.join(self.root, n) for n in sorted(names, key=lambda n: n.rsplit("-", 1)[-1])
+                if n.endswith(SUFFIX)]
+
+    def stats(self) -> dict:
+        segs = self.segments()
+        return {
+            "rounds": self.rounds,
+            "guesses": self.guesses,
+            "pending": len(self.batch),
+            "blocks": self.blocks,
+            "bytes_written": self.bytes_written,
+            "segments": len(segs),
+            "segment_bytes": sum(segment_size(p) for p in segs),
+            "exports": self.exports,
+            "exported_rows": self.exported_rows,
+        }
+
+
+def segment_size(path: str) -> int:
+    # сегмент мог исчезнуть между listdir и stat
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+# ---- чтение ----
+
+def _column(buf, off: int, n: int, t: str) -> Tuple[array, int]:
+    a = array(t)
+    end = off + n * a.itemsize
+    a.frombytes(buf[off:end])
+    return a, end
+
+
+def read_block(buf, off: int, code: str = "") -> Optional[dict]:
+    # колонки одного блока; None — в блоке нет комнаты code (тогда читаются только строки и колонка room)
+    _, _, n_rounds, n_guesses, n_strings, _, _, _ = HEADER.unpack_from(buf, off)
+    pos = off + HEADER.size
+    at = {}
+    for cols, n in ((ROUND_COLS, n_rounds), (GUESS_COLS, n_guesses)):
+        for name, t in cols:
+            at[name] = pos
+            pos += n * array(t).itemsize
+    offsets, pos = _column(buf, pos, n_strings + 1, "I")
+    pos += -(pos - off) % 8
+    blob = buf[pos:pos + offsets[-1]]
+    strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8", "replace") for i in range(n_strings)]
+    rooms, _ = _column(buf, at["room"], n_rounds, "I")
+    if code:
+        try:
+            want = strings.index(code)
+        except ValueError:
+            return None
+        if want not in rooms:
+            return None
+    rounds = {name: _column(buf, at[name], n_rounds, t)[0] for name, t in ROUND_COLS if name != "room"}
+    rounds["room"] = rooms
+    guesses = {name: _column(buf, at[name], n_guesses, t)[0] for name, t in GUESS_COLS}
+    return {"rounds": rounds, "guesses": guesses, "strings": strings}
+
+
+def iter_blocks(path: str, t_from: int = 0, t_to: int = 0, code: str = "") -> Iterator[dict]:
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER.size:
+            return
+        mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    try:
+        off = 0
+        while off + HEADER.size <= size:
+            magic, body_len, _, _, _, _, ts_min, ts_max = HEADER.unpack_from(mm, off)
+            end = off + HEADER.size + body_len
+            if magic != MAGIC or end > size:
+                break  # хвост, дописанный не до конца (или чужой файл)
+            if not ((t_from and ts_max < t_from) or (t_to and ts_min >= t_to)):
+                block = read_block(mm, off, code)
+                if block is not None:
+                    yield block
+            off = end
+    finally:
+        mm.close()
+
+
+def iter_rounds(paths: Sequence[str], t_from: int = 0, t_to: int = 0, code: str = "") -> Iterator[dict]:
+    # раунды с ответами, отфильтрованные по комнате и [t_from, t_to) по ended_ms
+    for path in paths:
+        for block in iter_blocks(path, t_from, t_to, code):
+            s = block["strings"]
+            r = block["rounds"]
+            g = block["guesses"]
+            by_round: Dict[int, List[int]] = {}
+            for j, i in enumerate(g["round"]):
+                by_round.setdefault(i, []).append(j)
+            for i in range(len(r["ended_ms"])):
+                ended = r["ended_ms"][i]
+                if (t_from and ended < t_from) or (t_to and ended >= t_to):
+                    continue
+                if code and s[r["room"][i]] != code:
+                    continue
+                yield {
+                    "room": s[r["room"][i]],
+                    "index": r["index"][i],
+                    "rounds_total": r["rounds_total"][i],
+                    "region": s[r["region"][i]],
+                    "country": s[r["country"][i]],
+                    "source": s[r["source"][i]],
+                    "players": r["players"][i],
+                    "started_ms": r["started_ms"][i],
+                    "ended_ms": ended,
+                    "seed_lat": round(r["seed_lat"][i], 5),
+                    "seed_lng": round(r["seed_lng"][i], 5),
+                    "true_lat": round(r["true_lat"][i], 5),
+                    "true_lng": round(r["true_lng"][i], 5),
+                    "guesses": [{
+                        "user_id": s[g["user"][j]],
+                        "name": s[g["name"][j]],
+                        "lat": round(g["lat"][j], 5),
+                        "lng": round(g["lng"][j], 5),
+                        "distance_km": round(g["distance_km"][j], 3),
+                        "score": g["score"][j],
+                    } for j in by_round.get(i, ())],
+                }
+
+
+def export_chunks(paths: Sequence[str], fmt: str = "ndjson", t_from: int = 0, t_to: int = 0, code: str = "",
+                  chunk_bytes: int = 64 << 10) -> Iterator[Tuple[bytes, int]]:
+    # (кусок, строк в нём); ndjson — строка на раунд, csv — строка на ответ
+    # (раунд без ответов — одна строка с пустыми полями ответа)
+    out = io.StringIO()
+    w = csv.writer(out, lineterminator="\n") if fmt == "csv" else None
+    if w:
+        w.writerow(CSV_FIELDS)
+    rows = 0
+    for r in iter_rounds(paths, t_from, t_to, code):
+        if w:
+            head = [r[k] for k in CSV_FIELDS[:13]]
+            for g in r["guesses"] or [None]:
+                w.writerow(head + ([g["user_id"], g["name"], g["lat"], g["lng"], g["distance_km"], g["score"]]
+                                   if g else [""] * 6))
+                rows += 1
+        else:
+            out.write(json.dumps(r, ensure_ascii=False, separators=(",", ":")))
+            out.write("\n")
+            rows += 1
+        if out.tell() >= chunk_bytes:
+            yield out.getvalue().encode(), rows
+            out.seek(0)
+            out.truncate()
+            rows = 0
+    if out.tell():
+        yield out.getvalue().encode(), rows
@@ -0,0 +1,184 @@
+import os
+import mmap
+import math
+import random
+import struct
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+MAGIC = b"FGLM1\n"
+# magic | res, n_countries | коды стран по 2 байта | битовая маска суши | uint8 id страны на клетку
+HEADER = struct.Struct("<HH")
+
+Point = Tuple[float, float]
+
+
+# Растровый индекс суши: сетка res клеток на градус, строки с юга на север.
+# Файл отображается в память (mmap), в RAM живут только списки клеток для
+# областей, которые реально спрашивали.
+class LandMask:
+    def __init__(self, buf, res: int, countries: List[str], bits_off: int, ids_off: int):
+        self.buf = buf
+        self.res = res
+        self.width = 360 * res
+        self.height = 180 * res
+        self.countries = countries
+        self.country_ids = {c: i + 1 for i, c in enumerate(countries)}
+        self._bits_off = bits_off
+        self._ids_off = ids_off
+        self._cells: Dict[Tuple, array] = {}
+
+    @classmethod
+    def open(cls, path: str) -> Optional["LandMask"]:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_buffer(buf)
+
+    @classmethod
+    def from_buffer(cls, buf) -> "LandMask":
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError("not a landmask file")
+        off = len(MAGIC)
+        res, n = HEADER.unpack_from(buf, off)
+        off += HEADER.size
+        countries = [bytes(buf[off + 2 * i: off + 2 * i + 2]).decode() for i in range(n)]
+        off += 2 * n
+        bits_off = off
+        ids_off = bits_off + (360 * res * 180 * res + 7) // 8
+        return cls(buf, res, countries, bits_off, ids_off)
+
+    def cell(self, lat: float, lng: float) -> int:
+        y = min(self.height - 1, max(0, int((lat + 90.0) * self.res)))
+        x = min(self.width - 1, max(0, int((lng + 180.0) * self.res)))
+        return y * self.width + x
+
+    def is_land(self, lat: float, lng: float) -> bool:
+        c = self.cell(lat, lng)
+        return bool(self.buf[self._bits_off + (c >> 3)] & (1 << (c & 7)))
+
+    def country_at(self, lat: float, lng: float) -> str:
+        cid = self.buf[self._ids_off + self.cell(lat, lng)]
+        return self.countries[cid - 1] if cid else ""
+
+    def cells(self, bbox: Sequence[float], country: str = "") -> array:
+        key = (tuple(bbox), country)
+        got = self._cells.get(key)
+        if got is None:
+            got = self._cells[key] = self._collect(bbox, country)
+        return got
+
+    def ready(self, bbox: Sequence[float], country: str = "") -> bool:
+        # список клеток уже собран — sample() не будет сканировать маску
+        return (tuple(bbox), country) in self._cells
+
+    def warm(self, areas: Sequence[Tuple[Sequence[float], str]]):
+        # собрать списки клеток заранее (весь мир — ~0.15 с); зовётся из потока
+        for bbox, country in areas:
+            self.cells(bbox, country)
+
+    def _collect(self, bbox: Sequence[float], country: str) -> array:
+        lat_min, lng_min, lat_max, lng_max = bbox
+        res, w = self.res, self.width
+        y0 = max(0, int((lat_min + 90.0) * res))
+        y1 = min(self.height - 1, int((lat_max + 90.0) * res))
+        x0 = max(0, int((lng_min + 180.0) * res))
+        x1 = min(w - 1, int((lng_max + 180.0) * res))
+        out = array("I")
+        cid = self.country_ids.get(country, -1) if country else 0
+        if cid < 0:
+            return out
+        buf = self.buf
+        for y in range(y0, y1 + 1):
+            base = y * w
+            if cid:
+                row = buf[self._ids_off + base + x0: self._ids_off + base + x1 + 1]
+                i = row.find(bytes((cid,)))
+                while i >= 0:
+                    out.append(base + x0 + i)
+                    i = row.find(bytes((cid,)), i + 1)
+            else:
+                # ширина строки 360*res кратна 8 — строки выровнены по байтам
+                lo, hi = base + x0, base + x1
+                b0 = lo >> 3
+                row = buf[self._bits_off + b0: self._bits_off + (hi >> 3) + 1]
+                for j, byte in enumerate(row):
+                    if not byte:
+                        continue
+                    for k in range(8):
+                        c = ((b0 + j) << 3) + k
+                        if byte & (1 << k) and lo <= c <= hi:
+                            out.append(c)
+        return out
+
+    def sample(self, bbox: Sequence[float], country: str = "", rng=random) -> Optional[Point]:
+        cells = self.cells(bbox, country)
+        if not cells:
+            return None
+        lat_min, lng_min, lat_max, lng_max = bbox
+        step = 1.0 / self.res
+        for _ in range(64):
+            c = cells[rng.randrange(len(cells))]
+            y, x = divmod(c, self.width)
+            lat = -90.0 + (y + rng.random()) * step
+            lng = -180.0 + (x + rng.random()) * step
+            # клетки у полюсов меньше по площади — отбрасываем пропорционально cos(lat)
+            if rng.random() > math.cos(math.radians(lat)):
+                continue
+            if lat_min <= lat <= lat_max and lng_min <= lng <= lng_max:
+                return (lat, lng)
+        return None
+
+
+def build(res: int, countries: List[str], land_cells, country_cells: Dict[str, object]) -> bytes:
+    # land_cells — итерируемые номера клеток суши; country_cells — код -> номера клеток
+    w, h = 360 * res, 180 * res
+    bits = bytearray((w * h + 7) // 8)
+    ids = bytearray(w * h)
+    for c in land_cells:
+        bits[c >> 3] |= 1 << (c & 7)
+    for i, code in enumerate(countries):
+        for c in country_cells.get(code, ()):
+            ids[c] = i + 1
+    head = MAGIC + HEADER.pack(res, len(countries)) + b"".join(c.encode()[:2].ljust(2) for c in countries)
+    return head + bytes(bits) + bytes(ids)
+
+
+def rasterize_rings(rings: Sequence[Sequence[Sequence[float]]], res: int) -> List[int]:
+    # скан-линии по центрам клеток, правило even-odd (дыры полигона учитываются)
+    w = 360 * res
+    ys = [pt[1] for ring in rings for pt in ring]
+    if not ys:
+        return []
+    y0 = max(0, int((min(ys) + 90.0) * res))
+    y1 = min(180 * res - 1, int((max(ys) + 90.0) * res))
+    edges = []
+    for ring in rings:
+        for i in range(len(ring) - 1):
+            (ax, ay), (bx, by) = ring[i][:2], ring[i + 1][:2]
+            if ay != by:
+                edges.append((ax, ay, bx, by))
+    out = []
+    for y in range(y0, y1 + 1):
+        lat = -90.0 + (y + 0.5) / res
+        xs = []
+        for ax, ay, bx, by in edges:
+            if (ay <= lat < by) or (by <= lat < ay):
+                xs.append(ax + (lat - ay) * (bx - ax) / (by - ay))
+        xs.sort()
+        for j in range(0, len(xs) - 1, 2):
+            c0 = max(0, math.ceil((xs[j] + 180.0) * res - 0.5))
+            c1 = min(w - 1, math.floor((xs[j + 1] + 180.0) * res - 0.5))
+            out.extend(range(y * w + c0, y * w + c1 + 1))
+    return out
+
+
+def write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
@@ -0,0 +1,51 @@
+from bisect import bisect_left, insort
+from typing import Iterable, Iterator, List, Tuple
+
+
+# Таблица мест: отсортированный список ключей (-score, idx), где idx — номер
+# игрока в комнате. Порядок совпадает с sorted(..., reverse=True) по очкам,
+# который стабилен по порядку входа. Обновляется только при смене очков.
+class Leaderboard:
+    __slots__ = ("_keys",)
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterator[int]:
+        for _, idx in self._keys:
+            yield idx
+
+    def add(self, idx: int, score: int = 0):
+        insort(self._keys, (-score, idx))
+
+    def update(self, idx: int, old: int, new: int):
+        if old == new:
+            return
+        keys = self._keys
+        i = bisect_left(keys, (-old, idx))
+        if i < len(keys) and keys[i] == (-old, idx):
+            del keys[i]
+        insort(keys, (-new, idx))
+
+    def update_many(self, changes: Iterable[Tuple[int, int, int]], scores: List[int]):
+        # changes: (idx, old, new); scores — текущие очки всех по idx.
+        # Если меняется заметная доля таблицы, дешевле пересобрать одной сортировкой.
+        changes = [c for c in changes if c[1] != c[2]]
+        if len(changes) * 16 > len(self._keys):
+            self.rebuild(scores)
+            return
+        for idx, old, new in changes:
+            self.update(idx, old, new)
+
+    def rebuild(self, scores: List[int]):
+        self._keys = sorted((-s, i) for i, s in enumerate(scores))
+
+    def rank(self, idx: int, score: int) -> int:
+        # место с 1
+        return bisect_left(self._keys, (-score, idx)) + 1
+
+    def top(self, n: int) -> List[int]:
+        return [idx for _, idx in self._keys[:n]]
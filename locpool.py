@@ -0,0 +1,184 @@
+import os
+import random
+import struct
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Point = Tuple[float, float]
+
+MAGIC = b"FGPL1\n"
+
+
+def f32(x: float) -> float:
+    # значение в том виде, в каком оно ляжет в пул/файл
+    return array("f", (x,))[0]
+
+
+def point_key(lat: float, lng: float) -> Tuple[float, float]:
+    # ~10 м: одна и та же панорама не попадёт в пул дважды
+    return (round(lat, 4), round(lng, 4))
+
+
+# Пул проверенных точек (там, где у хоста нашлась панорама) по ключам
+# областей: "R:<REGION>" / "C:<COUNTRY>". Точка попадает во все области,
+# в bbox которых лежит; с country_at (маска стран) — в "C:xx" только если
+# по маске это страна xx: bbox соседей перекрываются (Торонто — в bbox США).
+# На диске — компактный бинарник: float32 пары.
+class LocationPool:
+    def __init__(self, areas: Dict[str, Sequence[float]], per_key: int = 5000,
+                 country_at: Optional[Callable[[float, float], str]] = None):
+        self.areas = dict(areas)
+        self.per_key = per_key
+        self.country_at = country_at
+        self.points: Dict[str, array] = {k: array("f") for k in self.areas}
+        self._known: Dict[str, set] = {k: set() for k in self.areas}
+        self._next: Dict[str, int] = {k: 0 for k in self.areas}
+        self.dirty = False
+
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+        self.discarded = 0
+        self.rounds_pool = 0
+        self.rounds_random = 0
+        self.rerolls_pool = 0
+        self.rerolls_random = 0
+
+    def __len__(self) -> int:
+        return sum(len(a) // 2 for a in self.points.values())
+
+    def areas_for(self, lat: float, lng: float) -> List[str]:
+        out = []
+        for k, (lat_min, lng_min, lat_max, lng_max) in self.areas.items():
+            if lat_min <= lat <= lat_max and lng_min <= lng <= lng_max and self.fits(k, lat, lng):
+                out.append(k)
+        return out
+
+    def fits(self, k: str, lat: float, lng: float) -> bool:
+        return self.country_at is None or not k.startswith("C:") or self.country_at(lat, lng) == k[2:]
+
+    def add(self, lat: float, lng: float) -> int:
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+            return 0
+        n = 0
+        for k in self.areas_for(lat, lng):
+            if self._add(k, lat, lng):
+                n += 1
+        if n:
+            self.added += 1
+            self.dirty = True
+        return n
+
+    def _add(self, k: str, lat: float, lng: float) -> bool:
+        lat, lng = f32(lat), f32(lng)
+        pk = point_key(lat, lng)
+        known = self._known[k]
+        if pk in known:
+            return False
+        pts = self.points[k]
+        if len(pts) // 2 < self.per_key:
+            pts.append(lat)
+            pts.append(lng)
+        else:
+            # пул полон — перезаписываем по кругу самые старые
+            i = self._next[k]
+            known.discard(point_key(pts[2 * i], pts[2 * i + 1]))
+            pts[2 * i] = lat
+            pts[2 * i + 1] = lng
+            self._next[k] = (i + 1) % self.per_key
+        known.add(pk)
+        return True
+
+    def draw(self, k: str, exclude: Iterable = (), rng=random) -> Optional[Point]:
+        pts = self.points.get(k)
+        n = len(pts) // 2 if pts is not None else 0
+        if n:
+            exclude = set(exclude)
+            for _ in range(8):
+                i = rng.randrange(n)
+                pt = (pts[2 * i], pts[2 * i + 1])
+                if point_key(*pt) not in exclude and self.fits(k, *pt):
+                    self.hits += 1
+                    return pt
+        self.misses += 1
+        return None
+
+    def discard(self, lat: float, lng: float):
+        # точка из пула не дала панораму — выкидываем её отовсюду
+        pk = point_key(f32(lat), f32(lng))
+        for k in self.areas_for(lat, lng):
+            if pk not in self._known[k]:
+                continue
+            pts = self.points[k]
+            keep = array("f")
+            for i in range(0, len(pts), 2):
+                if point_key(pts[i], pts[i + 1]) != pk:
+                    keep.append(pts[i])
+                    keep.append(pts[i + 1])
+            self.points[k] = keep
+            self._known[k].discard(pk)
+            self._next[k] = 0
+            self.discarded += 1
+            self.dirty = True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "points": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "added": self.added,
+            "discarded": self.discarded,
+            "rounds_pool": self.rounds_pool,
+            "rounds_random": self.rounds_random,
+            "rerolls_pool": self.rerolls_pool,
+            "rerolls_random": self.rerolls_random,
+        }
+
+    # ---- диск ----
+
+    def dump(self) -> bytes:
+        out = [MAGIC]
+        for k, pts in self.points.items():
+            kb = k.encode()
+            out.append(struct.pack("<BI", len(kb), len(pts) // 2))
+            out.append(kb)
+            out.append(pts.tobytes())
+        self.dirty = False
+        return b"".join(out)
+
+    def load_bytes(self, data: bytes):
+        if not data.startswith(MAGIC):
+            return
+        off = len(MAGIC)
+        while off < len(data):
+            klen, n = struct.unpack_from("<BI", data, off)
+            off += 5
+            k = data[off:off + klen].decode()
+            off += klen
+            pts = array("f")
+            pts.frombytes(data[off:off + n * 8])
+            off += n * 8
+            if k not in self.areas:
+                continue
+            # файл мог быть сохранён без маски — чужие точки в "C:xx" не берём
+            for i in range(0, len(pts), 2):
+                if self.fits(k, pts[i], pts[i + 1]):
+                    self._add(k, pts[i], pts[i + 1])
+
+    def load(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                self.load_bytes(f.read())
+        except OSError:
+            pass  # нет файла или DATA_DIR недоступен — начинаем с пустого пула
+
+
+def write_file(path: str, data: bytes):
+    # атомарно: tmp + rename, чтобы падение не оставило битый файл
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
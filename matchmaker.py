@@ -0,0 +1,165 @@
+import secrets
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+Bucket = Tuple[str, str]  # (регион, страна)
+
+
+class Ticket:
+    __slots__ = ("id", "user_id", "name", "bucket", "enqueued_ms", "seen_ms", "result", "waiter", "cancelled")
+
+    def __init__(self, user_id: str, name: str, bucket: Bucket, now: int):
+        self.id = secrets.token_urlsafe(12)
+        self.user_id = user_id
+        self.name = name
+        self.bucket = bucket
+        self.enqueued_ms = now
+        self.seen_ms = now  # последний опрос клиента; брошенные билеты выкидываются
+        self.result: Optional[Any] = None  # что отдать клиенту после матча (комната, ссылка)
+        self.waiter: Optional[Any] = None  # future ожидающего long-poll, если он есть
+        self.cancelled = False
+
+
+# Очередь быстрой игры: своя deque на корзину (регион, страна), игроки в
+# порядке прихода. Вход и выход из очереди — O(1): отменённый билет только
+# помечается и выкидывается, когда дойдёт до головы, поэтому живых в
+# корзине считаем отдельно. Матч — первые size живых; если столько не
+# набирается дольше wait_ms, матчатся те, кто есть (не меньше min_size).
+class Matchmaker:
+    def __init__(self, size: int = 8, min_size: int = 2, wait_ms: int = 15000, ttl_ms: int = 60000):
+        self.size = max(2, size)
+        self.min_size = max(1, min(min_size, self.size))
+        self.wait_ms = wait_ms
+        self.ttl_ms = ttl_ms
+        self.queues: Dict[Bucket, Deque[Ticket]] = {}
+        self.live: Dict[Bucket, int] = {}
+        self.tickets: Dict[str, Ticket] = {}  # и ждущие, и сматченные (пока клиент не забрал результат)
+        self.by_user: Dict[str, Ticket] = {}
+        self.matched: Deque[Ticket] = deque()  # в порядке матча, пока клиент не забрал результат
+
+        self.enqueued = 0
+        self.matches = 0
+        self.partial = 0
+        self.placed = 0
+        self.expired = 0
+        self.wait_total_ms = 0
+
+    def __len__(self) -> int:
+        return sum(self.live.values())
+
+    def enqueue(self, user_id: str, name: str, bucket: Bucket, now: int) -> Ticket:
+        t = self.by_user.get(user_id)
+        if t is not None and not t.cancelled:
+            if t.result is None and t.bucket != bucket:
+                self.cancel(t)  # сменил регион — встаёт в конец другой очереди
+            else:
+                t.seen_ms = now
+                return t
+        t = Ticket(user_id, name, bucket, now)
+        self.tickets[t.id] = t
+        self.by_user[user_id] = t
+        q = self.queues.get(bucket)
+        if q is None:
+            q = self.queues[bucket] = deque()
+        q.append(t)
+        self.live[bucket] = self.live.get(bucket, 0) + 1
+        self.enqueued += 1
+        return t
+
+    def cancel(self, t: Ticket):
+        if t.cancelled:
+            return
+        t.cancelled = True
+        if t.result is None:
+            self.live[t.bucket] -= 1
+        self.forget(t)
+
+    def forget(self, t: Ticket):
+        self.tickets.pop(t.id, None)
+        if self.by_user.get(t.user_id) is t:
+            del self.by_user[t.user_id]
+
+    def stale(self, t: Ticket, now: int) -> bool:
+        # клиент перестал опрашивать (и сейчас не ждёт в long-poll) — место ему больше не держим
+        return t.waiter is None and now - t.seen_ms > self.ttl_ms
+
+    def _expire(self, t: Ticket):
+        self.cancel(t)
+        self.expired += 1
+
+    def _take(self, bucket: Bucket, n: int, now: int) -> List[Ticket]:
+        # до n живых из головы; брошенные по дороге выкидываются
+        q = self.queues[bucket]
+        out = []
+        while q and len(out) < n:
+            t = q.popleft()
+            if t.cancelled:
+                continue
+            if self.stale(t, now):
+                self._expire(t)
+                continue
+            out.append(t)
+        self.live[bucket] -= len(out)
+        return out
+
+    def _match(self, group: List[Ticket], now: int) -> List[Ticket]:
+        for t in group:
+            self.wait_total_ms += now - t.enqueued_ms
+        self.matched.extend(group)
+        self.matches += 1
+        self.placed += len(group)
+        return group
+
+    def _put_back(self, bucket: Bucket, group: List[Ticket]):
+        self.queues[bucket].extendleft(reversed(group))
+        self.live[bucket] += len(group)
+
+    def ready(self, bucket: Bucket, now: int) -> List[List[Ticket]]:
+        # полные группы в корзине (зовётся при каждом входе в очередь)
+        out = []
+        while self.live.get(bucket, 0) >= self.size:
+            group = self._take(bucket, self.size, now)
+            if len(group) < self.size:
+                self._put_back(bucket, group)  # добрали брошенных — ждём дальше
+                break
+            out.append(self._match(group, now))
+        return out
+
+    def due(self, now: int) -> List[List[Ticket]]:
+        # периодически: полные группы, неполные по таймауту и чистка брошенных билетов
+        out = []
+        for bucket, q in self.queues.items():
+            out.extend(self.ready(bucket, now))
+            while q and (q[0].cancelled or self.stale(q[0], now)):
+                t = q.popleft()
+                if not t.cancelled:
+                    self._expire(t)
+            n = self.live.get(bucket, 0)
+            if q and n >= self.min_size and now - q[0].enqueued_ms >= self.wait_ms:
+                group = self._take(bucket, n, now)
+                if len(group) >= self.min_size:
+                    self.partial += 1
+                    out.append(self._match(group, now))
+                else:
+                    self._put_back(bucket, group)
+        # сматченные билеты, за которыми так и не пришли
+        m = self.matched
+        while m and (m[0].id not in self.tickets or self.stale(m[0], now)):
+            self.forget(m.popleft())
+        return out
+
+    def position(self, t: Ticket) -> int:
+        # живых в корзине (точное место стоило бы O(n), клиенту хватает «сколько ждут»)
+        return self.live.get(t.bucket, 0)
+
+    def stats(self) -> dict:
+        return {
+            "waiting": len(self),
+            "buckets": sum(1 for n in self.live.values() if n),
+            "enqueued": self.enqueued,
+            "matches": self.matches,
+            "partial": self.partial,
+            "placed": self.placed,
+            "expired": self.expired,
+            "avg_wait_ms": self.wait_total_ms // self.placed if self.placed else None,
+        }
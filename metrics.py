@@ -0,0 +1,124 @@
+import time
+import asyncio
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Метрики в текстовом формате Prometheus без внешних зависимостей.
+# observe() — bisect по границам и три сложения, на горячем пути это
+# дешевле одного json.dumps. Всё в секундах/байтах, как принято в Prometheus.
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+FANOUT_BUCKETS = (1, 2, 5, 10, 30, 100, 300, 1000, 3000, 10000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def lines(self, name: str, labels: str = "") -> List[str]:
+        sep = "," if labels else ""
+        out = []
+        acc = 0
+        for le, n in zip(self.buckets, self.counts):
+            acc += n
+            out.append(f'{name}_bucket{{{labels}{sep}le="{le:g}"}} {acc}')
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lb = f"{{{labels}}}" if labels else ""
+        out.append(f"{name}_sum{lb} {self.sum:.6g}")
+        out.append(f"{name}_count{lb} {self.count}")
+        return out
+
+
+class Family:
+    # гистограмма с одной меткой (например, тип сообщения); без метки — один ребёнок ""
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                 label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self.children: Dict[str, Histogram] = {}
+        self._plain = None if label else self.child("")
+
+    def child(self, value: str) -> Histogram:
+        h = self.children.get(value)
+        if h is None:
+            h = self.children[value] = Histogram(self.buckets)
+        return h
+
+    def observe(self, v: float):
+        self._plain.observe(v)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, h in sorted(self.children.items()):
+            out.extend(h.lines(self.name, f'{self.label}="{value}"' if self.label else ""))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.families: List[Family] = []
+        # значения, которые дешевле посчитать в момент scrape: (имя, тип, help, значение)
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, str, float]]]] = []
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                  label: Optional[str] = None) -> Family:
+        f = Family(name, help, buckets, label)
+        self.families.append(f)
+        return f
+
+    def render(self) -> str:
+        out = []
+        for f in self.families:
+            out.extend(f.render())
+        for collect in self.collectors:
+            for name, kind, help, value in collect():
+                out.append(f"# HELP {name} {help}")
+                out.append(f"# TYPE {name} {kind}")
+                out.append(f"{name} {value:.6g}" if isinstance(value, float) else f"{name} {value}")
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+
+LOCK_WAIT = REGISTRY.histogram("freeguessr_room_lock_wait_seconds", "Time spent waiting for a room lock")
+LOCK_HOLD = REGISTRY.histogram("freeguessr_room_lock_hold_seconds", "Time a room lock was held")
+BROADCAST = REGISTRY.histogram("freeguessr_broadcast_seconds", "Time to encode and enqueue one broadcast")
+BROADCAST_FANOUT = REGISTRY.histogram("freeguessr_broadcast_fanout", "Sockets a broadcast frame was queued to",
+                                      FANOUT_BUCKETS)
+STATE_BUILD = REGISTRY.histogram("freeguessr_state_build_seconds", "Time to build a full state frame")
+STATE_BYTES = REGISTRY.histogram("freeguessr_state_bytes", "Size of a full state frame", BYTES_BUCKETS)
+MESSAGE = REGISTRY.histogram("freeguessr_ws_message_seconds",
+                             "Time to handle one client message, including the room lock wait", label="type")
+SCHEDULER_DRIFT = REGISTRY.histogram("freeguessr_scheduler_drift_seconds",
+                                     "How late scheduled callbacks (phase timers, ticks) fired")
+
+
+class TimedLock(asyncio.Lock):
+    # лок комнаты, который пишет ожидание и удержание в LOCK_WAIT / LOCK_HOLD
+    # (меряется `async with`; ~2 мкс сверху на вход в секцию)
+    def __init__(self):
+        super().__init__()
+        self._held_at = 0.0
+
+    async def __aenter__(self):
+        t0 = time.perf_counter()
+        await self.acquire()
+        self._held_at = t1 = time.perf_counter()
+        LOCK_WAIT.observe(t1 - t0)
+
+    async def __aexit__(self, *exc):
+        LOCK_HOLD.observe(time.perf_counter() - self._held_at)
+        self.release()
@@ -0,0 +1,80 @@
+import time
+from typing import Dict, Optional, Tuple
+
+# Лимиты входящих сообщений: (токенов в секунду, ёмкость ведра).
+# Ключ — поле t; неизвестные типы делят одно ведро "*", чтобы мусорные t
+# не плодили записи. None — без лимита на этом уровне.
+Limits = Dict[str, Optional[Tuple[float, float]]]
+
+# на сокет: обычный клиент шлёт guess раз в раунд, resync — после дыры в версиях
+CONN_LIMITS: Limits = {
+    "frame": (20, 40),  # любой кадр, ещё до разбора
+    "guess": (2, 5),
+    "resync": (1, 3),
+    "set_settings": (5, 10),
+    "pano_ready": (2, 5),
+    "reroll": (3, 10),  # хост сам перебрасывает точку до 10 раз, пока не найдёт панораму
+    "start_game": (1, 3),
+    "*": (2, 5),
+}
+
+# на комнату: то, что дорого для всех (полный state, рассылка каждому) или шлёт только хост.
+# guess не ограничен — каждый игрок отвечает раз в раунд, от спама защищает лимит сокета
+ROOM_LIMITS: Limits = {
+    "guess": None,
+    "resync": (20, 60),
+    "set_settings": (5, 10),
+    "pano_ready": (5, 10),
+    "reroll": (3, 10),
+    "start_game": (1, 3),
+    "*": (20, 40),
+}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now: float) -> bool:
+        tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if tokens < 1.0:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1.0
+        return True
+
+    def wait(self, now: float) -> float:
+        # секунд до следующего токена
+        tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        return max(0.0, (1.0 - tokens) / self.rate)
+
+
+class Limiter:
+    __slots__ = ("limits", "buckets")
+
+    def __init__(self, limits: Limits):
+        self.limits = limits
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def allow(self, key, now: Optional[float] = None) -> bool:
+        if key not in self.limits:
+            key = "*"
+        b = self.buckets.get(key)
+        if b is None:
+            limit = self.limits.get(key)
+            if limit is None:
+                return True
+            b = self.buckets[key] = TokenBucket(limit[0], limit[1], time.monotonic() if now is None else now)
+        return b.take(time.monotonic() if now is None else now)
+
+    def wait(self, key, now: Optional[float] = None) -> float:
+        if key not in self.limits:
+            key = "*"
+        b = self.buckets.get(key)
+        return b.wait(time.monotonic() if now is None else now) if b else 0.0
@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import signal
+import time
+import asyncio
+import hashlib
+import itertools
+import subprocess
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# Несколько процессов-воркеров за одним портом. Комната живёт в одном воркере:
+# владелец определяется по коду (room_owner), и воркер генерирует только коды,
+# которые принадлежат ему самому. Роутер читает первую строку и заголовки
+# запроса, выбирает воркер и дальше просто перекачивает байты через Unix-сокет
+# (WebSocket не разбирается — кадры идут насквозь).
+
+HEAD_LIMIT = 64 * 1024
+PIPE_CHUNK = 64 * 1024
+
+
+def room_owner(code: str, workers: int) -> int:
+    # не crc32: им уже шардируется ROOMS внутри процесса, иначе шарды воркера перекосятся
+    h = hashlib.blake2b(code.upper().encode(), digest_size=4).digest()
+    return int.from_bytes(h, "little") % workers
+
+
+def parse_head(head: bytes) -> Tuple[str, str, Dict[str, str], bool]:
+    lines = head.split(b"\r\n")
+    method, target, _ = lines[0].decode("latin-1").split(" ", 2)
+    u = urlsplit(target)
+    query = {k: v[0] for k, v in parse_qs(u.query).items()}
+    upgrade = any(ln.lower().startswith(b"upgrade:") and b"websocket" in ln.lower() for ln in lines[1:])
+    return method, u.path, query, upgrade
+
+
+def force_close(head: bytes) -> bytes:
+    # обычный HTTP — один запрос на соединение: следующий запрос мог бы
+    # относиться к комнате другого воркера
+    lines = [ln for ln in head[:-4].split(b"\r\n") if not ln.lower().startswith(b"connection:")]
+    return b"\r\n".join(lines) + b"\r\nConnection: close\r\n\r\n"
+
+
+def add_label(sample: str, label: str) -> str:
+    # name{a="b"} 1 -> name{worker="0",a="b"} 1; name 1 -> name{worker="0"} 1
+    head, value = sample.rsplit(" ", 1)
+    if head.endswith("}"):
+        name, labels = head[:-1].split("{", 1)
+        return f"{name}{{{label},{labels}}} {value}"
+    return f"{head}{{{label}}} {value}"
+
+
+def merge_metrics(texts: List[str]) -> str:
+    # одно семейство — один HELP/TYPE и все сэмплы подряд, у каждого метка worker
+    fams: Dict[str, Tuple[List[str], List[str]]] = {}
+    for i, text in enumerate(texts):
+        cur = None
+        for ln in text.splitlines():
+            if ln.startswith("# HELP "):
+                cur = ln.split(" ", 3)[2]
+                if cur not in fams:
+                    fams[cur] = ([ln], [])
+                    continue
+            if ln.startswith("#"):
+                if ln.startswith("# TYPE ") and len(fams[cur][0]) < 2:
+                    fams[cur][0].append(ln)
+                continue
+            if ln and cur is not None:
+                fams[cur][1].append(add_label(ln, f'worker="{i}"'))
+    out = []
+    for head, samples in fams.values():
+        out.extend(head)
+        out.extend(samples)
+    return "\n".join(out) + "\n"
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(PIPE_CHUNK)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+class Router:
+    def __init__(self, workers: int, run_dir: str):
+        self.workers = workers
+        self.sockets = [os.path.join(run_dir, f"worker-{i}.sock") for i in range(workers)]
+        self._rr = itertools.cycle(range(workers))
+        self.procs: List[Optional[subprocess.Popen]] = [None] * workers
+
+        self.connections = 0
+        self.ws_connections = 0
+        self.errors = 0
+        self.restarts = 0
+
+    def pick(self, path: str, query: Dict[str, str]) -> int:
+        code = query.get("room") if path == "/ws" else None
+        if code:
+            return room_owner(code, self.workers)
+        if path == "/api/quickplay":
+            # одна очередь на все воркеры; комнаты из неё создаёт (и владеет ими) воркер 0
+            return 0
+        # всё остальное (страницы, статика, создание комнаты) — по кругу
+        return next(self._rr)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            _, path, query, upgrade = parse_head(head)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            writer.close()
+            return
+        if path == "/healthz" and not upgrade:
+            await self.healthz(writer)
+            return
+        if path == "/metrics" and not upgrade:
+            await self.metrics(writer)
+            return
+        w = self.pick(path, query)
+        try:
+            ur, uw = await asyncio.open_unix_connection(self.sockets[w], limit=HEAD_LIMIT)
+        except OSError:
+            self.errors += 1
+            writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            writer.close()
+            return
+        if upgrade:
+            self.ws_connections += 1
+        else:
+            head = force_close(head)
+        uw.write(head)
+        up = asyncio.ensure_future(pipe(reader, uw))
+        down = asyncio.ensure_future(pipe(ur, writer))
+        # ответ воркера закончился (или сокет закрылся) — запрос клиента больше не нужен
+        await down
+        up.cancel()
+        if upgrade:
+            self.ws_connections -= 1
+
+    async def worker_get(self, i: int, path: str) -> bytes:
+        r, w = await asyncio.open_unix_connection(self.sockets[i])
+        w.write(b"GET %s HTTP/1.1\r\nHost: worker\r\nConnection: close\r\n\r\n" % path.encode())
+        data = await asyncio.wait_for(r.read(), 2.0)
+        w.close()
+        return data.split(b"\r\n\r\n", 1)[1]
+
+    async def worker_health(self, i: int) -> dict:
+        try:
+            return json.loads(await self.worker_get(i, "/healthz"))
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+            return {"ok": False}
+
+    async def worker_metrics(self, i: int) -> str:
+        try:
+            return (await self.worker_get(i, "/metrics")).decode()
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+            return ""
+
+    async def metrics(self, writer: asyncio.StreamWriter):
+        per = await asyncio.gather(*(self.worker_metrics(i) for i in range(self.workers)))
+        own = "".join(
+            f"# HELP freeguessr_router_{k} Router {k.replace('_', ' ')}\n"
+            f"# TYPE freeguessr_router_{k} {kind}\nfreeguessr_router_{k} {v}\n"
+            for k, kind, v in (("connections_total", "counter", self.connections),
+                               ("ws_connections", "gauge", self.ws_connections),
+                               ("errors_total", "counter", self.errors),
+                               ("restarts_total", "counter", self.restarts)))
+        body = (merge_metrics(per) + own).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                     b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+        await writer.drain()
+        writer.close()
+
+    async def healthz(self, writer: asyncio.StreamWriter):
+        per = await asyncio.gather(*(self.worker_health(i) for i in range(self.workers)))
+        out = {"ok": all(h.get("ok") for h in per), "ts": int(time.time()), "workers": self.workers}
+        for key in ("rooms", "players", "sockets", "spectators", "evicted"):
+            out[key] = sum(h.get(key, 0) for h in per)
+        out["router"] = {
+            "connections": self.connections,
+            "ws_connections": self.ws_connections,
+            "errors": self.errors,
+            "restarts": self.restarts,
+        }
+        out["per_worker"] = per
+        body = json.dumps(out).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+        await writer.drain()
+        writer.close()
+
+    # ---- воркеры ----
+
+    def spawn(self, i: int, env: Dict[str, str]):
+        try:
+            os.unlink(self.sockets[i])
+        except FileNotFoundError:
+            pass
+        wenv = dict(env, WORKERS=str(self.workers), WORKER_INDEX=str(i), WORKER_SOCKET=self.sockets[i])
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+        self.procs[i] = subprocess.Popen([sys.executable, script], env=wenv)
+
+    async def supervise(self, env: Dict[str, str]):
+        # упавший воркер поднимается заново и восстанавливает свои комнаты из журнала
+        while True:
+            await asyncio.sleep(1.0)
+            for i, p in enumerate(self.procs):
+                if p is not None and p.poll() is not None:
+                    self.restarts += 1
+                    self.spawn(i, env)
+
+    async def wait_ready(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while not all(os.path.exists(s) for s in self.sockets):
+            if time.monotonic() > deadline:
+                raise RuntimeError("workers did not start")
+            await asyncio.sleep(0.05)
+
+    def stop(self):
+        for p in self.procs:
+            if p is not None and p.poll() is None:
+                p.terminate()
+        for p in self.procs:
+            if p is not None:
+                try:
+                    p.wait(10)
+                except subprocess.TimeoutExpired:
+                    p.kill()
+
+
+async def serve(host: str, port: int, workers: int, run_dir: str, env: Dict[str, str]):
+    os.makedirs(run_dir, exist_ok=True)
+    router = Router(workers, run_dir)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    for i in range(workers):
+        router.spawn(i, env)
+    try:
+        await router.wait_ready()
+        supervisor = asyncio.ensure_future(router.supervise(env))
+        srv = await asyncio.start_server(router.handle, host, port, limit=HEAD_LIMIT)
+        print(f"router on {host}:{port}, {workers} workers", flush=True)
+        await stop.wait()
+        supervisor.cancel()
+        srv.close()
+    finally:
+        # воркеры по SIGTERM штатно сбрасывают журнал и пул
+        router.stop()
+
+
+def main(host: str, port: int, workers: int, run_dir: str, env: Dict[str, str]):
+    asyncio.run(serve(host, port, workers, run_dir, env))
@@ -0,0 +1,142 @@
+import time
+import heapq
+import asyncio
+import itertools
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+def wall_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class VirtualClock:
+    # часы для симуляции: время стоит, пока его не сдвинут (см. Scheduler(manual=True))
+    __slots__ = ("now",)
+
+    def __init__(self, start_ms: int = 0):
+        self.now = start_ms
+
+    def __call__(self) -> int:
+        return self.now
+
+
+class _Entry:
+    __slots__ = ("when", "seq", "key", "fn", "alive", "added")
+
+    def __init__(self, when: int, seq: int, key: Hashable, fn: Callable[[], Awaitable[Any]], added: int):
+        self.when = when
+        self.added = added
+        self.seq = seq
+        self.key = key
+        self.fn = fn
+        self.alive = True
+
+    def __lt__(self, other: "_Entry") -> bool:
+        return (self.when, self.seq) < (other.when, other.seq)
+
+
+# Один планировщик дедлайнов на процесс: heap по времени + один таймер цикла
+# на ближайший дедлайн. Никто не просыпается, пока ничего не произошло.
+# У записи есть ключ: повторный call_at с тем же ключом заменяет старую запись.
+# manual=True — таймеры цикла не ставятся, дедлайны разбирает внешний драйвер
+# через pop_due (виртуальное время, bench/bench_sim.py).
+class Scheduler:
+    def __init__(self, clock: Callable[[], int] = wall_ms, on_drift: Optional[Callable[[int], None]] = None,
+                 manual: bool = False):
+        self.clock = clock
+        self.manual = manual
+        self.on_drift = on_drift  # сколько мс опоздал каждый сработавший колбэк (для метрик)
+        self._heap: List[_Entry] = []
+        self._by_key: Dict[Hashable, _Entry] = {}
+        self._seq = itertools.count()
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._armed_at: Optional[int] = None
+        self.fired = 0
+        self.max_drift_ms = 0
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def call_at(self, when_ms: int, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        self.cancel(key)
+        e = _Entry(int(when_ms), next(self._seq), key, fn, self.clock())
+        self._by_key[key] = e
+        heapq.heappush(self._heap, e)
+        if self._armed_at is None or e.when < self._armed_at:
+            self._arm()
+
+    def call_later(self, delay_ms: int, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        self.call_at(self.clock() + delay_ms, key, fn)
+
+    def cancel(self, key: Hashable) -> bool:
+        e = self._by_key.pop(key, None)
+        if e is None:
+            return False
+        e.alive = False
+        return True
+
+    def pending(self, key: Hashable) -> Optional[int]:
+        e = self._by_key.get(key)
+        return e.when if e else None
+
+    def next_deadline(self) -> Optional[int]:
+        heap = self._heap
+        while heap and not heap[0].alive:
+            heapq.heappop(heap)
+        return heap[0].when if heap else None
+
+    def set_clock(self, clock: Callable[[], int], manual: bool = False):
+        self.clock = clock
+        self.manual = manual
+        self._arm()
+
+    def run_due(self, now: Optional[int] = None) -> List[asyncio.Task]:
+        # запускает всё, что созрело к now, в порядке дедлайнов; колбэки — отдельными тасками
+        return [asyncio.ensure_future(e.fn()) for e in self.pop_due(now)]
+
+    def pop_due(self, now: Optional[int] = None) -> List[_Entry]:
+        # снимает с кучи всё, что созрело к now, в порядке (дедлайн, порядок постановки)
+        now = self.clock() if now is None else now
+        due = []
+        heap = self._heap
+        while heap and (not heap[0].alive or heap[0].when <= now):
+            e = heapq.heappop(heap)
+            if not e.alive:
+                continue
+            e.alive = False
+            if self._by_key.get(e.key) is e:
+                del self._by_key[e.key]
+            self.fired += 1
+            # дедлайн, поставленный уже в прошлом (восстановление после простоя), опозданием не считаем
+            drift = now - max(e.when, e.added)
+            self.max_drift_ms = max(self.max_drift_ms, drift)
+            if self.on_drift is not None:
+                self.on_drift(drift)
+            due.append(e)
+        return due
+
+    def start(self):
+        # для записей, добавленных до запуска цикла (например, при восстановлении)
+        self._arm()
+
+    def _arm(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._armed_at = None
+        when = self.next_deadline()
+        if when is None or self.manual:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = max(0.0, (when - self.clock()) / 1000)
+        self._armed_at = when
+        self._handle = loop.call_later(delay, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        self._armed_at = None
+        self.run_due()
+        self._arm()
@@ -0,0 +1,96 @@
+import math
+import heapq
+from array import array
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy опционален: без него считаем в цикле
+    np = None
+
+EARTH_R_KM = 6371.0
+# меньше этого numpy не окупает накладные расходы на массивы
+NUMPY_MIN = 64
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1 = a
+    lat2, lon2 = b
+    R = EARTH_R_KM
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    x = (math.sin(dlat / 2) ** 2) + math.cos(p1) * math.cos(p2) * (math.sin(dlon / 2) ** 2)
+    return 2 * R * math.asin(min(1.0, math.sqrt(x)))
+
+
+def score_from_distance_km(d: float) -> int:
+    # “геогесср-подобная” кривая: близко -> много, далеко -> мало
+    s = 5000.0 * math.exp(-d / 2000.0)
+    return int(max(0, min(5000, round(s))))
+
+
+# Ответы раунда колонками: номер игрока в комнате, lat, lng.
+class GuessColumns:
+    __slots__ = ("idx", "lat", "lng")
+
+    def __init__(self):
+        self.idx = array("i")
+        self.lat = array("d")
+        self.lng = array("d")
+
+    def __len__(self) -> int:
+        return len(self.idx)
+
+    def add(self, idx: int, lat: float, lng: float):
+        self.idx.append(idx)
+        self.lat.append(lat)
+        self.lng.append(lng)
+
+    def clear(self):
+        del self.idx[:]
+        del self.lat[:]
+        del self.lng[:]
+
+
+def score_batch(true_lat: float, true_lng: float, lats: Sequence[float], lngs: Sequence[float]
+                ) -> Tuple[Sequence[float], Sequence[int]]:
+    # расстояния и очки для всех ответов за один проход
+    n = len(lats)
+    if np is not None and n >= NUMPY_MIN:
+        la = np.radians(np.asarray(lats, dtype=np.float64))
+        lo = np.radians(np.asarray(lngs, dtype=np.float64))
+        p1 = math.radians(true_lat)
+        x = np.sin((la - p1) / 2) ** 2 + math.cos(p1) * np.cos(la) * np.sin((lo - math.radians(true_lng)) / 2) ** 2
+        # NaN в ответе дал бы INT64_MIN после astype — считаем такой ответ самым дальним, как скалярный путь
+        d = np.nan_to_num(2 * EARTH_R_KM * np.arcsin(np.minimum(1.0, np.sqrt(x))), nan=math.pi * EARTH_R_KM,
+                          posinf=math.pi * EARTH_R_KM)
+        s = np.clip(np.rint(5000.0 * np.exp(-d / 2000.0)), 0, 5000).astype(np.int64)
+        return d, s
+    dists = [haversine_km((true_lat, true_lng), (lats[i], lngs[i])) for i in range(n)]
+    return dists, [score_from_distance_km(d) for d in dists]
+
+
+def k_smallest(values: Sequence[float], k: int) -> List[int]:
+    # индексы k наименьших значений по возрастанию (частичный отбор, без полной сортировки)
+    n = len(values)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    if np is not None and n >= NUMPY_MIN:
+        v = np.asarray(values)
+        part = np.argpartition(v, k - 1)[:k] if k < n else np.arange(n)
+        return [int(i) for i in part[np.argsort(v[part], kind="stable")]]
+    return heapq.nsmallest(k, range(n), key=values.__getitem__)
+
+
+def score_round(true_lat: float, true_lng: float, lats: Sequence[float], lngs: Sequence[float], k: int
+                ) -> Tuple[List[float], List[int], List[int]]:
+    # подсчёт раунда целиком: расстояния, очки и индексы k лучших — обычными списками
+    # (их дёшево передать из пула процессов, и поэлементный доступ к ним быстрее, чем к numpy)
+    d, s = score_batch(true_lat, true_lng, lats, lngs)
+    order = k_smallest(d, k)
+    if np is not None and isinstance(d, np.ndarray):
+        return d.tolist(), s.tolist(), order
+    return list(d), list(s), order
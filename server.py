@@ -1,17 +1,40 @@
 import os
-import json
 import hmac
 import time
-import math
+import gc
 import asyncio
 import base64
 import secrets
+import random
 import hashlib
+import zlib
+import math
+from collections import deque
+from itertools import islice
 from dataclasses import dataclass, field
-from typing import Dict, Optional, Tuple, List
+from typing import Callable, Deque, Dict, Optional, Set, Tuple, List, Union
 from urllib.parse import quote
 
-from aiohttp import web, WSMsgType
+from aiohttp import web, WSCloseCode, WSMsgType
+
+import fanout
+import metrics
+from fanout import Conn
+from metrics import TimedLock
+from ratelimit import CONN_LIMITS, ROOM_LIMITS, Limiter
+from scheduler import Scheduler, wall_ms
+from locpool import LocationPool, point_key, write_file
+from landmask import LandMask
+from assets import AssetCache
+from leaderboard import Leaderboard
+from eventlog import EventLog, encode_records, read_records
+from history import History, export_chunks
+from matchmaker import Matchmaker, Ticket
+from router import room_owner
+import wire
+from wire import ENC_JSON, ENC_MP, ENC_NAMES
+from scoring import GuessColumns, haversine_km, k_smallest, score_batch, score_from_distance_km, score_round  # noqa: F401
+from cpupool import CpuPool
 
 
 HOST = "0.0.0.0"
@@ -19,12 +42,47 @@ PORT = int(os.getenv("PORT", "10000"))
 
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")
 YANDEX_MAPS_API_KEY = os.getenv("YANDEX_MAPS_API_KEY", "")
-SIGNING_SECRET = os.getenv("SIGNING_SECRET", "") or secrets.token_urlsafe(32)
+SIGNING_SECRET = os.getenv("SIGNING_SECRET", "")
 
 ROUNDS_TOTAL_DEFAULT = int(os.getenv("ROUNDS_TOTAL", "5"))
 ROUND_SECONDS_DEFAULT = int(os.getenv("ROUND_SECONDS", "90"))
 REVEAL_SECONDS_DEFAULT = int(os.getenv("REVEAL_SECONDS", "12"))
 MAX_PLAYERS = int(os.getenv("MAX_PLAYERS", "30"))
+# режим "large" (стримы): тысячи игроков, пакетный подсчёт очков
+LARGE_ROOM_MAX_PLAYERS = int(os.getenv("LARGE_ROOM_MAX_PLAYERS", "5000"))
+ROUND_TOP_N = 10
+# сколько строк таблицы уходит всем в большой комнате; остальным — только их место
+STATE_TOP_N = int(os.getenv("STATE_TOP_N", "50"))
+# ответы и входы игроков копятся и уходят одним патчем не чаще раза в окно; 0 — сразу
+STATE_COALESCE_MS = int(os.getenv("STATE_COALESCE_MS", "50"))
+# 0 — без синхронизирующих timer-кадров, только на смене фазы
+TIMER_SYNC_SECONDS = int(os.getenv("TIMER_SYNC_SECONDS", "5"))
+ROUND_GAP_MS = 750
+
+# комнаты без подключённых сокетов удаляются через TTL (лобби и завершённые игры)
+MAX_ROOMS = int(os.getenv("MAX_ROOMS", "10000"))
+LOBBY_TTL_SECONDS = int(os.getenv("LOBBY_TTL_SECONDS", "1800"))
+FINISHED_TTL_SECONDS = int(os.getenv("FINISHED_TTL_SECONDS", "600"))
+ROOM_SHARDS = int(os.getenv("ROOM_SHARDS", "64"))
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "64"))
+# входящие кадры: больше WS_MAX_MESSAGE байт соединение закрывается ещё до разбора;
+# WS_INVALID_STREAK битых кадров подряд — отключение; WS_RATE_LIMIT=0 выключает лимиты ratelimit.py
+WS_MAX_MESSAGE = int(os.getenv("WS_MAX_MESSAGE", "4096"))
+WS_INVALID_STREAK = int(os.getenv("WS_INVALID_STREAK", "10"))
+WS_RATE_LIMIT = os.getenv("WS_RATE_LIMIT", "1") != "0"
+# зрители (/ws?spectate=1): не игроки, в players не попадают; лимит на комнату
+MAX_SPECTATORS = int(os.getenv("MAX_SPECTATORS", "10000"))
+# сколько последних разосланных кадров комната помнит для докачки после переподключения
+REPLAY_FRAMES = int(os.getenv("REPLAY_FRAMES", "256"))
+
+# WORKERS>1: python server.py поднимает роутер и столько же процессов-воркеров (router.py);
+# WORKER_INDEX/WORKER_SOCKET роутер выставляет воркерам сам
+WORKERS = max(1, int(os.getenv("WORKERS", "1")))
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_SOCKET = os.getenv("WORKER_SOCKET", "")
+
+PROTO_FULL = 1
+PROTO_DELTA = 2
 
 # bbox: [lat_min, lng_min, lat_max, lng_max]
 REGIONS = {
@@ -49,9 +107,95 @@ COUNTRIES = {
     "JP": {"name": "Япония", "bbox": [30.0, 129.0, 45.8, 146.0]},
 }
 
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(THIS_DIR, "static")
+# ASSET_RELOAD=1 — перечитывать static/ при изменении файлов (для разработки)
+ASSET_RELOAD = os.getenv("ASSET_RELOAD", "0") == "1"
+# /healthz и /metrics: обход всех комнат и сокетов и listdir сегментов истории — не чаще раза в столько мс
+HEALTH_CACHE_MS = int(os.getenv("HEALTH_CACHE_MS", "1000"))
+DATA_DIR = os.getenv("DATA_DIR") or os.path.join(THIS_DIR, "data")
+
+# без SIGNING_SECRET ключ генерируется один раз и хранится в DATA_DIR,
+# иначе после рестарта все выданные ссылки стали бы невалидны
+SECRET_FILE = os.path.join(DATA_DIR, "signing_secret")
+if not SIGNING_SECRET:
+    try:
+        with open(SECRET_FILE, "r", encoding="utf-8") as f:
+            SIGNING_SECRET = f.read().strip()
+    except OSError:
+        pass
+if not SIGNING_SECRET:
+    SIGNING_SECRET = secrets.token_urlsafe(32)
+    try:
+        write_file(SECRET_FILE, SIGNING_SECRET.encode())
+        os.chmod(SECRET_FILE, 0o600)
+    except OSError:
+        pass
+
+# растровая маска суши/стран (собирается tools/build_landmask.py); без файла — просто bbox
+LANDMASK_FILE = os.getenv("LANDMASK_FILE") or os.path.join(DATA_DIR, "landmask.bin")
+try:
+    LANDMASK = LandMask.open(LANDMASK_FILE)
+except (OSError, ValueError):
+    LANDMASK = None
+# источник случайных точек; симуляция (bench/bench_sim.py) ставит random.Random(seed)
+RNG: random.Random = random.SystemRandom()
+
+# пул проверенных точек с панорамами (заполняется из pano_ready)
+# у каждого воркера свои файлы: пул и журнал пишутся без общих локов
+WORKER_SUFFIX = f"-{WORKER_INDEX}" if WORKER_SOCKET else ""
+POOL_FILE = os.path.join(DATA_DIR, f"locpool{WORKER_SUFFIX}.bin")
+POOL_SAVE_SECONDS = int(os.getenv("POOL_SAVE_SECONDS", "60"))
+POOL_PER_AREA = int(os.getenv("POOL_PER_AREA", "5000"))
+RECENT_SEEDS = 50
+# клиент ищет панораму в радиусе 15 км от seed (static/app.js) — дальше хост прислать не мог
+PANO_MAX_KM = 15.5
+POOL = LocationPool(
+    {**{f"R:{k}": v["bbox"] for k, v in REGIONS.items()},
+     **{f"C:{k}": v["bbox"] for k, v in COUNTRIES.items()}},
+    per_key=POOL_PER_AREA,
+    country_at=LANDMASK.country_at if LANDMASK is not None else None,
+)
+
+# быстрая игра: очередь по (регион, страна), комната на QUICKPLAY_SIZE игроков;
+# если столько не набралось за QUICKPLAY_WAIT_SECONDS — играют те, кто есть (от QUICKPLAY_MIN)
+QUICKPLAY_SIZE = int(os.getenv("QUICKPLAY_SIZE", "8"))
+QUICKPLAY_MIN = int(os.getenv("QUICKPLAY_MIN", "2"))
+QUICKPLAY_WAIT_SECONDS = int(os.getenv("QUICKPLAY_WAIT_SECONDS", "15"))
+QUICKPLAY_POLL_SECONDS = 25  # long-poll; клиент сразу приходит снова
+QUICKPLAY_COUNTDOWN_SECONDS = 10  # успеть открыть комнату после матча
+MATCHMAKER = Matchmaker(QUICKPLAY_SIZE, QUICKPLAY_MIN, QUICKPLAY_WAIT_SECONDS * 1000,
+                        ttl_ms=QUICKPLAY_POLL_SECONDS * 1000 + 10000)
+
+# CPU-работа от CPU_OFFLOAD_MIN ответов/игроков (подсчёт большой комнаты, снапшот журнала) — вне цикла:
+# CPU_POOL=thread|process|off. Подпись ссылок и коды комнат — микросекунды, остаются на цикле
+CPU = CpuPool(os.getenv("CPU_POOL", "thread"), int(os.getenv("CPU_POOL_WORKERS", "0")),
+              int(os.getenv("CPU_OFFLOAD_MIN", "1000")))
+
+# журнал комнат: после рестарта/деплоя комнаты восстанавливаются из него; ROOM_LOG=0 — выключить
+ROOM_LOG = os.getenv("ROOM_LOG", "1") != "0"
+ROOM_LOG_FILE = os.path.join(DATA_DIR, f"rooms{WORKER_SUFFIX}.log")
+ROOM_LOG_FLUSH_MS = int(os.getenv("ROOM_LOG_FLUSH_MS", "200"))
+ROOM_LOG_COMPACT_MB = int(os.getenv("ROOM_LOG_COMPACT_MB", "16"))
+LOG = EventLog(ROOM_LOG_FILE)
+
+# история сыгранных раундов (seed, точка, ответы, очки) — общий каталог всех воркеров; HISTORY=0 — выключить
+HISTORY = os.getenv("HISTORY", "1") != "0"
+HISTORY_DIR = os.path.join(DATA_DIR, "history")
+HISTORY_FLUSH_MS = int(os.getenv("HISTORY_FLUSH_MS", "5000"))
+HISTORY_SEGMENT_MB = int(os.getenv("HISTORY_SEGMENT_MB", "32"))
+# если задан — /api/history только с ?token= или Authorization: Bearer
+HISTORY_TOKEN = os.getenv("HISTORY_TOKEN", "")
+HIST = History(HISTORY_DIR, f"w{WORKER_INDEX}", HISTORY_SEGMENT_MB << 20)
+
+
+# часы игры: дедлайны отсчёта, раундов и показа считаются от now_ms() и идут через SCHEDULER;
+# use_clock подменяет и то и другое (виртуальное время для симуляции)
+CLOCK: Callable[[], int] = wall_ms
+
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return CLOCK()
 
 
 def b64url(data: bytes) -> str:
@@ -64,25 +208,8 @@ def sign_payload(payload: str) -> str:
 
 
 def verify_sig(payload: str, sig: str) -> bool:
-    return hmac.compare_digest(sign_payload(payload), sig)
-
-
-def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
-    lat1, lon1 = a
-    lat2, lon2 = b
-    R = 6371.0
-    p1 = math.radians(lat1)
-    p2 = math.radians(lat2)
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    x = (math.sin(dlat / 2) ** 2) + math.cos(p1) * math.cos(p2) * (math.sin(dlon / 2) ** 2)
-    return 2 * R * math.asin(min(1.0, math.sqrt(x)))
-
-
-def score_from_distance_km(d: float) -> int:
-    # “геогесср-подобная” кривая: близко -> много, далеко -> мало
-    s = 5000.0 * math.exp(-d / 2000.0)
-    return int(max(0, min(5000, round(s))))
+    # байты: compare_digest на str с не-ASCII бросает TypeError
+    return hmac.compare_digest(sign_payload(payload).encode(), sig.encode())
 
 
 def safe_int(x, default):
@@ -99,26 +226,41 @@ def safe_float(x, default):
         return default
 
 
-def pick_point(bbox: List[float]) -> Tuple[float, float]:
+def valid_point(lat: Optional[float], lng: Optional[float]) -> bool:
+    # float() принимает "nan"/"inf" — такие и точки вне диапазона не пускаем дальше
+    return (lat is not None and lng is not None and math.isfinite(lat) and math.isfinite(lng)
+            and -90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0)
+
+
+def pick_point(bbox: List[float], country: str = "") -> Tuple[float, float]:
+    if LANDMASK is not None and LANDMASK.ready(bbox, country):
+        # сразу из клеток суши (нужной страны) внутри bbox; пока списки клеток
+        # собираются в потоке (warm_landmask) — по-старому, равномерно в bbox
+        pt = LANDMASK.sample(bbox, country, RNG)
+        if pt:
+            return pt
     lat_min, lng_min, lat_max, lng_max = bbox
-    # secrets.randbelow -> криптостойко, плюс равномерно
-    lat = lat_min + secrets.randbelow(10_000_000) / 10_000_000 * (lat_max - lat_min)
-    lng = lng_min + secrets.randbelow(10_000_000) / 10_000_000 * (lng_max - lng_min)
+    # SystemRandom -> криптостойко, плюс равномерно
+    lat = lat_min + RNG.random() * (lat_max - lat_min)
+    lng = lng_min + RNG.random() * (lng_max - lng_min)
     return (lat, lng)
 
 
-@dataclass
+@dataclass(slots=True)
 class Player:
     user_id: str
     name: str = ""
+    idx: int = -1  # номер в room.roster (строка в колонках ответов)
     total_score: int = 0
     has_guessed: bool = False
     guess: Optional[Tuple[float, float]] = None
     last_distance_km: Optional[float] = None
     last_score: Optional[int] = None
+    # JSON player_view, None — пересобрать
+    cached: Optional[str] = field(default=None, repr=False, compare=False)
 
 
-@dataclass
+@dataclass(slots=True)
 class Round:
     index: int
     seed_lat: float
@@ -129,9 +271,10 @@ class Round:
     status: str = "running"   # running|reveal|ended
     true_lat: Optional[float] = None
     true_lng: Optional[float] = None
+    source: str = "random"    # random|pool — откуда взят seed
 
 
-@dataclass
+@dataclass(slots=True)
 class Room:
     code: str
     host_user_id: str
@@ -143,16 +286,62 @@ class Room:
 
     region: str = "WORLD"
     country: str = ""
+    large: bool = False
+    max_players: int = MAX_PLAYERS
 
     round_number: int = 0
     game_status: str = "lobby"  # lobby|countdown|running|finished
     countdown_ends_at_ms: int = 0
-    countdown_task: Optional[asyncio.Task] = None
 
     current_round: Optional[Round] = None
     players: Dict[str, Player] = field(default_factory=dict)
-    ws: Dict[str, web.WebSocketResponse] = field(default_factory=dict)
-    timer_task: Optional[asyncio.Task] = None
+    roster: List[Player] = field(default_factory=list)
+    guesses: GuessColumns = field(default_factory=GuessColumns)
+    ws: Dict[str, Conn] = field(default_factory=dict)
+    version: int = 0
+    # номер последнего кадра в ring: [seq, kind, obj, кадры по кодировкам]
+    seq: int = 0
+    # игроки, изменения которых ещё не разосланы (см. push_dirty)
+    dirty: Dict[str, Player] = field(default_factory=dict, repr=False)
+    ring: Deque[list] = field(default_factory=lambda: deque(maxlen=REPLAY_FRAMES), repr=False)
+    # токен переподключения на игрока; после рестарта сервера их нет — клиент получит снапшот
+    tokens: Dict[str, str] = field(default_factory=dict, repr=False)
+    # зрители — отдельная группа рассылки: без timer-кадров, с урезанным state
+    spectators: Set[Conn] = field(default_factory=set, repr=False)
+    # входящие сообщения всей комнаты по типам (ratelimit.ROOM_LIMITS)
+    limiter: Limiter = field(default_factory=lambda: Limiter(ROOM_LIMITS), repr=False)
+    # места по очкам; меняются только в finish_round
+    board: Leaderboard = field(default_factory=Leaderboard, repr=False)
+    # готовые JSON-секции снапшота; None — пересобрать при следующем state
+    sec_players: Optional[str] = field(default=None, init=False, repr=False)
+    sec_guesses: Optional[str] = field(default=None, init=False, repr=False)
+    recent: Deque[Tuple[float, float]] = field(default_factory=lambda: deque(maxlen=RECENT_SEEDS))
+    # у каждой комнаты свой лок: broadcast одной комнаты не тормозит остальные
+    lock: asyncio.Lock = field(default_factory=TimedLock, repr=False)
+
+    def add_player(self, user_id: str, name: str) -> Player:
+        p = Player(user_id=user_id, name=name, idx=len(self.roster))
+        self.players[user_id] = p
+        self.roster.append(p)
+        self.board.add(p.idx)
+        self.touch()
+        return p
+
+    def touch(self, p: Optional[Player] = None):
+        # игрок изменился — сбрасываем его JSON и собранные секции
+        if p is not None:
+            p.cached = None
+        self.sec_players = None
+        self.sec_guesses = None
+
+    def rank(self, p: Player) -> int:
+        return self.board.rank(p.idx, p.total_score)
+
+    def standings(self) -> List[Player]:
+        # в большой комнате — только верх таблицы
+        roster = self.roster
+        n = STATE_TOP_N if self.large else len(roster)
+        return [roster[i] for i in self.board.top(n)]
 
     def bbox(self) -> List[float]:
         if self.country and self.country in COUNTRIES:
@@ -161,112 +350,583 @@ class Room:
             return REGIONS[self.region]["bbox"]
         return REGIONS["WORLD"]["bbox"]
 
-    def public_state(self) -> dict:
-        cr = self.current_round
-        players_sorted = sorted(self.players.values(), key=lambda p: p.total_score, reverse=True)
-
-        guesses = []
-        for p in players_sorted:
-            if p.guess:
-                guesses.append({
-                    "user_id": p.user_id,
-                    "name": p.name,
-                    "lat": p.guess[0],
-                    "lng": p.guess[1],
-                    "distance_km": p.last_distance_km,
-                    "score": p.last_score,
-                })
+    def mask_country(self) -> str:
+        return self.country if self.country in COUNTRIES else ""
 
+    def pool_key(self) -> str:
+        if self.country and self.country in COUNTRIES:
+            return f"C:{self.country}"
+        if self.region in REGIONS:
+            return f"R:{self.region}"
+        return "R:WORLD"
+
+    def players_section(self) -> str:
+        if self.sec_players is None:
+            parts = []
+            for p in self.standings():
+                if p.cached is None:
+                    p.cached = encode(player_view(p))
+                parts.append(p.cached)
+            self.sec_players = "[" + ",".join(parts) + "]"
+        return self.sec_players
+
+    def guesses_section(self) -> str:
+        if self.sec_guesses is None:
+            self.sec_guesses = encode([guess_view(p) for p in self.standings() if p.guess])
+        return self.sec_guesses
+
+    def state_head(self) -> dict:
         return {
+            "v": self.version,
+            "now_ms": now_ms(),
             "code": self.code,
             "host_user_id": self.host_user_id,
-            "game_status": self.game_status,
-            "countdown_ends_at_ms": self.countdown_ends_at_ms,
-            "round_number": self.round_number,
+            **self.room_fields(),
             "rounds_total": self.rounds_total,
             "round_seconds": self.round_seconds,
             "reveal_seconds": self.reveal_seconds,
+            "regions": REGION_NAMES,
+            "countries": COUNTRY_NAMES,
+            "current_round": round_view(self.current_round),
+            "large": self.large,
+            "players_total": len(self.players),
+        }
+
+    def state_json(self) -> str:
+        # снапшот собирается из закешированных секций, без сортировки игроков
+        head = encode(self.state_head())
+        return f'{head[:-1]},"players":{self.players_section()},"guesses":{self.guesses_section()}}}'
+
+    def state_obj(self) -> dict:
+        # для бинарной кодировки (enc=mp) — тот же снапшот объектом
+        st = self.standings()
+        d = self.state_head()
+        d["players"] = [player_view(p) for p in st]
+        d["guesses"] = [guess_view(p) for p in st if p.guess]
+        return d
+
+    def room_fields(self) -> dict:
+        # изменяемые поля верхнего уровня (то, что уходит в op "room")
+        return {
+            "game_status": self.game_status,
+            "countdown_ends_at_ms": self.countdown_ends_at_ms,
+            "round_number": self.round_number,
             "region": self.region,
             "country": self.country,
-            "regions": {k: v["name"] for k, v in REGIONS.items()},
-            "countries": {k: v["name"] for k, v in COUNTRIES.items()},
-            "current_round": None if not cr else {
-                "index": cr.index,
-                "seed_lat": cr.seed_lat,
-                "seed_lng": cr.seed_lng,
-                "started_at_ms": cr.started_at_ms,
-                "ends_at_ms": cr.ends_at_ms,
-                "reveal_ends_at_ms": cr.reveal_ends_at_ms,
-                "status": cr.status,
-                "true": None if cr.true_lat is None else {"lat": cr.true_lat, "lng": cr.true_lng},
-            },
-            "players": [{
-                "user_id": p.user_id,
-                "name": p.name,
-                "total_score": p.total_score,
-                "has_guessed": p.has_guessed,
-                "last_distance_km": p.last_distance_km,
-                "last_score": p.last_score,
-            } for p in players_sorted],
-            "guesses": guesses,
         }
 
 
-ROOMS: Dict[str, Room] = {}
-LOCK = asyncio.Lock()
+REGION_NAMES = {k: v["name"] for k, v in REGIONS.items()}
+COUNTRY_NAMES = {k: v["name"] for k, v in COUNTRIES.items()}
+
+
+def round_view(cr: Optional[Round]) -> Optional[dict]:
+    if not cr:
+        return None
+    return {
+        "index": cr.index,
+        "seed_lat": cr.seed_lat,
+        "seed_lng": cr.seed_lng,
+        "started_at_ms": cr.started_at_ms,
+        "ends_at_ms": cr.ends_at_ms,
+        "reveal_ends_at_ms": cr.reveal_ends_at_ms,
+        "status": cr.status,
+        "true": None if cr.true_lat is None else {"lat": cr.true_lat, "lng": cr.true_lng},
+    }
+
+
+def player_view(p: Player) -> dict:
+    return {
+        "user_id": p.user_id,
+        "name": p.name,
+        "total_score": p.total_score,
+        "has_guessed": p.has_guessed,
+        "last_distance_km": p.last_distance_km,
+        "last_score": p.last_score,
+    }
+
+
+def guess_view(p: Player) -> dict:
+    return {
+        "user_id": p.user_id,
+        "name": p.name,
+        "lat": p.guess[0],
+        "lng": p.guess[1],
+        "distance_km": p.last_distance_km,
+        "score": p.last_score,
+    }
+
+
+# ---- delta-протокол (proto=2) ----
+# клиент получает полный state только при входе и по {"t": "resync"},
+# дальше — {"t": "patch", "v": N, "ops": [...]}, где v растёт на 1.
+
+def op_room(room: Room) -> dict:
+    return {"op": "room", "v": room.room_fields()}
+
+
+def op_round(room: Room) -> dict:
+    return {"op": "round", "v": round_view(room.current_round)}
+
+
+def op_player(p: Player) -> dict:
+    v = player_view(p)
+    v["guess"] = list(p.guess) if p.guess else None
+    return {"op": "player", "v": v}
+
+
+def op_players(room: Room) -> dict:
+    return {"op": "players", "v": [op_player(p)["v"] for p in room.players.values()]}
+
+
+def op_top(room: Room) -> dict:
+    # большая комната: клиент заменяет список игроков верхом таблицы
+    return {"op": "top", "v": [op_player(p)["v"] for p in room.standings()], "total": len(room.players)}
+
+
+def op_standings(room: Room) -> dict:
+    return op_top(room) if room.large else op_players(room)
+
+
+def me_frame(room: Room, p: Player) -> dict:
+    return {"t": "me", "rank": room.rank(p), "total_score": p.total_score, "players_total": len(room.players)}
+
+
+ROOM_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+
+
+def gen_room_code() -> str:
+    # в режиме воркеров — только коды, которые роутер отправит в этот же процесс
+    while True:
+        code = "".join(secrets.choice(ROOM_CODE_ALPHABET) for _ in range(6))
+        if not WORKER_SOCKET or room_owner(code, WORKERS) == WORKER_INDEX:
+            return code
+
+
+class RoomRegistry:
+    # ROOMS разбит на шарды по crc32(code): поиск комнаты без локов,
+    # создание берёт только лок своего шарда и не пересекается с игрой
+    def __init__(self, shards: int = ROOM_SHARDS):
+        self._shards: List[Dict[str, Room]] = [{} for _ in range(max(1, shards))]
+        self._locks = [asyncio.Lock() for _ in self._shards]
+        self._count = 0
+
+    def _idx(self, code: str) -> int:
+        return zlib.crc32(code.encode()) % len(self._shards)
+
+    def get(self, code: str) -> Optional[Room]:
+        return self._shards[self._idx(code)].get(code)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._shards[self._idx(code)]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def values(self):
+        for shard in self._shards:
+            yield from list(shard.values())
+
+    async def create(self, make_room) -> Room:
+        while True:
+            code = gen_room_code()
+            i = self._idx(code)
+            async with self._locks[i]:
+                if code in self._shards[i]:
+                    continue
+                room = make_room(code)
+                self._shards[i][code] = room
+                self._count += 1
+                return room
+
+    def put(self, room: Room):
+        # только для восстановления из журнала, код уже известен
+        shard = self._shards[self._idx(room.code)]
+        if room.code not in shard:
+            self._count += 1
+        shard[room.code] = room
+
+    def pop(self, code: str) -> Optional[Room]:
+        room = self._shards[self._idx(code)].pop(code, None)
+        if room is not None:
+            self._count -= 1
+        return room
+
+
+ROOMS = RoomRegistry()
+SCHEDULER = Scheduler(now_ms, on_drift=lambda ms: metrics.SCHEDULER_DRIFT.observe(ms / 1000))
+
+
+def use_clock(clock: Callable[[], int], manual: bool = False):
+    # manual=True: дедлайны разбирает внешний драйвер (SCHEDULER.pop_due), а не таймеры цикла
+    global CLOCK
+    CLOCK = clock
+    SCHEDULER.set_clock(now_ms, manual)
+
+
+# комнаты с идущим раундом — им нужен синхронизирующий тик
+TICKING: Dict[str, Room] = {}
 
-THIS_DIR = os.path.dirname(os.path.abspath(__file__))
-STATIC_DIR = os.path.join(THIS_DIR, "static")
 routes = web.RouteTableDef()
 
 
-def render_index_html() -> str:
-    with open(os.path.join(STATIC_DIR, "index.html"), "r", encoding="utf-8") as f:
-        html = f.read()
-    return html.replace("__YMAPS_KEY__", YANDEX_MAPS_API_KEY or "")
+ASSETS = AssetCache(STATIC_DIR, {"__YMAPS_KEY__": YANDEX_MAPS_API_KEY or ""}, reload=ASSET_RELOAD)
+ASSETS.load()
+
+
+def encode(obj) -> str:
+    return wire.dumps(obj)
 
 
 async def ws_send(ws, obj):
+    # прямая отправка — только пока у сокета ещё нет Conn
     try:
-        await ws.send_str(json.dumps(obj, ensure_ascii=False))
+        await ws.send_str(encode(obj))
     except Exception:
         pass
 
 
-async def broadcast(room: Room, obj: dict):
+def send(conn: Conn, obj: dict):
+    conn.push(obj["t"], wire.encode_frame(obj, conn.enc))
+
+
+def state_frame(room: Room, enc: int = ENC_JSON):
+    t0 = time.perf_counter()
+    if enc == ENC_MP:
+        frame = wire.pack({"t": "state", "state": room.state_obj()})
+    else:
+        frame = '{"t":"state","state":' + room.state_json() + "}"
+    metrics.STATE_BUILD.observe(time.perf_counter() - t0)
+    metrics.STATE_BYTES.observe(len(frame))
+    return frame
+
+
+def send_state(conn: Conn, room: Room):
+    conn.push("state", state_frame(room, conn.enc))
+
+
+async def broadcast(room: Room, obj: dict, proto: Optional[int] = None):
+    kind = obj["t"]
+    if room.dirty and kind != "patch":
+        # отложенные ответы уходят раньше round_end/toast/countdown — порядок событий сохраняется
+        await push_state(room)
+    data: List[Union[str, bytes, None]] = [None, None]
+    if kind not in fanout.DROPPABLE and proto != PROTO_FULL:
+        # кадр попадает в ring даже без получателей: переподключившийся клиент докачает его по seq
+        room.seq += 1
+        obj["seq"] = room.seq
+        room.ring.append([room.seq, kind, obj, data])
+    make = lambda enc: wire.encode_frame(obj, enc)  # noqa: E731
+    await broadcast_encoded(room, kind, make, proto, data)
+    if room.spectators and proto is None and kind not in fanout.DROPPABLE:
+        push_spectators(room, kind, make, data)
+
+
+async def broadcast_encoded(room: Room, kind: str, make: Callable[[int], Union[str, bytes]],
+                            proto: Optional[int] = None, data: Optional[List[Union[str, bytes, None]]] = None):
+    # сериализуем один раз на кодировку (и только если есть кому), дальше кадр уходит в очереди сокетов
+    if data is None:
+        data = [None, None]
+    if not room.ws:
+        return
+    t0 = time.perf_counter()
     dead = []
-    for uid, ws in room.ws.items():
-        if ws.closed:
-            dead.append(uid)
+    n = 0
+    for uid, conn in room.ws.items():
+        if proto is not None and conn.proto != proto:
             continue
-        await ws_send(ws, obj)
+        frame = data[conn.enc]
+        if frame is None:
+            frame = data[conn.enc] = make(conn.enc)
+        n += 1
+        if not conn.push(kind, frame):
+            if conn.closed:
+                dead.append(uid)
+    if n:
+        metrics.BROADCAST.observe(time.perf_counter() - t0)
+        metrics.BROADCAST_FANOUT.observe(n)
     for uid in dead:
         room.ws.pop(uid, None)
+    if dead and not room.ws:
+        schedule_eviction(room)
+
+
+async def push_state(room: Room, *ops: dict):
+    # старым клиентам (proto=1) — полный state, новым — патч с версией
+    if room.dirty:
+        ops = tuple(op_player(p) for p in room.dirty.values()) + ops
+        room.dirty.clear()
+        SCHEDULER.cancel((room.code, "flush"))
+    room.version += 1
+    has_full = any(conn.proto != PROTO_DELTA for conn in room.ws.values())
+    if has_full:
+        await broadcast_encoded(room, "state", lambda enc: state_frame(room, enc), proto=PROTO_FULL)
+    # патч пишется в ring всегда, иначе у переподключившегося клиента будет дыра в версиях
+    await broadcast(room, {"t": "patch", "v": room.version, "ops": list(ops)}, proto=PROTO_DELTA)
+    if room.spectators:
+        push_spectators(room, "state", lambda enc: spectator_frame(room, enc))
+
+
+async def push_dirty(room: Room, p: Player):
+    # всплеск ответов в конце раунда: вместо патча (и state для proto=1) на каждый guess —
+    # один на окно STATE_COALESCE_MS со всеми изменившимися игроками
+    if STATE_COALESCE_MS <= 0:
+        await push_state(room, op_player(p))
+        return
+    room.dirty[p.user_id] = p
+    key = (room.code, "flush")
+    if SCHEDULER.pending(key) is None:
+        SCHEDULER.call_later(STATE_COALESCE_MS, key, lambda: flush_state(room))
+
+
+async def flush_state(room: Room):
+    async with room.lock:
+        if room.dirty and ROOMS.get(room.code) is room:
+            await push_state(room)
+
+
+# ---- зрители ----
+
+SPECTATOR_DROPPABLE = frozenset({"timer", "state"})
+
+
+def spectator_head(room: Room) -> Tuple[dict, bool]:
+    head = room.state_head()
+    head["spectator"] = True
+    cr = room.current_round
+    hidden = cr is not None and cr.status == "running"
+    if hidden:
+        # до показа — ни точки, ни чужих ответов: зритель не должен работать подсказкой
+        head["current_round"].update(seed_lat=None, seed_lng=None, true=None)
+    return head, hidden
+
+
+def spectator_frame(room: Room, enc: int = ENC_JSON):
+    head, hidden = spectator_head(room)
+    if enc == ENC_MP:
+        st = room.standings()
+        head["players"] = [player_view(p) for p in st]
+        head["guesses"] = [] if hidden else [guess_view(p) for p in st if p.guess]
+        return wire.pack({"t": "state", "state": head})
+    guesses = "[]" if hidden else room.guesses_section()
+    return f'{{"t":"state","state":{encode(head)[:-1]},"players":{room.players_section()},"guesses":{guesses}}}}}'
+
+
+def push_spectators(room: Room, kind: str, make: Callable[[int], Union[str, bytes]],
+                    data: Optional[List[Union[str, bytes, None]]] = None):
+    # один кадр на кодировку для всех зрителей; медленный зритель теряет старые state, игроков это не задевает
+    if data is None:
+        data = [None, None]
+    dead = []
+    for conn in room.spectators:
+        frame = data[conn.enc]
+        if frame is None:
+            frame = data[conn.enc] = make(conn.enc)
+        if not conn.push(kind, frame) and conn.closed:
+            dead.append(conn)
+    room.spectators.difference_update(dead)
+
+
+async def spectator_ws(ws, room: Room, enc: int):
+    conn = Conn(ws, WS_SEND_QUEUE, PROTO_FULL, enc, droppable=SPECTATOR_DROPPABLE)
+    async with room.lock:
+        if ROOMS.get(room.code) is not room or len(room.spectators) >= MAX_SPECTATORS:
+            conn.close()
+            await ws_send(ws, {"t": "toast", "kind": "error", "text": "room not available"})
+            await ws.close()
+            return ws
+        room.spectators.add(conn)
+        conn.push("state", spectator_frame(room, enc))
+
+    # зритель только читает: любое сообщение — просьба прислать снапшот заново
+    limiter = Limiter(CONN_LIMITS)
+    async for msg in ws:
+        if msg.type == WSMsgType.ERROR:
+            break
+        if msg.type in (WSMsgType.TEXT, WSMsgType.BINARY):
+            if limiter.allow("resync"):
+                conn.push("state", spectator_frame(room, enc))
+            else:
+                INBOUND["throttled"] += 1
+    conn.close()
+    room.spectators.discard(conn)
+    return ws
+
+
+# входящие сообщения, отброшенные до обработки
+INBOUND = {"throttled": 0, "throttled_room": 0, "oversize": 0, "invalid": 0, "invalid_disconnects": 0}
+
+
+# ---- переподключение ----
+
+RESUME = {"attempts": 0, "hits": 0, "misses": 0, "frames": 0}
+
+
+def replay_missed(room: Room, conn: Conn, last_seq: int) -> Optional[int]:
+    # кадры после last_seq из ring; None — дыра уже вытеснена из буфера (нужен снапшот)
+    if last_seq > room.seq or last_seq < 0:
+        return None
+    if last_seq == room.seq:
+        return 0
+    ring = room.ring
+    if not ring or ring[0][0] > last_seq + 1:
+        return None
+    items = []
+    for seq, kind, obj, data in islice(ring, last_seq + 1 - ring[0][0], None):
+        frame = data[conn.enc]
+        if frame is None:
+            frame = data[conn.enc] = wire.encode_frame(obj, conn.enc)
+        items.append((kind, frame))
+    conn.replay(items)
+    return len(items)
+
+
+def resume_stats() -> dict:
+    n = RESUME["attempts"]
+    return {**RESUME, "hit_rate": round(RESUME["hits"] / n, 4) if n else None, "ring_frames": REPLAY_FRAMES}
+
+
+# пробы приходят часто, а эти сводки — O(комнат + сокетов) на цикле; счётчики рядом дешёвые и всегда свежие
+HEALTH_CACHE: Dict[str, Tuple[float, dict]] = {}
+
+
+def cached_stats(key: str, fn: Callable[[], dict]) -> dict:
+    now = time.monotonic()
+    hit = HEALTH_CACHE.get(key)
+    if hit is None or now - hit[0] >= HEALTH_CACHE_MS / 1000:
+        hit = HEALTH_CACHE[key] = (now, fn())
+    return hit[1]
+
+
+def fanout_stats() -> dict:
+    return fanout.STATS.snapshot(c for room in ROOMS.values() for c in list(room.ws.values()))
 
 
 @routes.get("/healthz")
 async def healthz(_req):
-    return web.json_response({"ok": True, "ts": int(time.time())})
+    return web.json_response({
+        "ok": True,
+        "ts": int(time.time()),
+        **cached_stats("live", live_counts),
+        "fanout": cached_stats("fanout", fanout_stats),
+        "locpool": POOL.stats(),
+        "roomlog": LOG.stats(),
+        "assets": ASSETS.stats(),
+        "resume": resume_stats(),
+        "inbound": INBOUND,
+        "history": cached_stats("history", HIST.stats),
+        "quickplay": MATCHMAKER.stats(),
+        "cpu_pool": CPU.stats(),
+    })
+
+
+@routes.get("/metrics")
+async def metrics_handler(_req):
+    return web.Response(text=metrics.REGISTRY.render(), content_type="text/plain",
+                        headers={"Cache-Control": "no-store"})
+
+
+def collect_gauges():
+    counts = cached_stats("live", live_counts)
+    yield "freeguessr_rooms", "gauge", "Rooms in this process", counts["rooms"]
+    yield "freeguessr_players", "gauge", "Players in all rooms", counts["players"]
+    yield "freeguessr_sockets", "gauge", "Connected player WebSockets", counts["sockets"]
+    yield "freeguessr_spectators", "gauge", "Connected spectator WebSockets", counts["spectators"]
+    yield "freeguessr_rooms_evicted_total", "counter", "Idle rooms evicted", counts["evicted"]
+    yield "freeguessr_scheduler_pending", "gauge", "Deadlines waiting in the scheduler", len(SCHEDULER)
+    fs = fanout.STATS
+    depth = sum(len(c.queue) for room in ROOMS.values() for c in list(room.ws.values()))
+    yield "freeguessr_send_queue_depth", "gauge", "Frames waiting in socket send queues", depth
+    yield "freeguessr_frames_sent_total", "counter", "Frames written to sockets", fs.frames_sent
+    yield "freeguessr_frames_dropped_total", "counter", "Stale timer frames dropped for slow clients", fs.frames_dropped
+    yield "freeguessr_slow_disconnects_total", "counter", "Clients disconnected for a full send queue", fs.slow_disconnects
+    yield "freeguessr_resume_hits_total", "counter", "Reconnects served from the replay buffer", RESUME["hits"]
+    yield "freeguessr_resume_misses_total", "counter", "Reconnects that needed a full state", RESUME["misses"]
+    yield "freeguessr_inbound_throttled_total", "counter", "Messages dropped by per-socket rate limits", \
+        INBOUND["throttled"]
+    yield "freeguessr_inbound_throttled_room_total", "counter", "Messages dropped by per-room rate limits", \
+        INBOUND["throttled_room"]
+    yield "freeguessr_inbound_oversize_total", "counter", "Sockets closed for a frame over WS_MAX_MESSAGE", \
+        INBOUND["oversize"]
+    yield "freeguessr_inbound_invalid_total", "counter", "Frames that were not a valid message", INBOUND["invalid"]
+    yield "freeguessr_inbound_invalid_disconnects_total", "counter", "Sockets closed after an invalid-frame streak", \
+        INBOUND["invalid_disconnects"]
+    yield "freeguessr_quickplay_waiting", "gauge", "Players waiting in the quick-play queue", len(MATCHMAKER)
+    yield "freeguessr_quickplay_placed_total", "counter", "Players placed into rooms by the matchmaker", \
+        MATCHMAKER.placed
+    yield "freeguessr_history_rounds_total", "counter", "Finished rounds added to the history store", HIST.rounds
+    yield "freeguessr_history_bytes_written_total", "counter", "Bytes appended to history segments", HIST.bytes_written
+
+
+metrics.REGISTRY.collectors.append(collect_gauges)
+
+
+def live_counts() -> dict:
+    players = sockets = spectators = 0
+    for room in ROOMS.values():
+        players += len(room.players)
+        sockets += len(room.ws)
+        spectators += len(room.spectators)
+    return {"rooms": len(ROOMS), "players": players, "sockets": sockets, "spectators": spectators,
+            "evicted": EVICTED}
+
+
+# ---- жизненный цикл комнат ----
+# срок жизни пустой комнаты — запись (code, "evict") в общем SCHEDULER,
+# т.е. в той же куче дедлайнов: никаких периодических обходов ROOMS.
+
+EVICTED = 0
+
+
+def room_idle_ttl(room: Room) -> Optional[int]:
+    if room.ws:
+        return None
+    if room.game_status == "lobby":
+        return LOBBY_TTL_SECONDS
+    if room.game_status == "finished":
+        return FINISHED_TTL_SECONDS
+    return None  # идущая игра доиграет сама и получит TTL на финише
+
+
+def schedule_eviction(room: Room):
+    ttl = room_idle_ttl(room)
+    if ttl is None:
+        SCHEDULER.cancel((room.code, "evict"))
+    else:
+        SCHEDULER.call_later(ttl * 1000, (room.code, "evict"), lambda: evict_room(room))
+
+
+async def evict_room(room: Room):
+    global EVICTED
+    async with room.lock:
+        for uid in [uid for uid, c in room.ws.items() if c.closed]:
+            room.ws.pop(uid, None)
+        if ROOMS.get(room.code) is not room or room_idle_ttl(room) is None:
+            return
+        ROOMS.pop(room.code)
+        for conn in room.spectators:
+            conn.close(kick=True)
+        room.spectators.clear()
+        SCHEDULER.cancel((room.code, "phase"))
+        SCHEDULER.cancel((room.code, "flush"))
+        TICKING.pop(room.code, None)
+        EVICTED += 1
+        log_event("drop", room.code)
 
 
 @routes.get("/")
-async def index(_req):
-    return web.Response(text=render_index_html(), content_type="text/html")
+async def index(req):
+    return ASSETS.respond(req, "index.html")
 
 
 @routes.get("/room/{code}")
-async def room_page(_req):
-    return web.Response(text=render_index_html(), content_type="text/html")
+async def room_page(req):
+    return ASSETS.respond(req, "index.html")
 
 
 @routes.get("/static/{name}")
 async def static_files(req):
-    name = req.match_info["name"]
-    path = os.path.join(STATIC_DIR, name)
-    if not os.path.isfile(path):
-        return web.Response(status=404, text="Not found")
-    ctype = "application/javascript" if name.endswith(".js") else "text/plain"
-    return web.FileResponse(path, headers={"Content-Type": ctype})
+    return ASSETS.respond(req, req.match_info["name"])
 
 
 @routes.post("/api/create_room")
@@ -281,9 +941,12 @@ async def api_create_room(req):
     reveal_seconds = safe_int(data.get("reveal_seconds"), REVEAL_SECONDS_DEFAULT)
     region = str(data.get("region") or "WORLD").upper()
     country = str(data.get("country") or "").upper()
+    large = str(data.get("mode") or "") == "large"
 
     if not host_user_id:
         return web.json_response({"ok": False, "error": "host_user_id required"}, status=400)
+    if len(ROOMS) >= MAX_ROOMS:
+        return web.json_response({"ok": False, "error": "too many rooms"}, status=503)
 
     rounds_total = max(1, min(20, rounds_total))
     round_seconds = max(15, min(600, round_seconds))
@@ -293,46 +956,487 @@ async def api_create_room(req):
     if country and country not in COUNTRIES:
         country = ""
 
-    async with LOCK:
-        while True:
-            code = "".join(secrets.choice("ABCDEFGHJKLMNPQRSTUVWXYZ23456789") for _ in range(6))
-            if code not in ROOMS:
-                room = Room(
-                    code=code,
-                    host_user_id=host_user_id,
-                    rounds_total=rounds_total,
-                    round_seconds=round_seconds,
-                    reveal_seconds=reveal_seconds,
-                    region=region,
-                    country=country,
-                )
-                room.players[host_user_id] = Player(user_id=host_user_id, name=name)
-                ROOMS[code] = room
-                break
+    def make_room(code: str) -> Room:
+        room = Room(
+            code=code,
+            host_user_id=host_user_id,
+            rounds_total=rounds_total,
+            round_seconds=round_seconds,
+            reveal_seconds=reveal_seconds,
+            region=region,
+            country=country,
+            large=large,
+            max_players=LARGE_ROOM_MAX_PLAYERS if large else MAX_PLAYERS,
+        )
+        room.add_player(host_user_id, name)
+        return room
+
+    room = await ROOMS.create(make_room)
+    code = room.code
+    log_event("room", code, room_record(room))
+    schedule_eviction(room)
 
     payload = f"{code}:{host_user_id}"
     sig = sign_payload(payload)
 
+    return web.json_response({"ok": True, "code": code, "join_url": join_url(req, code, host_user_id, sig, name),
+                              "sig": sig})
+
+
+def join_url(req, code: str, user_id: str, sig: str, name: str) -> str:
+    # без PUBLIC_BASE_URL — адрес, по которому пришёл сам запрос
     base = (PUBLIC_BASE_URL or f"{req.scheme}://{req.host}").rstrip("/")
-    join_url = f"{base}/room/{code}?user={quote(host_user_id)}&sig={quote(sig)}&name={quote(name)}"
-    return web.json_response({"ok": True, "code": code, "join_url": join_url, "sig": sig})
+    return f"{base}/room/{code}?user={quote(user_id)}&sig={quote(sig)}&name={quote(name)}"
+
+
+# ---- быстрая игра ----
+# /api/quickplay ставит игрока в очередь и держит запрос до матча (long-poll).
+# Полная группа матчится сразу при входе, неполные — в тике раз в секунду,
+# пока кто-то ждёт. Комната создаётся с уже добавленными игроками и сразу
+# уходит в отсчёт; клиент получает подписанную ссылку, как у хоста.
+
+async def place_group(group: List[Ticket]):
+    host = group[0]
+    region, country = host.bucket
+
+    def make_room(code: str) -> Room:
+        room = Room(code=code, host_user_id=host.user_id, region=region, country=country)
+        for t in group:
+            room.add_player(t.user_id, t.name)
+        return room
+
+    if len(ROOMS) >= MAX_ROOMS:
+        result = {"ok": False, "error": "too many rooms"}
+        for t in group:
+            t.result = result
+            wake(t)
+        return
+    room = await ROOMS.create(make_room)
+    code = room.code
+    log_event("room", code, room_record(room))
+    # join_url добавляет api_quickplay по запросу самого игрока (группа может собраться в тике, без запроса)
+    for t in group:
+        t.result = {"ok": True, "code": code, "sig": sign_payload(f"{code}:{t.user_id}"), "players": len(group)}
+        wake(t)
+    async with room.lock:
+        await start_countdown(room, QUICKPLAY_COUNTDOWN_SECONDS)
+    schedule_eviction(room)
+
+
+def wake(t: Ticket):
+    if t.waiter is not None and not t.waiter.done():
+        t.waiter.set_result(None)
+
+
+async def quickplay_tick():
+    for group in MATCHMAKER.due(now_ms()):
+        await place_group(group)
+    if len(MATCHMAKER) or MATCHMAKER.matched:
+        SCHEDULER.call_later(1000, "quickplay", quickplay_tick)
+
+
+@routes.post("/api/quickplay")
+async def api_quickplay(req):
+    # {"user_id", "name", "region", "country"} — встать в очередь; {"ticket"} — ждать дальше;
+    # {"ticket", "cancel": true} — выйти. Ответ: ссылка в комнату или {"ticket", "waiting"} по таймауту
+    try:
+        data = await req.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return web.json_response({"ok": False, "error": "bad json"}, status=400)
+    now = now_ms()
+    ticket_id = str(data.get("ticket") or "")
+    if ticket_id:
+        t = MATCHMAKER.tickets.get(ticket_id)
+        if t is None:
+            return web.json_response({"ok": False, "error": "ticket expired"}, status=404)
+        if data.get("cancel"):
+            MATCHMAKER.cancel(t)
+            wake(t)
+            return web.json_response({"ok": True, "cancelled": True})
+    else:
+        user_id = str(data.get("user_id") or "")
+        if not user_id:
+            return web.json_response({"ok": False, "error": "user_id required"}, status=400)
+        region = str(data.get("region") or "WORLD").upper()
+        country = str(data.get("country") or "").upper()
+        if region not in REGIONS:
+            region = "WORLD"
+        if country and country not in COUNTRIES:
+            country = ""
+        t = MATCHMAKER.enqueue(user_id, str(data.get("name") or "Player")[:32], (region, country), now)
+        for group in MATCHMAKER.ready(t.bucket, now):
+            await place_group(group)
+        if SCHEDULER.pending("quickplay") is None:
+            SCHEDULER.call_later(1000, "quickplay", quickplay_tick)
+
+    t.seen_ms = now
+    if t.result is None and not t.cancelled:
+        wake(t)  # второй опрос того же билета — первый отпускаем
+        fut = t.waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(fut, QUICKPLAY_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if t.waiter is fut:
+                t.waiter = None
+            t.seen_ms = now_ms()
+    if t.result is not None:
+        MATCHMAKER.forget(t)
+        if not t.result["ok"]:
+            return web.json_response(t.result, status=503)
+        return web.json_response({**t.result, "join_url": join_url(req, t.result["code"], t.user_id, t.result["sig"], t.name)})
+    if t.cancelled:
+        return web.json_response({"ok": True, "cancelled": True})
+    return web.json_response({"ok": True, "ticket": t.id, "waiting": MATCHMAKER.position(t)})
+
+
+def timer_frame(room: Room) -> Optional[dict]:
+    cr = room.current_round
+    if not cr or cr.status not in ("running", "reveal"):
+        return None
+    t = now_ms()
+    if cr.status == "running":
+        phase, ends = "guess", cr.ends_at_ms
+    else:
+        phase, ends = "reveal", cr.reveal_ends_at_ms
+    # клиент считает обратный отсчёт сам от ends_at_ms, now_ms — для поправки часов
+    return {"t": "timer", "phase": phase, "ms_left": max(0, ends - t), "ends_at_ms": ends, "now_ms": t}
+
+
+def schedule_phase(room: Room, when_ms: int, fn):
+    # у комнаты одна запись "следующая смена фазы"; новая заменяет старую
+    SCHEDULER.call_at(when_ms, (room.code, "phase"), fn)
+
+
+async def timer_sync():
+    # редкий синхронизирующий тик для активных раундов (и для старых клиентов)
+    for room in list(TICKING.values()):
+        frame = timer_frame(room)
+        if frame is None:
+            TICKING.pop(room.code, None)
+            continue
+        await broadcast(room, frame)
+    if TICKING and TIMER_SYNC_SECONDS > 0:
+        SCHEDULER.call_later(TIMER_SYNC_SECONDS * 1000, "timer_sync", timer_sync)
+
+
+def ensure_timer_sync():
+    if TIMER_SYNC_SECONDS > 0 and SCHEDULER.pending("timer_sync") is None:
+        SCHEDULER.call_later(TIMER_SYNC_SECONDS * 1000, "timer_sync", timer_sync)
+
+
+def pick_seed(room: Room) -> Tuple[float, float, str]:
+    # сначала — проверенная точка из пула (не из недавних раундов), иначе случайная
+    pt = POOL.draw(room.pool_key(), room.recent, RNG)
+    if pt:
+        lat, lng, source = pt[0], pt[1], "pool"
+    else:
+        (lat, lng), source = pick_point(room.bbox(), room.mask_country()), "random"
+    room.recent.append(point_key(lat, lng))
+    return lat, lng, source
+
+
+async def save_pool():
+    if POOL.dirty:
+        data = POOL.dump()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, write_file, POOL_FILE, data)
+        except OSError:
+            POOL.dirty = True
+    SCHEDULER.call_later(POOL_SAVE_SECONDS * 1000, "pool_save", save_pool)
+
+
+# ---- журнал комнат ----
+# каждое изменение — запись [kind, code, ...]; пишутся пачкой раз в ROOM_LOG_FLUSH_MS
+# одним fsync в пуле потоков. Запись добавляется сразу после изменения, без await
+# между ними, поэтому снапшот при компакции согласован с хвостом журнала.
+
+LOG_LOCK = asyncio.Lock()
+
+
+def log_event(kind: str, code: str, *args):
+    if not LOG.active:
+        return
+    LOG.append([kind, code, *args])
+    if SCHEDULER.pending("log_flush") is None:
+        SCHEDULER.call_later(ROOM_LOG_FLUSH_MS, "log_flush", flush_log)
+
+
+async def flush_log():
+    loop = asyncio.get_running_loop()
+    async with LOG_LOCK:
+        try:
+            if LOG.need_compact or LOG.size > ROOM_LOG_COMPACT_MB << 20:
+                # снапшот уже включает всё, что лежит в буфере
+                LOG.buf.clear()
+                await compact_log()
+            else:
+                recs = LOG.take()
+                if recs:
+                    await loop.run_in_executor(None, LOG.write, recs)
+        except OSError:
+            # что дописалось — неизвестно; следующая попытка перепишет файл снапшотом
+            LOG.need_compact = True
+            SCHEDULER.call_later(5000, "log_flush", flush_log)
+
+
+# ---- история раундов ----
+# раунд попадает в HIST.batch сразу после подсчёта (колонки, без await), раз в
+# HISTORY_FLUSH_MS пачка уходит блоком в сегмент из пула потоков.
+
+HIST_LOCK = asyncio.Lock()
+
+
+def record_round(room: Room, cr: Round, dists: List[float], scores: List[int]):
+    if not HISTORY:
+        return
+    cols = room.guesses
+    roster = room.roster
+    players = [roster[i] for i in cols.idx]
+    try:
+        HIST.add_round(room.code, cr.index, room.rounds_total, room.region, room.country, cr.source,
+                       len(room.players), cr.started_at_ms, now_ms(), (cr.seed_lat, cr.seed_lng),
+                       (cr.true_lat, cr.true_lng), [p.user_id for p in players], [p.name for p in players],
+                       cols.lat.tolist(), cols.lng.tolist(), dists, scores)
+    except Exception as e:
+        # зовётся из finish_round до рассылки и таймера reveal: без истории раунд идёт дальше, без reveal — нет
+        print(f"warning: history: round {room.code}/{cr.index} not recorded: {e!r}", flush=True)
+        return
+    if SCHEDULER.pending("history_flush") is None:
+        SCHEDULER.call_later(HISTORY_FLUSH_MS, "history_flush", flush_history)
+
+
+async def flush_history():
+    async with HIST_LOCK:
+        batch = HIST.take()
+        if batch is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, HIST.write, batch)
+        except OSError:
+            # блок потерян (история не критична); следующий начнёт новый сегмент, а не хвост с обрывком
+            HIST.close()
+
+
+@routes.get("/api/history")
+async def api_history(req):
+    # ?room=CODE&from=<ms>&to=<ms>&format=ndjson|csv — поток по блокам сегментов, без загрузки в память
+    # в истории user_id, имена и координаты ответов: без HISTORY_TOKEN экспорт выключен
+    if not HISTORY_TOKEN:
+        raise web.HTTPNotFound()
+    got = req.query.get("token") or req.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(got.encode(), HISTORY_TOKEN.encode()):
+        return web.json_response({"ok": False, "error": "bad token"}, status=403)
+    code = (req.query.get("room") or "").upper()
+    t_from = max(0, safe_int(req.query.get("from"), 0))
+    t_to = max(0, safe_int(req.query.get("to"), 0))
+    fmt = "csv" if req.query.get("format") == "csv" else "ndjson"
+
+    resp = web.StreamResponse(headers={
+        "Content-Type": "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson",
+        "Content-Disposition": f'attachment; filename="history{"-" + code if code else ""}.{fmt}"',
+        "Cache-Control": "no-store",
+    })
+    resp.enable_chunked_encoding()
+    await resp.prepare(req)
+    HIST.exports += 1
+    # разбор блоков и форматирование — в пуле потоков по куску за раз; цикл событий только отдаёт байты
+    loop = asyncio.get_running_loop()
+    it = export_chunks(HIST.segments(), fmt, t_from, t_to, code)
+    while True:
+        got = await loop.run_in_executor(None, next, it, None)
+        if got is None:
+            break
+        chunk, rows = got
+        HIST.exported_rows += rows
+        await resp.write(chunk)
+    await resp.write_eof()
+    return resp
+
+
+def round_record(cr: Round) -> list:
+    return [cr.index, cr.seed_lat, cr.seed_lng, cr.started_at_ms, cr.ends_at_ms,
+            cr.reveal_ends_at_ms, cr.status, cr.true_lat, cr.true_lng, cr.source]
+
+
+def room_record(room: Room) -> dict:
+    cols = room.guesses
+    return {
+        "host": room.host_user_id,
+        "created": room.created_at_ms,
+        "rounds_total": room.rounds_total,
+        "round_seconds": room.round_seconds,
+        "reveal_seconds": room.reveal_seconds,
+        "region": room.region,
+        "country": room.country,
+        "large": room.large,
+        "max_players": room.max_players,
+        "round_number": room.round_number,
+        "game_status": room.game_status,
+        "countdown_ends_at_ms": room.countdown_ends_at_ms,
+        "round": round_record(room.current_round) if room.current_round else None,
+        "players": [[p.user_id, p.name, p.total_score, p.last_distance_km, p.last_score] for p in room.roster],
+        "guesses": [[cols.idx[j], cols.lat[j], cols.lng[j]] for j in range(len(cols))],
+        "recent": [list(k) for k in room.recent],
+    }
+
+
+def snapshot_records() -> List[list]:
+    # снапшот журнала: по записи "room" на комнату; собирается на цикле — согласованный срез
+    return [["room", room.code, room_record(room)] for room in ROOMS.values()]
+
+
+async def compact_log():
+    # json — в CPU-пуле, файл — в потоке ввода-вывода
+    recs = snapshot_records()
+    data = await CPU.run(sum(len(r[2]["players"]) for r in recs), encode_records, recs)
+    await asyncio.get_running_loop().run_in_executor(None, LOG.compact, data)
+
+
+def restore_room(code: str, d: dict) -> Room:
+    room = Room(
+        code=code,
+        host_user_id=d["host"],
+        created_at_ms=d["created"],
+        rounds_total=d["rounds_total"],
+        round_seconds=d["round_seconds"],
+        reveal_seconds=d["reveal_seconds"],
+        region=d["region"],
+        country=d["country"],
+        large=d["large"],
+        max_players=d["max_players"],
+        round_number=d["round_number"],
+        game_status=d["game_status"],
+        countdown_ends_at_ms=d["countdown_ends_at_ms"],
+    )
+    if d["round"]:
+        room.current_round = Round(*d["round"])
+    for uid, name, total, dist, score in d["players"]:
+        p = Player(user_id=uid, name=name, idx=len(room.roster), total_score=total,
+                   last_distance_km=dist, last_score=score)
+        room.players[uid] = p
+        room.roster.append(p)
+    room.board.rebuild([p.total_score for p in room.roster])
+    for i, lat, lng in d["guesses"]:
+        p = room.roster[i]
+        p.guess = (lat, lng)
+        p.has_guessed = True
+        room.guesses.add(i, lat, lng)
+    room.recent.extend(tuple(k) for k in d["recent"])
+    ROOMS.put(room)
+    return room
+
+
+def replay_record(rec: list):
+    kind, code = rec[0], rec[1]
+    if kind == "room":
+        restore_room(code, rec[2])
+        return
+    room = ROOMS.get(code)
+    if room is None:
+        return
+    cr = room.current_round
+
+    if kind == "drop":
+        ROOMS.pop(code)
+    elif kind == "join":
+        uid, name = rec[2], rec[3]
+        p = room.players.get(uid)
+        if p is None:
+            room.add_player(uid, name)
+        else:
+            p.name = name
+            room.touch(p)
+    elif kind == "settings":
+        room.region, room.country = rec[2], rec[3]
+    elif kind == "countdown":
+        room.game_status = "countdown"
+        room.countdown_ends_at_ms = rec[2]
+    elif kind == "round":
+        reset_guesses(room)
+        cr = room.current_round = Round(*rec[2])
+        room.round_number = cr.index
+        room.game_status = "running"
+        room.recent.append(point_key(cr.seed_lat, cr.seed_lng))
+    elif not cr:
+        return
+    elif kind == "pano":
+        cr.true_lat, cr.true_lng = rec[2], rec[3]
+    elif kind == "reroll":
+        cr.seed_lat, cr.seed_lng, cr.source = rec[2], rec[3], rec[4]
+        cr.true_lat, cr.true_lng = None, None
+        room.recent.append(point_key(cr.seed_lat, cr.seed_lng))
+    elif kind == "guess":
+        p = room.players.get(rec[2])
+        if p and not p.has_guessed:
+            p.guess = (rec[3], rec[4])
+            p.has_guessed = True
+            room.guesses.add(p.idx, rec[3], rec[4])
+            room.touch(p)
+    elif kind == "end":
+        cr.status = "reveal"
+        cr.true_lat, cr.true_lng = rec[2], rec[3]
+        apply_scores(room, rec[4], rec[5])
+    elif kind == "ended":
+        cr.status = "ended"
+        if room.round_number >= room.rounds_total:
+            room.game_status = "finished"
+
+
+def resume_room(room: Room):
+    # заново ставим таймеры; просроченные за время простоя сработают сразу
+    cr = room.current_round
+    if room.game_status == "countdown":
+        schedule_phase(room, room.countdown_ends_at_ms, lambda: on_countdown_end(room))
+    elif room.game_status == "running" and cr:
+        if cr.status == "running":
+            schedule_phase(room, cr.ends_at_ms, lambda: on_round_timeout(room, cr))
+        elif cr.status == "reveal":
+            schedule_phase(room, cr.reveal_ends_at_ms, lambda: on_reveal_timeout(room, cr))
+        else:
+            schedule_phase(room, now_ms() + ROUND_GAP_MS, lambda: on_next_round(room, cr))
+        TICKING[room.code] = room
+    schedule_eviction(room)
+
+
+def restore_rooms():
+    t0 = time.perf_counter()
+    n = 0
+    # сотни тысяч мелких объектов подряд: сборщик мусора тут только мешает
+    gc.disable()
+    try:
+        for rec in read_records(ROOM_LOG_FILE):
+            try:
+                replay_record(rec)
+            except (IndexError, KeyError, TypeError, ValueError):
+                continue  # запись старого/чужого формата — пропускаем
+            n += 1
+    finally:
+        gc.enable()
+    for room in ROOMS.values():
+        resume_room(room)
+    ensure_timer_sync()
+    LOG.replayed = n
+    LOG.replay_ms = int((time.perf_counter() - t0) * 1000)
 
 
 async def start_round(room: Room):
     room.round_number += 1
-    lat, lng = pick_point(room.bbox())
+    lat, lng, source = pick_seed(room)
+    if source == "pool":
+        POOL.rounds_pool += 1
+    else:
+        POOL.rounds_random += 1
 
     st = now_ms()
     et = st + room.round_seconds * 1000
     rt = et + room.reveal_seconds * 1000
 
-    for p in room.players.values():
-        p.has_guessed = False
-        p.guess = None
-        p.last_distance_km = None
-        p.last_score = None
-
-    room.current_round = Round(
+    reset_guesses(room)
+    cr = room.current_round = Round(
         index=room.round_number,
         seed_lat=lat,
         seed_lng=lng,
@@ -340,14 +1444,28 @@ async def start_round(room: Room):
         ends_at_ms=et,
         reveal_ends_at_ms=rt,
         status="running",
+        source=source,
     )
     room.game_status = "running"
-    await broadcast(room, {"t": "state", "state": room.public_state()})
+    log_event("round", room.code, round_record(cr))
+    await push_state(room, op_room(room), op_round(room), op_standings(room))
     await broadcast(room, {"t": "toast", "kind": "info", "text": f"Раунд {room.round_number}/{room.rounds_total} начался!"})
+    await broadcast(room, timer_frame(room))
 
-    if room.timer_task and not room.timer_task.done():
-        room.timer_task.cancel()
-    room.timer_task = asyncio.create_task(timer_loop(room))
+    schedule_phase(room, et, lambda: on_round_timeout(room, cr))
+    TICKING[room.code] = room
+    ensure_timer_sync()
+
+
+def reset_guesses(room: Room):
+    for p in room.players.values():
+        p.has_guessed = False
+        p.guess = None
+        p.last_distance_km = None
+        p.last_score = None
+        p.cached = None
+    room.touch()
+    room.guesses.clear()
 
 
 async def start_countdown(room: Room, seconds: int = 5):
@@ -356,22 +1474,69 @@ async def start_countdown(room: Room, seconds: int = 5):
 
     room.game_status = "countdown"
     room.countdown_ends_at_ms = now_ms() + seconds * 1000
+    log_event("countdown", room.code, room.countdown_ends_at_ms)
     await broadcast(room, {"t": "countdown", "ends_at_ms": room.countdown_ends_at_ms})
-    await broadcast(room, {"t": "state", "state": room.public_state()})
+    await push_state(room, op_room(room))
 
-    async def _job():
-        try:
-            while now_ms() < room.countdown_ends_at_ms:
-                await asyncio.sleep(0.1)
-            async with LOCK:
-                if room.game_status == "countdown":
-                    await start_round(room)
-        except asyncio.CancelledError:
+    schedule_phase(room, room.countdown_ends_at_ms, lambda: on_countdown_end(room))
+
+
+async def on_countdown_end(room: Room):
+    async with room.lock:
+        if room.game_status == "countdown":
+            await start_round(room)
+
+
+async def on_round_timeout(room: Room, cr: Round):
+    async with room.lock:
+        if room.current_round is not cr or cr.status != "running":
+            return
+        await finish_round(room)
+        await broadcast(room, {"t": "toast", "kind": "info", "text": "Результаты 👀"})
+        await broadcast(room, timer_frame(room))
+        schedule_phase(room, cr.reveal_ends_at_ms, lambda: on_reveal_timeout(room, cr))
+
+
+async def on_reveal_timeout(room: Room, cr: Round):
+    async with room.lock:
+        if room.current_round is not cr or cr.status != "reveal":
+            return
+        cr.status = "ended"
+        log_event("ended", room.code)
+        await push_state(room, op_round(room))
+
+        if room.round_number >= room.rounds_total:
+            room.game_status = "finished"
+            TICKING.pop(room.code, None)
+            schedule_eviction(room)
+            await broadcast(room, {"t": "toast", "kind": "ok", "text": "Игра завершена 🏁"})
+            await push_state(room, op_room(room))
             return
 
-    if room.countdown_task and not room.countdown_task.done():
-        room.countdown_task.cancel()
-    room.countdown_task = asyncio.create_task(_job())
+        # пауза между раундами
+        schedule_phase(room, now_ms() + ROUND_GAP_MS, lambda: on_next_round(room, cr))
+
+
+async def on_next_round(room: Room, cr: Round):
+    async with room.lock:
+        if room.current_round is cr and cr.status == "ended":
+            await start_round(room)
+
+
+def apply_scores(room: Room, dists, scores):
+    # результаты раунда по колонкам ответов (тот же порядок, что room.guesses)
+    roster = room.roster
+    changes = []
+    for j, i in enumerate(room.guesses.idx):
+        p = roster[i]
+        s = int(scores[j])
+        p.last_distance_km = dists[j]
+        p.last_score = s
+        changes.append((i, p.total_score, p.total_score + s))
+        p.total_score += s
+        p.cached = None
+    room.board.update_many(changes, [p.total_score for p in roster])
+    room.touch()
 
 
 async def finish_round(room: Room):
@@ -381,79 +1546,46 @@ async def finish_round(room: Room):
 
     true_lat = cr.true_lat if cr.true_lat is not None else cr.seed_lat
     true_lng = cr.true_lng if cr.true_lng is not None else cr.seed_lng
-    cr.true_lat, cr.true_lng = true_lat, true_lng
-
-    best_d = None
-    winners: List[str] = []
-    no_guess: List[str] = []
 
-    for uid, p in room.players.items():
-        if not p.has_guessed or not p.guess:
-            no_guess.append(uid)
-            continue
-
-        d = haversine_km((true_lat, true_lng), p.guess)
-        s = score_from_distance_km(d)
-
-        p.last_distance_km = float(d)
-        p.last_score = int(s)
-        p.total_score += s
+    # все ответы — одним пакетом (numpy, если есть), победители — частичным отбором.
+    # Большая комната считается в CPU-пуле, пока раунд ещё running: лок комнаты держим,
+    # а изменения раунда и запись "end" идут после await подряд — компакция журнала
+    # посреди подсчёта видит раунд целиком до или целиком после
+    cols = room.guesses
+    dists, scores, order = await CPU.run(len(cols), score_round, true_lat, true_lng, cols.lat, cols.lng,
+                                         ROUND_TOP_N if room.large else 1)
+    cr.status = "reveal"
+    cr.true_lat, cr.true_lng = true_lat, true_lng
+    apply_scores(room, dists, scores)
+    log_event("end", room.code, true_lat, true_lng, dists, scores)
+    record_round(room, cr, dists, scores)
+    roster = room.roster
 
-        if best_d is None or d < best_d:
-            best_d = d
-            winners = [uid]
-        elif d == best_d:
-            winners.append(uid)
+    best_d = dists[order[0]] if order else None
+    winners = [roster[cols.idx[j]].user_id for j in range(len(cols)) if dists[j] == best_d]
+    no_guess = [uid for uid, p in room.players.items() if not p.has_guessed]
 
-    await broadcast(room, {
+    frame = {
         "t": "round_end",
         "winners": winners,
         "no_guess": no_guess,
-        "best_distance_km": None if best_d is None else float(best_d),
-    })
-    await broadcast(room, {"t": "state", "state": room.public_state()})
-
-
-async def timer_loop(room: Room):
-    try:
-        while True:
-            await asyncio.sleep(0.25)
-            async with LOCK:
-                cr = room.current_round
-                if not cr:
-                    return
-
-                t = now_ms()
-
-                if cr.status == "running":
-                    left = cr.ends_at_ms - t
-                    await broadcast(room, {"t": "timer", "phase": "guess", "ms_left": max(0, left)})
-                    if left <= 0:
-                        cr.status = "reveal"
-                        await finish_round(room)
-                        await broadcast(room, {"t": "toast", "kind": "info", "text": "Результаты 👀"})
-                        await broadcast(room, {"t": "state", "state": room.public_state()})
-
-                elif cr.status == "reveal":
-                    left = cr.reveal_ends_at_ms - t
-                    await broadcast(room, {"t": "timer", "phase": "reveal", "ms_left": max(0, left)})
-                    if left <= 0:
-                        cr.status = "ended"
-                        await broadcast(room, {"t": "state", "state": room.public_state()})
-
-                        if room.round_number >= room.rounds_total:
-                            room.game_status = "finished"
-                            await broadcast(room, {"t": "toast", "kind": "ok", "text": "Игра завершена 🏁"})
-                            await broadcast(room, {"t": "state", "state": room.public_state()})
-                            return
-
-                        await asyncio.sleep(0.75)
-                        await start_round(room)
-                        return
-                else:
-                    return
-    except asyncio.CancelledError:
-        return
+        "best_distance_km": best_d,
+    }
+    if room.large:
+        frame["top"] = [{
+            "user_id": roster[cols.idx[j]].user_id,
+            "name": roster[cols.idx[j]].name,
+            "distance_km": dists[j],
+            "score": scores[j],
+        } for j in order]
+    await broadcast(room, frame)
+    await push_state(room, op_round(room), op_standings(room))
+    if room.large:
+        # таблицу видят только top-N, каждому остальному — его место
+        for uid, conn in room.ws.items():
+            p = room.players.get(uid)
+            if p:
+                send(conn, me_frame(room, p))
 
 
 @routes.get("/ws")
@@ -462,11 +1594,20 @@ async def ws_handler(req):
     user = str(req.query.get("user") or "")
     sig = str(req.query.get("sig") or "")
     name = str(req.query.get("name") or "")
+    proto = PROTO_DELTA if req.query.get("proto") == "2" else PROTO_FULL
+    enc = ENC_NAMES.get(req.query.get("enc") or "json", ENC_JSON)
+    spectate = req.query.get("spectate") == "1"
+    # переподключение: токен из прошлого "session" и номер последнего полученного кадра
+    resume = str(req.query.get("resume") or "")
+    try:
+        last_seq = int(req.query.get("seq") or -1)
+    except ValueError:
+        last_seq = -1
 
-    ws = web.WebSocketResponse(heartbeat=20)
+    ws = web.WebSocketResponse(heartbeat=20, max_msg_size=WS_MAX_MESSAGE)
     await ws.prepare(req)
 
-    if not code or not user:
+    if not code or not (user or spectate):
         await ws_send(ws, {"t": "toast", "kind": "error", "text": "room/user required"})
         await ws.close()
         return ws
@@ -479,108 +1620,305 @@ async def ws_handler(req):
             await ws.close()
             return ws
 
-    async with LOCK:
-        room = ROOMS.get(code)
-        if not room:
+    room = ROOMS.get(code)
+    if not room:
+        await ws_send(ws, {"t": "toast", "kind": "error", "text": "room not found"})
+        await ws.close()
+        return ws
+
+    if spectate:
+        return await spectator_ws(ws, room, enc)
+
+    async with room.lock:
+        if ROOMS.get(code) is not room:
             await ws_send(ws, {"t": "toast", "kind": "error", "text": "room not found"})
             await ws.close()
             return ws
 
-        if user not in room.players and len(room.players) >= MAX_PLAYERS:
+        if user not in room.players and len(room.players) >= room.max_players:
             await ws_send(ws, {"t": "toast", "kind": "error", "text": "room full"})
             await ws.close()
             return ws
 
-        if user not in room.players:
-            room.players[user] = Player(user_id=user, name=name or f"User {user}")
-        else:
-            if name:
-                room.players[user].name = name
-
-        room.ws[user] = ws
-
-    await ws_send(ws, {"t": "state", "state": room.public_state()})
-    await ws_send(ws, {"t": "toast", "kind": "ok", "text": "Подключено ✅"})
-
+        p = room.players.get(user)
+        changed = p is None or (name and p.name != name)
+        if p is None:
+            p = room.add_player(user, name or f"User {user}")
+        elif name:
+            p.name = name
+            room.touch(p)
+        if changed:
+            log_event("join", code, user, p.name)
+        # в большой комнате вход за пределами top-N остальным не виден
+        if changed and (not room.large or room.rank(p) <= STATE_TOP_N):
+            await push_dirty(room, p)
+
+        # токен сверяется до подмены сокета: старое соединение закрывается, только когда новое точно встанет
+        resumed = bool(resume) and proto == PROTO_DELTA and hmac.compare_digest(
+            resume.encode(), room.tokens.get(user, "").encode())
+        conn = Conn(ws, WS_SEND_QUEUE, proto, enc)
+        old = room.ws.get(user)
+        room.ws[user] = conn
+        if old:
+            old.close()
+        SCHEDULER.cancel((room.code, "evict"))
+
+        replayed = None
+        if resume:
+            RESUME["attempts"] += 1
+            if resumed:
+                replayed = replay_missed(room, conn, last_seq)
+            if replayed is None:
+                RESUME["misses"] += 1
+            else:
+                RESUME["hits"] += 1
+                RESUME["frames"] += replayed
+        if replayed is None:
+            send_state(conn, room)
+        if room.large:
+            send(conn, me_frame(room, p))
+        token = room.tokens.get(user)
+        if token is None:
+            token = room.tokens[user] = secrets.token_urlsafe(12)
+        send(conn, {"t": "session", "token": token, "seq": room.seq, "resumed": replayed})
+        if replayed is None:
+            send(conn, {"t": "toast", "kind": "ok", "text": "Подключено ✅"})
+
+    limiter = Limiter(CONN_LIMITS)
+    invalid = 0
+    warned_at = 0.0
     async for msg in ws:
-        if msg.type != WSMsgType.TEXT:
+        if msg.type == WSMsgType.ERROR:
+            # aiohttp уже закрыл сокет; кадр больше WS_MAX_MESSAGE даже не дочитывался
+            if getattr(msg.data, "code", None) == WSCloseCode.MESSAGE_TOO_BIG:
+                INBOUND["oversize"] += 1
+            break
+        if msg.type not in (WSMsgType.TEXT, WSMsgType.BINARY):
             continue
-
+        now = time.monotonic()
+        # лимит на кадры — до разбора: поток мусора не должен стоить json.loads на каждый кадр
+        if WS_RATE_LIMIT and not limiter.allow("frame", now):
+            INBOUND["throttled"] += 1
+            continue
+        # клиент может слать и текст (JSON), и бинарные кадры (enc=mp) — принимаем оба
         try:
-            data = json.loads(msg.data)
+            data = wire.loads(msg.data) if msg.type == WSMsgType.TEXT else wire.unpack(msg.data)
+            if not isinstance(data, dict) or not isinstance(data.get("t"), str):
+                raise ValueError("not a message")
         except Exception:
-            await ws_send(ws, {"t": "toast", "kind": "error", "text": "invalid json"})
+            INBOUND["invalid"] += 1
+            invalid += 1
+            if invalid >= WS_INVALID_STREAK:
+                INBOUND["invalid_disconnects"] += 1
+                await ws.close(code=WSCloseCode.POLICY_VIOLATION, message=b"too many invalid messages")
+                break
+            send(conn, {"t": "toast", "kind": "error", "text": "invalid message"})
             continue
+        invalid = 0
 
-        t = data.get("t")
-
-        async with LOCK:
-            room = ROOMS.get(code)
-            if not room:
+        room = ROOMS.get(code)
+        if not room:
+            continue
+        t = data["t"]
+        if WS_RATE_LIMIT:
+            over = None
+            if not limiter.allow(t, now):
+                over = "throttled"
+            elif not room.limiter.allow(t, now):
+                over = "throttled_room"
+            if over:
+                INBOUND[over] += 1
+                if t == "resync":
+                    # resync не теряем: клиент ждёт снапшот и до него игнорирует патчи
+                    defer_resync(room, user, conn, limiter, now)
+                    continue
+                if now - warned_at > 2.0:
+                    warned_at = now
+                    send(conn, {"t": "toast", "kind": "error", "text": "Слишком часто, подождите"})
                 continue
-            is_host = (room.host_user_id == user)
-            cr = room.current_round
+        t0 = time.perf_counter()
+        async with room.lock:
+            await handle_message(room, user, conn, data)
+        metrics.MESSAGE.child(t if t in MESSAGE_TYPES else "other").observe(time.perf_counter() - t0)
+
+    conn.close()
+    room = ROOMS.get(code)
+    if room:
+        async with room.lock:
+            if room.ws.get(user) is conn:
+                room.ws.pop(user, None)
+                schedule_eviction(room)
+    return ws
 
-            if t == "start_game":
-                if is_host and room.game_status == "lobby":
-                    await start_countdown(room, seconds=5)
 
-            elif t == "set_settings":
-                if not is_host or room.game_status != "lobby":
-                    continue
-                region = str(data.get("region") or room.region).upper()
-                country = str(data.get("country") or room.country).upper()
-                if region in REGIONS:
-                    room.region = region
-                if country == "" or country in COUNTRIES:
-                    room.country = country
-                await broadcast(room, {"t": "state", "state": room.public_state()})
-
-            elif t == "pano_ready":
-                # фиксируем координаты реальной панорамы для честного reveal/scoring
-                if not is_host or not cr or cr.status != "running":
-                    continue
-                if cr.true_lat is None:
-                    cr.true_lat = safe_float(data.get("trueLat"), cr.seed_lat)
-                    cr.true_lng = safe_float(data.get("trueLng"), cr.seed_lng)
-                    await broadcast(room, {"t": "state", "state": room.public_state()})
-
-            elif t == "guess":
-                if not cr or cr.status != "running" or room.game_status != "running":
-                    await ws_send(ws, {"t": "toast", "kind": "error", "text": "Нельзя угадывать сейчас"})
-                    continue
-                lat = safe_float(data.get("lat"), None)
-                lng = safe_float(data.get("lng"), None)
-                if lat is None or lng is None:
-                    continue
-                p = room.players.get(user)
-                if not p or p.has_guessed:
-                    continue
-                p.guess = (lat, lng)
-                p.has_guessed = True
-                await broadcast(room, {"t": "state", "state": room.public_state()})
+def defer_resync(room: Room, user: str, conn: Conn, limiter: Limiter, now: float):
+    # один отложенный state на сокет, когда ведро (сокета и комнаты) снова даст токен;
+    # повторные resync до этого сливаются в него
+    key = (room.code, "resync", user)
+    if SCHEDULER.pending(key) is not None:
+        return
+    delay = max(limiter.wait("resync", now), room.limiter.wait("resync", now))
 
-            elif t == "reroll":
-                if not is_host or not cr or cr.status != "running":
-                    continue
-                lat, lng = pick_point(room.bbox())
-                cr.seed_lat, cr.seed_lng = lat, lng
-                cr.true_lat, cr.true_lng = None, None
-                await broadcast(room, {"t": "toast", "kind": "info", "text": "Место перегенерировано 🔁"})
-                await broadcast(room, {"t": "state", "state": room.public_state()})
+    async def fire():
+        if ROOMS.get(room.code) is not room or room.ws.get(user) is not conn or conn.closed:
+            return
+        now = time.monotonic()
+        if not (limiter.allow("resync", now) and room.limiter.allow("resync", now)):
+            defer_resync(room, user, conn, limiter, now)
+            return
+        async with room.lock:
+            send_state(conn, room)
 
-    async with LOCK:
-        room = ROOMS.get(code)
-        if room:
-            room.ws.pop(user, None)
-    return ws
+    SCHEDULER.call_later(int(delay * 1000) + 1, key, fire)
+
+
+# типы сообщений клиента; всё прочее в метриках — "other" (метка не должна расти от мусора)
+MESSAGE_TYPES = frozenset({"start_game", "resync", "set_settings", "pano_ready", "guess", "reroll"})
+
+
+async def handle_message(room: Room, user: str, conn: Conn, data: dict):
+    # вызывается под room.lock
+    t = data.get("t")
+    is_host = (room.host_user_id == user)
+    cr = room.current_round
+
+    if t == "start_game":
+        if is_host and room.game_status == "lobby":
+            await start_countdown(room, seconds=5)
+
+    elif t == "resync":
+        send_state(conn, room)
+
+    elif t == "set_settings":
+        if not is_host or room.game_status != "lobby":
+            return
+        region = str(data.get("region") or room.region).upper()
+        country = str(data.get("country") or room.country).upper()
+        if region in REGIONS:
+            room.region = region
+        if country == "" or country in COUNTRIES:
+            room.country = country
+        log_event("settings", room.code, room.region, room.country)
+        await push_state(room, op_room(room))
+
+    elif t == "pano_ready":
+        # фиксируем координаты реальной панорамы для честного reveal/scoring
+        if not is_host or not cr or cr.status != "running":
+            return
+        if cr.true_lat is None:
+            lat = safe_float(data.get("trueLat"), None)
+            lng = safe_float(data.get("trueLng"), None)
+            # пул общий для всех комнат и сохраняется на диск: только точка рядом с seed этого раунда
+            if not valid_point(lat, lng) or haversine_km((cr.seed_lat, cr.seed_lng), (lat, lng)) > PANO_MAX_KM:
+                lat = lng = None
+            if lat is not None:
+                POOL.add(lat, lng)
+            cr.true_lat = cr.seed_lat if lat is None else lat
+            cr.true_lng = cr.seed_lng if lng is None else lng
+            log_event("pano", room.code, cr.true_lat, cr.true_lng)
+            await push_state(room, op_round(room))
+
+    elif t == "guess":
+        if not cr or cr.status != "running" or room.game_status != "running":
+            send(conn, {"t": "toast", "kind": "error", "text": "Нельзя угадывать сейчас"})
+            return
+        lat = safe_float(data.get("lat"), None)
+        lng = safe_float(data.get("lng"), None)
+        if not valid_point(lat, lng):
+            return
+        p = room.players.get(user)
+        if not p or p.has_guessed:
+            return
+        p.guess = (lat, lng)
+        p.has_guessed = True
+        room.guesses.add(p.idx, lat, lng)
+        room.touch(p)
+        log_event("guess", room.code, user, lat, lng)
+        if room.large and room.rank(p) > STATE_TOP_N:
+            send(conn, me_frame(room, p))
+        else:
+            await push_dirty(room, p)
+
+    elif t == "reroll":
+        if not is_host or not cr or cr.status != "running":
+            return
+        if cr.source == "pool":
+            POOL.rerolls_pool += 1
+            if cr.true_lat is None:
+                # панорама у этой точки так и не нашлась
+                POOL.discard(cr.seed_lat, cr.seed_lng)
+        else:
+            POOL.rerolls_random += 1
+        cr.seed_lat, cr.seed_lng, cr.source = pick_seed(room)
+        cr.true_lat, cr.true_lng = None, None
+        log_event("reroll", room.code, cr.seed_lat, cr.seed_lng, cr.source)
+        await broadcast(room, {"t": "toast", "kind": "info", "text": "Место перегенерировано 🔁"})
+        await push_state(room, op_round(room))
+
+
+def landmask_areas() -> List[Tuple[List[float], str]]:
+    return [(v["bbox"], "") for v in REGIONS.values()] + [(v["bbox"], k) for k, v in COUNTRIES.items()]
+
+
+async def _on_startup(_app):
+    CPU.start()
+    if LANDMASK is not None:
+        # списки клеток строятся в потоке, цикл не ждёт
+        asyncio.get_running_loop().run_in_executor(None, LANDMASK.warm, landmask_areas())
+        print(f"landmask {LANDMASK_FILE}: res={LANDMASK.res}/deg, {len(LANDMASK.countries)} countries", flush=True)
+    else:
+        print(f"landmask {LANDMASK_FILE} not found, pick_point samples whole bbox", flush=True)
+    POOL.load(POOL_FILE)
+    SCHEDULER.call_later(POOL_SAVE_SECONDS * 1000, "pool_save", save_pool)
+    if ROOM_LOG:
+        try:
+            restore_rooms()
+            # сразу ужимаем журнал до снапшота восстановленных комнат
+            await compact_log()
+        except OSError as e:
+            # DATA_DIR не создать/не прочитать/не записать — работаем без журнала, а не падаем
+            # при старте (и не ужимаем журнал, который не смогли прочитать)
+            LOG.close()
+            print(f"warning: room log {ROOM_LOG_FILE} disabled: {e}", flush=True)
+    SCHEDULER.start()
+
+
+async def _on_cleanup(_app):
+    if POOL.dirty:
+        try:
+            write_file(POOL_FILE, POOL.dump())
+        except OSError:
+            pass
+    if LOG.active:
+        try:
+            LOG.write(LOG.take())
+        except OSError:
+            pass
+        LOG.close()
+    batch = HIST.take()
+    if batch is not None:
+        try:
+            HIST.write(batch)
+        except OSError:
+            pass
+    HIST.close()
+    CPU.shutdown()
 
 
 def create_app() -> web.Application:
     app = web.Application()
     app.add_routes(routes)
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
     return app
 
 
 if __name__ == "__main__":
-    web.run_app(create_app(), host=HOST, port=PORT)
+    if WORKER_SOCKET:
+        web.run_app(create_app(), path=WORKER_SOCKET, print=None)
+    elif WORKERS > 1:
+        import router
+        # общий секрет — чтобы подпись, выданная одним воркером, проверялась любым
+        router.main(HOST, PORT, WORKERS, os.path.join(DATA_DIR, "run"), dict(os.environ, SIGNING_SECRET=SIGNING_SECRET))
+    else:
+        web.run_app(create_app(), host=HOST, port=PORT)
@@ -23,6 +23,8 @@
     user: qs("user") || String(Math.floor(Math.random() * 1e9)),
     name: qs("name") || "",
     sig: qs("sig") || "",
+    enc: qs("enc") === "mp" ? "mp" : "json", // ?enc=mp — бинарные кадры
+    spectate: qs("spectate") === "1", // ?spectate=1 — смотреть без участия
     ws: null,
     server: null,
     timer: { phase: "guess", ms_left: 0 },
@@ -32,10 +34,20 @@
     panoAttempts: 0,
     lastSeedKey: "",
     creating: false,
+    queue: null, // быстрая игра: {ticket, waiting} пока ждём матча
 
     joinCodeInput: roomFromQuery(),
     countdownEndsAt: 0,
     lastRoundEnd: null,
+    resyncPending: false,
+    clockOffset: 0, // серверное время - Date.now()
+    me: null, // большая комната: своё место {rank, total_score, players_total}
+
+    // переподключение: токен и номер последнего кадра из "session"
+    token: "",
+    seq: 0,
+    retries: 0,
+    leaving: false,
   };
 
   function setToast(kind, text) {
@@ -83,6 +95,173 @@
     tick();
   }
 
+  // ======== бинарная кодировка (enc=mp): MessagePack, ключи — номера из MP_KEYS ========
+  // таблица совпадает с wire.KEYS на сервере, порядок менять нельзя
+  const MP_KEYS = [
+    "t", "v", "ops", "op", "state", "code", "host_user_id", "game_status", "countdown_ends_at_ms",
+    "round_number", "region", "country", "rounds_total", "round_seconds", "reveal_seconds",
+    "regions", "countries", "current_round", "large", "players_total", "players", "guesses",
+    "index", "seed_lat", "seed_lng", "started_at_ms", "ends_at_ms", "reveal_ends_at_ms", "status",
+    "true", "lat", "lng", "user_id", "name", "total_score", "has_guessed", "last_distance_km",
+    "last_score", "guess", "distance_km", "score", "phase", "ms_left", "now_ms", "kind", "text",
+    "winners", "no_guess", "best_distance_km", "top", "rank", "total", "trueLat", "trueLng",
+    "seq", "token", "resumed", "spectator"
+  ];
+  const MP_KEY_ID = Object.fromEntries(MP_KEYS.map((k, i) => [k, i]));
+  const utf8dec = new TextDecoder();
+  const utf8enc = new TextEncoder();
+
+  function mpDecode(buf) {
+    const b = new Uint8Array(buf);
+    const dv = new DataView(b.buffer, b.byteOffset, b.byteLength);
+    let i = 0;
+    const str = (n) => { const s = utf8dec.decode(b.subarray(i, i + n)); i += n; return s; };
+    const arr = (n) => { const a = new Array(n); for (let k = 0; k < n; k++) a[k] = read(); return a; };
+    const map = (n) => {
+      const o = {};
+      for (let k = 0; k < n; k++) {
+        const key = read();
+        o[typeof key === "number" ? MP_KEYS[key] : key] = read();
+      }
+      return o;
+    };
+    function read() {
+      const c = b[i++];
+      if (c < 0x80) return c;
+      if (c >= 0xe0) return c - 0x100;
+      if (c >= 0xa0 && c < 0xc0) return str(c & 0x1f);
+      if (c >= 0x90 && c < 0xa0) return arr(c & 0x0f);
+      if (c >= 0x80 && c < 0x90) return map(c & 0x0f);
+      let v;
+      switch (c) {
+        case 0xc0: return null;
+        case 0xc2: return false;
+        case 0xc3: return true;
+        case 0xca: v = dv.getFloat32(i); i += 4; return v;
+        case 0xcb: v = dv.getFloat64(i); i += 8; return v;
+        case 0xcc: return b[i++];
+        case 0xcd: v = dv.getUint16(i); i += 2; return v;
+        case 0xce: v = dv.getUint32(i); i += 4; return v;
+        case 0xcf: v = Number(dv.getBigUint64(i)); i += 8; return v;
+        case 0xd0: v = dv.getInt8(i); i += 1; return v;
+        case 0xd1: v = dv.getInt16(i); i += 2; return v;
+        case 0xd2: v = dv.getInt32(i); i += 4; return v;
+        case 0xd3: v = Number(dv.getBigInt64(i)); i += 8; return v;
+        case 0xd9: return str(b[i++]);
+        case 0xda: v = dv.getUint16(i); i += 2; return str(v);
+        case 0xdb: v = dv.getUint32(i); i += 4; return str(v);
+        case 0xdc: v = dv.getUint16(i); i += 2; return arr(v);
+        case 0xdd: v = dv.getUint32(i); i += 4; return arr(v);
+        case 0xde: v = dv.getUint16(i); i += 2; return map(v);
+        case 0xdf: v = dv.getUint32(i); i += 4; return map(v);
+      }
+      throw new Error("bad msgpack byte " + c);
+    }
+    return read();
+  }
+
+  function mpEncode(obj) {
+    // клиент шлёт только маленькие сообщения — хватает nil/bool/числа/строки/массивы/объекты
+    const out = [];
+    const f64 = new DataView(new ArrayBuffer(8));
+    const len = (n, fix, b16, b32) => {
+      if (n < 16 && fix !== null) out.push(fix | n);
+      else if (n < 0x10000) out.push(b16, n >> 8, n & 0xff);
+      else out.push(b32, (n >>> 24) & 0xff, (n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff);
+    };
+    const str = (s) => {
+      const u = utf8enc.encode(s);
+      if (u.length < 32) out.push(0xa0 | u.length);
+      else if (u.length < 0x100) out.push(0xd9, u.length);
+      else len(u.length, null, 0xda, 0xdb);
+      for (const x of u) out.push(x);
+    };
+    function write(v) {
+      if (v === null || v === undefined) out.push(0xc0);
+      else if (v === true) out.push(0xc3);
+      else if (v === false) out.push(0xc2);
+      else if (typeof v === "number") {
+        if (Number.isInteger(v) && v >= 0 && v < 0x80) out.push(v);
+        else {
+          f64.setFloat64(0, v);
+          out.push(0xcb);
+          for (let k = 0; k < 8; k++) out.push(f64.getUint8(k));
+        }
+      } else if (typeof v === "string") str(v);
+      else if (Array.isArray(v)) { len(v.length, 0x90, 0xdc, 0xdd); v.forEach(write); }
+      else {
+        const ks = Object.keys(v).filter((k) => v[k] !== undefined);
+        len(ks.length, 0x80, 0xde, 0xdf);
+        for (const k of ks) {
+          if (k in MP_KEY_ID) out.push(MP_KEY_ID[k]);
+          else str(k);
+          write(v[k]);
+        }
+      }
+    }
+    write(obj);
+    return new Uint8Array(out);
+  }
+
+  // ======== delta-протокол (proto=2): полный state + патчи с версией ========
+  function upsertPlayer(s, pv) {
+    const i = s.players.findIndex((p) => p.user_id === pv.user_id);
+    if (i >= 0) s.players[i] = pv;
+    else s.players.push(pv);
+  }
+
+  function rebuildStandings(s) {
+    // стабильная сортировка, как sorted() на сервере
+    s.players = s.players
+      .map((p, i) => [p, i])
+      .sort((a, b) => (b[0].total_score - a[0].total_score) || (a[1] - b[1]))
+      .map((x) => x[0]);
+    s.guesses = s.players
+      .filter((p) => p.guess)
+      .map((p) => ({
+        user_id: p.user_id,
+        name: p.name,
+        lat: p.guess[0],
+        lng: p.guess[1],
+        distance_km: p.last_distance_km,
+        score: p.last_score,
+      }));
+  }
+
+  function adoptSnapshot(s) {
+    // в снапшоте координаты ответов лежат в guesses — переносим в игроков
+    const byId = {};
+    (s.guesses || []).forEach((g) => (byId[g.user_id] = [g.lat, g.lng]));
+    (s.players || []).forEach((p) => (p.guess = byId[p.user_id] || null));
+    state.server = s;
+    state.resyncPending = false;
+  }
+
+  function applyPatch(msg) {
+    const s = state.server;
+    if (!s || msg.v !== s.v + 1) {
+      if (!state.resyncPending) {
+        state.resyncPending = true;
+        send({ t: "resync" });
+      }
+      return false;
+    }
+    for (const op of msg.ops) {
+      if (op.op === "room") Object.assign(s, op.v);
+      else if (op.op === "round") s.current_round = op.v;
+      else if (op.op === "player") upsertPlayer(s, op.v);
+      else if (op.op === "players") op.v.forEach((pv) => upsertPlayer(s, pv));
+      else if (op.op === "top") {
+        // большая комната: сервер шлёт только верх таблицы
+        s.players = op.v;
+        s.players_total = op.total;
+      }
+    }
+    s.v = msg.v;
+    rebuildStandings(s);
+    return true;
+  }
+
   function connectWS() {
     if (!state.room) return;
     const proto = location.protocol === "https:" ? "wss" : "ws";
@@ -90,29 +269,46 @@
       `${proto}://${location.host}/ws?room=${encodeURIComponent(state.room)}` +
       `&user=${encodeURIComponent(state.user)}` +
       `&sig=${encodeURIComponent(state.sig)}` +
-      `&name=${encodeURIComponent(state.name)}`;
+      `&name=${encodeURIComponent(state.name)}` +
+      `&proto=2` +
+      (state.enc === "mp" ? "&enc=mp" : "") +
+      (state.spectate ? "&spectate=1" : "") +
+      (state.token ? `&resume=${encodeURIComponent(state.token)}&seq=${state.seq}` : "");
 
     const ws = new WebSocket(url);
+    ws.binaryType = "arraybuffer";
     state.ws = ws;
 
-    ws.onopen = () => setToast("ok", "Подключено ✅");
     ws.onmessage = (ev) => {
       let msg;
       try {
-        msg = JSON.parse(ev.data);
+        msg = typeof ev.data === "string" ? JSON.parse(ev.data) : mpDecode(ev.data);
       } catch (e) {
-        console.error("WS non-JSON:", ev.data);
+        console.error("WS bad frame:", ev.data);
         return;
       }
+      if (msg.seq > state.seq) state.seq = msg.seq;
+
+      if (msg.t === "session") {
+        // после рестарта сервера seq может начаться заново — верим серверу
+        state.token = msg.token;
+        state.seq = msg.seq;
+        state.retries = 0;
+        if (msg.resumed != null) setToast("ok", "Соединение восстановлено ✅");
+      }
 
-      if (msg.t === "state") {
-        state.server = msg.state;
+      if (msg.t === "state" || (msg.t === "patch" && applyPatch(msg))) {
+        if (msg.t === "state") {
+          adoptSnapshot(msg.state);
+          if (msg.state.now_ms) state.clockOffset = msg.state.now_ms - Date.now();
+        }
         if (state.server && state.server.countdown_ends_at_ms) {
           state.countdownEndsAt = state.server.countdown_ends_at_ms;
         }
         render();
       }
       if (msg.t === "timer") {
+        if (msg.now_ms) state.clockOffset = msg.now_ms - Date.now();
         state.timer = { phase: msg.phase, ms_left: msg.ms_left };
         renderTimerOnly();
       }
@@ -123,17 +319,37 @@
         render();
       }
 
+      if (msg.t === "me") {
+        state.me = msg;
+        if (state.server) state.server.players_total = msg.players_total;
+        render();
+      }
+
       if (msg.t === "round_end") {
         state.lastRoundEnd = msg;
         render();
       }
     };
-    ws.onclose = () => setToast("error", "Соединение закрыто 😕");
+    ws.onclose = () => {
+      if (state.ws !== ws || state.leaving) return;
+      if (state.retries >= 8) {
+        setToast("error", "Соединение закрыто 😕");
+        return;
+      }
+      // 0.5, 1, 2, 4… сек; сервер докачает пропущенные кадры по seq
+      const delay = Math.min(10000, 500 * 2 ** state.retries++);
+      setToast("error", "Соединение потеряно, переподключаемся…");
+      setTimeout(connectWS, delay);
+    };
     ws.onerror = () => setToast("error", "WebSocket ошибка");
   }
 
   function send(obj) {
-    if (state.ws && state.ws.readyState === 1) state.ws.send(JSON.stringify(obj));
+    // зритель может только попросить снапшот
+    if (state.spectate && obj.t !== "resync") return;
+    if (state.ws && state.ws.readyState === 1) {
+      state.ws.send(state.enc === "mp" ? mpEncode(obj) : JSON.stringify(obj));
+    }
   }
 
   // ======== красивый “аватар” маркер (инициал + цвет по id) ========
@@ -331,6 +547,16 @@
   }
 
   // ======== UI helpers ========
+  // сервер шлёт только дедлайны; обратный отсчёт считаем локально
+  function tickTimer() {
+    const cr = state.server && state.server.current_round;
+    if (!cr || (cr.status !== "running" && cr.status !== "reveal")) return;
+    const phase = cr.status === "running" ? "guess" : "reveal";
+    const ends = phase === "guess" ? cr.ends_at_ms : cr.reveal_ends_at_ms;
+    state.timer = { phase, ms_left: Math.max(0, ends - (Date.now() + state.clockOffset)) };
+    renderTimerOnly();
+  }
+
   function renderTimerOnly() {
     const timerEl = document.getElementById("timer-box");
     if (timerEl) timerEl.textContent = fmtMs(state.timer.ms_left);
@@ -363,10 +589,11 @@
     const url = new URL(location.origin + `/room/${c}`);
     url.searchParams.set("user", state.user);
     if (state.name) url.searchParams.set("name", state.name);
+    if (state.enc === "mp") url.searchParams.set("enc", "mp");
     location.href = url.toString();
   }
 
-  async function createLobby(region, country) {
+  async function createLobby(region, country, mode) {
     state.creating = true;
     render();
     try {
@@ -378,6 +605,7 @@
           name: state.name || "Host",
           region,
           country,
+          mode,
         }),
       });
 
@@ -401,6 +629,50 @@
     }
   }
 
+  async function quickPlay(region, country) {
+    // long-poll: сервер держит запрос до матча или ~25 с, тогда приходим снова с ticket
+    state.queue = { ticket: "", waiting: 0 };
+    render();
+    let body = { user_id: state.user, name: state.name || "Player", region, country };
+    try {
+      while (state.queue) {
+        const res = await fetch("/api/quickplay", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify(body),
+        });
+        const j = await res.json();
+        if (!state.queue) return;
+        if (!j.ok) throw new Error(j.error || "ошибка");
+        if (j.join_url) {
+          location.href = j.join_url;
+          return;
+        }
+        if (j.cancelled) break;
+        state.queue = { ticket: j.ticket, waiting: j.waiting };
+        body = { ticket: j.ticket };
+        render();
+      }
+    } catch (e) {
+      setToast("error", String(e.message || e));
+    }
+    state.queue = null;
+    render();
+  }
+
+  function cancelQuickPlay() {
+    const q = state.queue;
+    state.queue = null;
+    render();
+    if (q && q.ticket) {
+      fetch("/api/quickplay", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ticket: q.ticket, cancel: true }),
+      }).catch(() => {});
+    }
+  }
+
   function render() {
     clear(el);
 
@@ -409,7 +681,7 @@
     const isHost = server && server.host_user_id === state.user;
     const cr = server && server.current_round;
 
-    const canGuess = server && server.game_status === "running" && cr && cr.status === "running";
+    const canGuess = !state.spectate && server && server.game_status === "running" && cr && cr.status === "running";
 
     // HEADER
     const header = h(
@@ -515,15 +787,36 @@
               h("option", { value: "US" }, "США"),
               h("option", { value: "JP" }, "Япония"),
             ),
+            h("label", { class: "flex items-center gap-2 text-sm text-zinc-300/80" },
+              h("input", { id: "largeChk", type: "checkbox", class: "accent-indigo-500" }),
+              "Большая комната (стрим, тысячи игроков)"
+            ),
             h("button", {
               class: "px-4 py-3 rounded-2xl bg-indigo-600 hover:bg-indigo-500 transition shadow-lg shadow-indigo-600/20 font-semibold",
               onclick: () => {
                 const region = document.getElementById("regionSel").value;
                 const country = document.getElementById("countrySel").value;
-                createLobby(region, country);
+                const mode = document.getElementById("largeChk").checked ? "large" : "";
+                createLobby(region, country, mode);
               },
               disabled: state.creating ? "true" : null,
             }, state.creating ? "Создаём…" : "Создать лобби"),
+            state.queue
+              ? h("div", { class: "flex items-center gap-3" },
+                  h("div", { class: "flex-1 text-sm text-zinc-300/80" },
+                    state.queue.waiting ? `⚡ Ищем соперников… в очереди: ${state.queue.waiting}` : "⚡ Ищем соперников…"),
+                  h("button", {
+                    class: "px-4 py-3 rounded-2xl bg-zinc-800 hover:bg-zinc-700 transition font-semibold",
+                    onclick: cancelQuickPlay,
+                  }, "Отмена"))
+              : h("button", {
+                  class: "px-4 py-3 rounded-2xl bg-amber-600 hover:bg-amber-500 transition shadow-lg shadow-amber-600/20 font-semibold",
+                  onclick: () => {
+                    const region = document.getElementById("regionSel").value;
+                    const country = document.getElementById("countrySel").value;
+                    quickPlay(region, country);
+                  },
+                }, "⚡ Быстрая игра"),
             h("div", { class: "text-xs text-zinc-400/80" }, "Если панорама не найдена, хост автоматически сделает несколько 🔁.")
           )
         ),
@@ -615,7 +908,7 @@
       { class: "rounded-3xl border border-zinc-800/80 bg-zinc-900/35 backdrop-blur overflow-hidden shadow-xl" },
       h("div", { class: "p-4 border-b border-zinc-800/70 flex items-center justify-between" },
         h("div", { class: "font-bold" }, "🎛️ Управление"),
-        h("div", { class: "text-xs text-zinc-300/70" }, isHost ? "Хост" : "Игрок")
+        h("div", { class: "text-xs text-zinc-300/70" }, state.spectate ? "Зритель" : isHost ? "Хост" : "Игрок")
       ),
       h("div", { class: "p-4 flex gap-2 flex-wrap" },
         h("button", {
@@ -636,6 +929,7 @@
         h("button", {
           class: "px-4 py-3 rounded-2xl bg-zinc-800 hover:bg-zinc-700 transition",
           onclick: () => {
+            state.leaving = true;
             try { if (state.ws) state.ws.close(); } catch (e) {}
             location.href = "/";
           },
@@ -704,7 +998,7 @@
       { class: "rounded-3xl border border-zinc-800/80 bg-zinc-900/35 backdrop-blur overflow-hidden shadow-xl" },
       h("div", { class: "p-4 border-b border-zinc-800/70 flex items-center justify-between" },
         h("div", { class: "font-bold" }, "🏆 Лидерборд"),
-        h("div", { class: "text-xs text-zinc-300/70" }, server ? `${server.players.length} игроков` : "")
+        h("div", { class: "text-xs text-zinc-300/70" }, server ? `${server.players_total || server.players.length} игроков` : "")
       ),
       h("div", { class: "p-4 space-y-2" },
         ...(server ? server.players.slice(0, 15).map((p, idx) => {
@@ -724,7 +1018,15 @@
             ),
             h("div", { class: "font-extrabold tabular-nums" }, String(p.total_score))
           );
-        }) : [h("div", { class: "text-sm text-zinc-300/70" }, "Подключаемся…")])
+        }) : [h("div", { class: "text-sm text-zinc-300/70" }, "Подключаемся…")]),
+        ...(server && server.large && state.me && state.me.rank > 15 ? [
+          h("div", {
+            class: "flex items-center justify-between rounded-2xl px-4 py-3 border border-zinc-800/70 bg-zinc-950/20 ring-2 ring-indigo-500/50",
+          },
+            h("div", { class: "font-semibold" }, `#${state.me.rank}  ${state.name || "Вы"}`),
+            h("div", { class: "font-extrabold tabular-nums" }, String(state.me.total_score))
+          ),
+        ] : [])
       )
     );
 
@@ -796,7 +1098,9 @@
     setTimeout(() => {
       if (server && cr) {
         const pano = document.getElementById("pano");
-        if (pano) mountPanorama(pano, cr.seed_lat, cr.seed_lng, isHost);
+        // зрителю точка приходит только на показе результатов
+        if (pano && cr.seed_lat == null) pano.textContent = "👀 Панорама откроется после раунда";
+        else if (pano) mountPanorama(pano, cr.seed_lat, cr.seed_lng, isHost);
       }
       const mm = document.getElementById("minimap");
       if (mm) mountMiniMap(mm, !canGuess);
@@ -820,7 +1124,10 @@
   } catch (e) {}
 
   // connect if room
-  if (state.room && location.pathname.startsWith("/room/")) connectWS();
+  if (state.room && location.pathname.startsWith("/room/")) {
+    connectWS();
+    setInterval(tickTimer, 250);
+  }
 
   render();
 })();
@@ -0,0 +1,75 @@
+"""Собирает data/landmask.bin из GeoJSON со странами (например, Natural Earth
+admin-0 countries, 1:50m или 1:110m). Вместо файла можно дать URL — так
+маска собирается при деплое (render.yaml).
+
+    python tools/build_landmask.py ne_50m_admin_0_countries.geojson
+    python tools/build_landmask.py countries.geojson --res 8 --out data/landmask.bin
+    python tools/build_landmask.py https://.../ne_50m_admin_0_countries.geojson --out build/landmask.bin
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import landmask  # noqa: E402
+
+CODE_PROPS = ("ISO_A2_EH", "ISO_A2", "iso_a2", "ISO2")
+
+
+def feature_code(props: dict, prop: str) -> str:
+    for k in ([prop] if prop else CODE_PROPS):
+        v = str(props.get(k) or "")
+        if len(v) == 2 and v.isalpha():
+            return v.upper()
+    return ""
+
+
+def polygons(geom: dict):
+    if geom["type"] == "Polygon":
+        yield geom["coordinates"]
+    elif geom["type"] == "MultiPolygon":
+        yield from geom["coordinates"]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("geojson")
+    ap.add_argument("--res", type=int, default=4, help="клеток на градус (4 -> 0.25°)")
+    ap.add_argument("--prop", default="", help="свойство с ISO-кодом страны")
+    ap.add_argument("--out", default=os.path.join("data", "landmask.bin"))
+    args = ap.parse_args()
+
+    t0 = time.time()
+    if args.geojson.startswith(("http://", "https://")):
+        with urllib.request.urlopen(args.geojson, timeout=120) as r:
+            fc = json.load(r)
+    else:
+        with open(args.geojson, "r", encoding="utf-8") as f:
+            fc = json.load(f)
+
+    land = set()
+    by_country = {}
+    for feat in fc["features"]:
+        geom = feat.get("geometry")
+        if not geom:
+            continue
+        code = feature_code(feat.get("properties") or {}, args.prop)
+        for rings in polygons(geom):
+            cells = landmask.rasterize_rings(rings, args.res)
+            land.update(cells)
+            if code:
+                by_country.setdefault(code, set()).update(cells)
+
+    countries = sorted(by_country)[:254]
+    data = landmask.build(args.res, countries, land, by_country)
+    landmask.write(args.out, data)
+    print(f"{args.out}: {len(data)} bytes, res={args.res}/deg, land cells={len(land)}, "
+          f"countries={len(countries)}, {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
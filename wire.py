@@ -0,0 +1,228 @@
+import json
+import struct
+from typing import Any, Dict, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson опционален: без него — стандартный json
+    orjson = None
+
+# Кодировки кадров WebSocket (выбираются клиентом через ?enc=):
+#   json — текст, как раньше (по умолчанию); если есть orjson — кодирует он;
+#   mp   — бинарные кадры в формате MessagePack, ключи словарей заменены
+#          номерами из KEYS (однобайтовый fixint вместо строки).
+ENC_JSON = 0
+ENC_MP = 1
+ENC_NAMES = {"json": ENC_JSON, "mp": ENC_MP}
+
+# порядок менять нельзя — только дописывать в конец (клиент держит ту же таблицу)
+KEYS = (
+    "t", "v", "ops", "op", "state", "code", "host_user_id", "game_status",
+    "countdown_ends_at_ms", "round_number", "region", "country", "rounds_total",
+    "round_seconds", "reveal_seconds", "regions", "countries", "current_round",
+    "large", "players_total", "players", "guesses", "index", "seed_lat",
+    "seed_lng", "started_at_ms", "ends_at_ms", "reveal_ends_at_ms", "status",
+    "true", "lat", "lng", "user_id", "name", "total_score", "has_guessed",
+    "last_distance_km", "last_score", "guess", "distance_km", "score", "phase",
+    "ms_left", "now_ms", "kind", "text", "winners", "no_guess",
+    "best_distance_km", "top", "rank", "total", "trueLat", "trueLng",
+    "seq", "token", "resumed", "spectator",
+)
+KEY_ID: Dict[str, int] = {k: i for i, k in enumerate(KEYS)}
+assert len(KEYS) < 0x80  # номер ключа — положительный fixint, один байт
+
+
+def dumps(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# ---- MessagePack (подмножество: nil/bool/int/float64/str/array/map) ----
+
+_H = struct.Struct(">BH")
+_I = struct.Struct(">BI")
+_Q = struct.Struct(">BQ")
+_b = struct.Struct(">Bb")
+_h = struct.Struct(">Bh")
+_i = struct.Struct(">Bi")
+_q = struct.Struct(">Bq")
+_D = struct.Struct(">Bd")
+
+
+def _pack_int(n: int, out: bytearray):
+    if 0 <= n < 0x80:
+        out.append(n)
+    elif -32 <= n < 0:
+        out.append(n & 0xFF)
+    elif n >= 0:
+        if n < 0x100:
+            out.append(0xCC)
+            out.append(n)
+        elif n < 0x10000:
+            out += _H.pack(0xCD, n)
+        elif n < 0x100000000:
+            out += _I.pack(0xCE, n)
+        else:
+            out += _Q.pack(0xCF, n)
+    elif n >= -0x80:
+        out += _b.pack(0xD0, n)
+    elif n >= -0x8000:
+        out += _h.pack(0xD1, n)
+    elif n >= -0x80000000:
+        out += _i.pack(0xD2, n)
+    else:
+        out += _q.pack(0xD3, n)
+
+
+def _pack_str(s: str, out: bytearray):
+    b = s.encode()
+    n = len(b)
+    if n < 32:
+        out.append(0xA0 | n)
+    elif n < 0x100:
+        out.append(0xD9)
+        out.append(n)
+    elif n < 0x10000:
+        out += _H.pack(0xDA, n)
+    else:
+        out += _I.pack(0xDB, n)
+    out += b
+
+
+def _pack(o: Any, out: bytearray):
+    t = type(o)
+    if t is str:
+        _pack_str(o, out)
+    elif t is int:
+        _pack_int(o, out)
+    elif t is float:
+        out += _D.pack(0xCB, o)
+    elif o is None:
+        out.append(0xC0)
+    elif t is bool:
+        out.append(0xC3 if o else 0xC2)
+    elif t is dict:
+        n = len(o)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out += _H.pack(0xDE, n)
+        else:
+            out += _I.pack(0xDF, n)
+        for k, v in o.items():
+            kid = KEY_ID.get(k)
+            if kid is None:
+                _pack_str(k, out)
+            else:
+                out.append(kid)
+            _pack(v, out)
+    elif t is list or t is tuple:
+        n = len(o)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out += _H.pack(0xDC, n)
+        else:
+            out += _I.pack(0xDD, n)
+        for v in o:
+            _pack(v, out)
+    elif isinstance(o, bool):
+        out.append(0xC3 if o else 0xC2)
+    elif isinstance(o, int):
+        _pack_int(int(o), out)
+    elif isinstance(o, float):
+        out += _D.pack(0xCB, float(o))
+    else:
+        raise TypeError(f"cannot pack {t.__name__}")
+
+
+def pack(obj: Any) -> bytes:
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def _unpack(b: bytes, i: int) -> Tuple[Any, int]:
+    c = b[i]
+    i += 1
+    if c < 0x80:
+        return c, i
+    if c >= 0xE0:
+        return c - 0x100, i
+    if 0xA0 <= c < 0xC0:
+        n = c & 0x1F
+        return b[i:i + n].decode(), i + n
+    if 0x90 <= c < 0xA0:
+        return _unpack_array(b, i, c & 0x0F)
+    if 0x80 <= c < 0x90:
+        return _unpack_map(b, i, c & 0x0F)
+    if c == 0xC0:
+        return None, i
+    if c == 0xC2:
+        return False, i
+    if c == 0xC3:
+        return True, i
+    if c == 0xCB:
+        return struct.unpack_from(">d", b, i)[0], i + 8
+    if c == 0xCA:
+        return struct.unpack_from(">f", b, i)[0], i + 4
+    if c in _INTS:
+        fmt, size = _INTS[c]
+        return struct.unpack_from(fmt, b, i)[0], i + size
+    if c in (0xD9, 0xDA, 0xDB):
+        fmt, size = _LENS[c]
+        n = struct.unpack_from(fmt, b, i)[0]
+        i += size
+        return b[i:i + n].decode(), i + n
+    if c in (0xDC, 0xDD):
+        fmt, size = _LENS[c]
+        return _unpack_array(b, i + size, struct.unpack_from(fmt, b, i)[0])
+    if c in (0xDE, 0xDF):
+        fmt, size = _LENS[c]
+        return _unpack_map(b, i + size, struct.unpack_from(fmt, b, i)[0])
+    raise ValueError(f"bad msgpack byte 0x{c:02x}")
+
+
+_INTS = {
+    0xCC: (">B", 1), 0xCD: (">H", 2), 0xCE: (">I", 4), 0xCF: (">Q", 8),
+    0xD0: (">b", 1), 0xD1: (">h", 2), 0xD2: (">i", 4), 0xD3: (">q", 8),
+}
+_LENS = {0xD9: (">B", 1), 0xDA: (">H", 2), 0xDB: (">I", 4),
+         0xDC: (">H", 2), 0xDD: (">I", 4), 0xDE: (">H", 2), 0xDF: (">I", 4)}
+
+
+def _unpack_array(b: bytes, i: int, n: int) -> Tuple[list, int]:
+    out = []
+    for _ in range(n):
+        v, i = _unpack(b, i)
+        out.append(v)
+    return out, i
+
+
+def _unpack_map(b: bytes, i: int, n: int) -> Tuple[dict, int]:
+    out = {}
+    for _ in range(n):
+        k, i = _unpack(b, i)
+        if type(k) is int:
+            k = KEYS[k]
+        v, i = _unpack(b, i)
+        out[k] = v
+    return out, i
+
+
+def unpack(data: bytes) -> Any:
+    obj, i = _unpack(data, 0)
+    if i != len(data):
+        raise ValueError("trailing bytes")
+    return obj
+
+
+def encode_frame(obj: Any, enc: int):
+    return pack(obj) if enc == ENC_MP else dumps(obj)